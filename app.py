@@ -1,9 +1,12 @@
 """
 QUart application WSGI module
 """
+import json
 import os
 
 from brain_conductor import get_quart_app, TracingConfig, LogLevel
+from brain_conductor.agents.llm.router import Backend, RoutingPolicy
+from brain_conductor.session_store import SQLiteSessionStore
 from typing import Literal
 
 try:
@@ -39,6 +42,42 @@ google_measurement_id: str | Literal[False] = os.getenv("GOOGLE_MEASUREMENT_ID",
 coin_market_cap_api_key = get_env_var("COIN_MARKET_CAP_API_KEY")
 hugging_face_access_token = get_env_var("HUGGING_FACE_ACCESS_TOKEN")
 promoted_persona_count = int(get_env_var("PROMOTED_PERSONA_COUNT", default="3"))
+session_grace_period = float(get_env_var("SESSION_GRACE_PERIOD", default="300"))
+session_store_path = get_env_var("SESSION_STORE_PATH", False)
+session_store_ttl = float(get_env_var("SESSION_STORE_TTL", default="3600"))
+openai_requests_per_minute = float(
+    get_env_var("OPENAI_REQUESTS_PER_MINUTE", default="3500")
+)
+openai_tokens_per_minute = float(
+    get_env_var("OPENAI_TOKENS_PER_MINUTE", default="90000")
+)
+rate_limit_directory = get_env_var("RATE_LIMIT_DIRECTORY", False)
+openai_hedge_budget = float(get_env_var("OPENAI_HEDGE_BUDGET", default="0"))
+openai_hedge_percentile = float(get_env_var("OPENAI_HEDGE_PERCENTILE", default="95"))
+retry_budget_seconds = float(get_env_var("RETRY_BUDGET_SECONDS", default="30"))
+inquiry_deadline_seconds = float(get_env_var("INQUIRY_DEADLINE_SECONDS", default="60"))
+llm_backends = [
+    Backend.from_config(config)
+    for config in json.loads(get_env_var("LLM_BACKENDS", default="[]"))
+]
+llm_routing_policy = RoutingPolicy(
+    get_env_var("LLM_ROUTING_POLICY", default="weighted").lower()
+)
+llm_latency_slo = float(get_env_var("LLM_LATENCY_SLO_SECONDS", default="10"))
+simple_chat_completion_model = get_env_var("SIMPLE_CHAT_COMPLETION_MODEL", False)
+complexity_threshold = float(get_env_var("COMPLEXITY_THRESHOLD", default="0.3"))
+response_cache_enabled = (
+    get_env_var("RESPONSE_CACHE_ENABLED", default="false").lower() == "true"
+)
+response_cache_ttl = float(get_env_var("RESPONSE_CACHE_TTL", default="3600"))
+response_cache_items = int(get_env_var("RESPONSE_CACHE_ITEMS", default="1000"))
+response_cache_max_distance = int(
+    get_env_var("RESPONSE_CACHE_MAX_DISTANCE", default="0")
+)
+response_cache_bytes = int(get_env_var("RESPONSE_CACHE_BYTES", default="10000000"))
+speculative_primary = (
+    get_env_var("SPECULATIVE_PRIMARY", default="false").lower() == "true"
+)
 
 tracing_config = TracingConfig(
     enabled=True
@@ -61,4 +100,26 @@ app = get_quart_app(
     hugging_face_access_token=hugging_face_access_token,
     promoted_persona_count=promoted_persona_count,
     tracing_config=tracing_config,
+    session_grace_period=session_grace_period,
+    session_store=SQLiteSessionStore(session_store_path, session_store_ttl)
+    if session_store_path
+    else None,
+    openai_requests_per_minute=openai_requests_per_minute,
+    openai_tokens_per_minute=openai_tokens_per_minute,
+    rate_limit_directory=rate_limit_directory,
+    retry_budget_seconds=retry_budget_seconds,
+    inquiry_deadline_seconds=inquiry_deadline_seconds,
+    openai_hedge_budget=openai_hedge_budget,
+    openai_hedge_percentile=openai_hedge_percentile,
+    llm_backends=llm_backends,
+    llm_routing_policy=llm_routing_policy,
+    llm_latency_slo=llm_latency_slo,
+    simple_chat_completion_model=simple_chat_completion_model,
+    complexity_threshold=complexity_threshold,
+    speculative_primary=speculative_primary,
+    response_cache_enabled=response_cache_enabled,
+    response_cache_ttl=response_cache_ttl,
+    response_cache_items=response_cache_items,
+    response_cache_max_distance=response_cache_max_distance,
+    response_cache_bytes=response_cache_bytes,
 )
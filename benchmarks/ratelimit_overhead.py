@@ -0,0 +1,62 @@
+"""
+Benchmark of the overhead of acquiring rate limiter capacity.
+
+Reports the time per acquire of a worker-local limiter and of a limiter shared
+through a memory-mapped file, with one process and with several processes
+acquiring from the same shared limiter at once. Limits are set high enough that
+acquiring never waits, so only the overhead is measured.
+
+Usage: python benchmarks/ratelimit_overhead.py [--acquires 100000] [--processes 4]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from brain_conductor.ratelimit import RateLimiter
+
+UNLIMITED = 1e12
+
+
+def limiter(path: str | None) -> RateLimiter:
+    rate_limiter = RateLimiter(UNLIMITED, UNLIMITED)
+    if path:
+        rate_limiter.share(path)
+    return rate_limiter
+
+
+def acquire(path: str | None, acquires: int) -> float:
+    rate_limiter = limiter(path)
+    start = time.perf_counter()
+    for _ in range(acquires):
+        rate_limiter.try_acquire(100)
+    elapsed = time.perf_counter() - start
+    rate_limiter.close()
+    return elapsed / acquires
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<40} {seconds * 1e6:>8.2f} µs/acquire")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--acquires", type=int, default=100_000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "limits")
+        report("worker-local", acquire(None, args.acquires))
+        report("shared, 1 process", acquire(path, args.acquires))
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.starmap(acquire, [(path, args.acquires)] * args.processes)
+        report(
+            f"shared, {args.processes} concurrent processes",
+            sum(results) / len(results),
+        )
+
+
+if __name__ == "__main__":
+    main()
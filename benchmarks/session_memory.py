@@ -0,0 +1,91 @@
+"""
+Benchmark of conversation history memory per websocket session.
+
+Creates concurrent sessions with a simulated conversation and reports the memory
+allocated per session for a plain list of (persona, text) tuples and for the
+bounded History store at several memory caps.
+
+Usage: python benchmarks/session_memory.py [--sessions 10000] [--turns 200]
+"""
+import argparse
+import random
+import string
+import tracemalloc
+from typing import Callable
+
+from brain_conductor.history import History, HistoryEntry, USER
+from brain_conductor.inquiries import InquiryManager
+from brain_conductor.personas import PERSONAS
+
+
+def conversation(turns: int, rng: random.Random) -> list[tuple[int, str]]:
+    items = []
+    for turn in range(turns):
+        persona_index = USER if turn % 3 == 0 else rng.randrange(len(PERSONAS))
+        length = 80 if persona_index == USER else rng.randint(300, 900)
+        items.append(
+            (persona_index, "".join(rng.choices(string.ascii_letters, k=length)))
+        )
+    return items
+
+
+def measure(name: str, sessions: int, create: Callable[[], object]) -> None:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = [create() for _ in range(sessions)]
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_session = (after - before) / sessions
+    print(
+        f"{name:<32} {per_session / 1024:>10.1f} KiB/session "
+        f"{(after - before) / 1024 ** 2:>10.1f} MiB total {peak / 1024 ** 2:>10.1f} MiB peak"
+    )
+    del store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Each session gets its own copy of the text as it would when received
+    items = conversation(args.turns, rng)
+    manager = InquiryManager("key", "gpt-3.5-turbo", "text-davinci-003", PERSONAS, [])
+
+    def tuple_list():
+        return [
+            (PERSONAS[index] if index != USER else None, text.encode().decode())
+            for index, text in items
+        ]
+
+    def history(max_bytes: int) -> Callable[[], History]:
+        def create():
+            store = History(max_bytes=max_bytes)
+            for index, text in items:
+                store.append(
+                    HistoryEntry(index, text.encode().decode(), len(text) // 4)
+                )
+            return store
+
+        return create
+
+    def session():
+        icm = manager.__enter__()
+        for index, text in items:
+            icm._history.append(
+                HistoryEntry(index, text.encode().decode(), len(text) // 4)
+            )
+        return icm
+
+    print(f"{args.sessions} sessions, {args.turns} turns per session")
+    measure("list of tuples (unbounded)", args.sessions, tuple_list)
+    measure("History (256 KiB cap)", args.sessions, history(256 * 1024))
+    measure("History (64 KiB cap, default)", args.sessions, history(64 * 1024))
+    measure("History (32 KiB cap)", args.sessions, history(32 * 1024))
+    measure("InquiryContextManager", args.sessions, session)
+
+
+if __name__ == "__main__":
+    main()
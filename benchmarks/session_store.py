@@ -0,0 +1,107 @@
+"""
+Benchmark of session store read and write latency under concurrency.
+
+Runs concurrent clients which each save and then load a session state of
+realistic size, and reports latency percentiles of get and put for the in-memory
+store and the SQLite store. Put latency is the time the event loop is blocked;
+the SQLite store writes in batches on its own thread.
+
+Usage: python benchmarks/session_store.py [--clients 100] [--operations 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import tempfile
+import time
+
+from brain_conductor.session_store import (
+    MemorySessionStore,
+    SessionStore,
+    SQLiteSessionStore,
+)
+
+
+def session_state(rng: random.Random, turns: int) -> dict:
+    history = [
+        [-1, "".join(rng.choices(string.ascii_letters, k=rng.randint(80, 900))), 100]
+        for _ in range(turns)
+    ]
+    return {
+        "version": 1,
+        "seq": turns,
+        "frames": [],
+        "inquiries": {"history": history, "summary": "", "unsummarized_items": 0},
+    }
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)] * 1000
+
+    return f"p50 {at(0.5):>8.3f} ms  p99 {at(0.99):>8.3f} ms  max {at(1):>8.3f} ms"
+
+
+async def client(
+    store: SessionStore,
+    session_id: str,
+    state: dict,
+    operations: int,
+    puts: list[float],
+    gets: list[float],
+) -> None:
+    for _ in range(operations):
+        start = time.perf_counter()
+        store.put(session_id, state)
+        puts.append(time.perf_counter() - start)
+        # Yield so the store's writer runs as it would between websocket messages
+        await asyncio.sleep(0.001)
+        start = time.perf_counter()
+        await store.get(session_id)
+        gets.append(time.perf_counter() - start)
+
+
+async def measure(name: str, store: SessionStore, args: argparse.Namespace) -> None:
+    rng = random.Random(0)
+    state = session_state(rng, args.turns)
+    puts: list[float] = []
+    gets: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(store, f"session-{i}", state, args.operations, puts, gets)
+            for i in range(args.clients)
+        )
+    )
+    await store.close()
+    elapsed = time.perf_counter() - start
+    print(f"{name} ({len(puts) / elapsed:,.0f} put+get/s)")
+    print(f"  put {percentiles(puts)}")
+    print(f"  get {percentiles(gets)}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    print(
+        f"{args.clients} concurrent clients, {args.operations} operations per client, "
+        f"{args.turns} history items per session"
+    )
+    await measure("MemorySessionStore", MemorySessionStore(ttl=300), args)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        await measure("SQLiteSessionStore", SQLiteSessionStore(path, ttl=300), args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--operations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ Quart app factory.
 """
 import asyncio
 import json
+import os
 from json import JSONDecodeError
 from typing import Literal
 from dataclasses import dataclass
@@ -15,8 +16,12 @@ from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExport
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 from quart import Quart, render_template, websocket, Response
 
+from .accounting import TokenAccount, accounting
 from .agents import CryptoAgent, ArtAgent
+from .agents.llm import openai as openai_llm
 from .agents.llm.openai import OpenAI
+from .agents.llm.router import Backend, RoutingPolicy
+from .agents.toolkits import coinmarketcap, hugging_face
 from .agents.toolkits import (
     CoinMarketCap,
     CryptoToolkit,
@@ -25,14 +30,27 @@ from .agents.toolkits import (
     ArtToolKit,
     StableDiffusion,
 )
+from .breaker import BreakerState
+from .cascade import Cascade
 from .chat import (
+    SPECULATOR,
+    InquiryTasks,
     inquire,
     send_experts_message,
     add_messages_to_history,
     send_error_message,
+    send_session_message,
 )
+from .deadline import Deadline
 from .inquiries import InquiryManager
+from .memo import current_tool_memo
+from .metrics import ERRORS, INQUIRIES_IN_FLIGHT, REGISTRY
+from .outbox import Outbox, current_outbox
 from .personas import PERSONAS
+from .response_cache import ResponseCache
+from .retry import RetryBudget, current_retry_budget
+from .session_store import SessionStore
+from .sessions import SessionManager, ChatSession, current_session
 from .utils import TaskManager
 
 LogLevel = Literal[
@@ -65,6 +83,26 @@ def get_quart_app(
     hugging_face_access_token: str,
     promoted_persona_count: int,
     tracing_config: TracingConfig,
+    session_grace_period: float = 300,
+    session_store: SessionStore | None = None,
+    openai_requests_per_minute: float | None = None,
+    openai_tokens_per_minute: float | None = None,
+    rate_limit_directory: str | None = None,
+    retry_budget_seconds: float = 30,
+    inquiry_deadline_seconds: float = 60,
+    openai_hedge_budget: float | None = None,
+    openai_hedge_percentile: float | None = None,
+    llm_backends: list[Backend] | None = None,
+    llm_routing_policy: RoutingPolicy | None = None,
+    llm_latency_slo: float | None = None,
+    simple_chat_completion_model: str | None = None,
+    complexity_threshold: float = 0.3,
+    speculative_primary: bool = False,
+    response_cache_enabled: bool = False,
+    response_cache_ttl: float = 3600,
+    response_cache_items: int = 1000,
+    response_cache_max_distance: int = 0,
+    response_cache_bytes: int = 10_000_000,
 ) -> Quart:
     """
     Quart app factory method
@@ -80,6 +118,56 @@ def get_quart_app(
     :param promoted_persona_count: How many personas to present to the
                                     user upon starting a session.
     :param tracing_config: Configuration for OpenTelemetry tracing.
+    :param session_grace_period: Seconds after a websocket disconnects in which
+                                 a client may resume its chat session.
+    :param session_store: Store for chat session state which allows sessions
+                          to be resumed by other workers or after the grace
+                          period.
+    :param openai_requests_per_minute: Initial OpenAI requests per minute limit
+                                       of the worker. Limits adapt to the rate
+                                       limit headers of OpenAI responses.
+    :param openai_tokens_per_minute: Initial OpenAI tokens per minute limit of
+                                     the worker.
+    :param rate_limit_directory: Directory of the rate limiter state shared by
+                                 the workers on the host. When None, each
+                                 worker limits its own requests.
+    :param retry_budget_seconds: Seconds available for retrying the failed
+                                 downstream requests of an inquiry.
+    :param inquiry_deadline_seconds: Seconds in which an inquiry should be
+                                     answered. Downstream requests are cut off
+                                     and optional stages skipped to meet it.
+    :param openai_hedge_budget: Fraction of the OpenAI requests of each call
+                                site which may be duplicated when slow. 0
+                                disables hedging.
+    :param openai_hedge_percentile: Percentile of the recent latencies of a call
+                                    site after which a request is duplicated.
+    :param llm_backends: OpenAI compatible backends serving the models. Models
+                         without backends are requested from OpenAI.
+    :param llm_routing_policy: Policy for choosing the backend of a request.
+    :param llm_latency_slo: Seconds of latency within which the cheapest
+                            routing policy considers backends.
+    :param simple_chat_completion_model: Faster and cheaper OpenAI model for
+                                         persona replies to simple inquiries.
+                                         None sends all replies to the chat
+                                         completion model.
+    :param complexity_threshold: Estimated complexity between 0 and 1 from
+                                 which inquiries are answered by the chat
+                                 completion model.
+    :param speculative_primary: Start generating the response of a locally
+                                guessed primary persona while the inquiry is
+                                routed. The response is discarded when routing
+                                chooses another persona.
+    :param response_cache_enabled: Cache the responses of personas to the first
+                                   inquiries of sessions.
+    :param response_cache_ttl: Seconds a cached response is used for.
+    :param response_cache_items: Maximum number of cached responses.
+    :param response_cache_max_distance: Maximum number of bits in which the
+                                        SimHash fingerprints of near duplicate
+                                        inquiries differ. 0 only matches
+                                        inquiries which are the same once
+                                        normalized.
+    :param response_cache_bytes: Maximum approximate size in bytes of the
+                                 cached responses.
     :return: Quart app
     """
     resource = Resource(attributes={SERVICE_NAME: tracing_config.service_name})
@@ -96,6 +184,16 @@ def get_quart_app(
 
     app = Quart(name)
     app.logger.setLevel(log_level)
+    if rate_limit_directory:
+        os.makedirs(rate_limit_directory, exist_ok=True)
+        openai_llm.LIMITER.share(os.path.join(rate_limit_directory, "openai"))
+        coinmarketcap.LIMITER.share(os.path.join(rate_limit_directory, "coinmarketcap"))
+    openai_llm.LIMITER.set_limits(openai_requests_per_minute, openai_tokens_per_minute)
+    openai_llm.HEDGER.configure(openai_hedge_budget, openai_hedge_percentile)
+    SPECULATOR.enabled = speculative_primary
+    openai_llm.ROUTER.configure(
+        llm_backends or [], policy=llm_routing_policy, latency_slo=llm_latency_slo
+    )
     agents_ = [
         CryptoAgent(
             CryptoToolkit(CoinMarketCap(coin_market_cap_api_key)), TimeToolKit(Dates())
@@ -109,7 +207,45 @@ def get_quart_app(
         text_model=text_completion_model,
         personas=PERSONAS,
         agents=agents_,
+        cascade=Cascade(simple_chat_completion_model, complexity_threshold),
+        response_cache=ResponseCache(
+            response_cache_enabled,
+            response_cache_ttl,
+            response_cache_items,
+            response_cache_max_distance,
+            response_cache_bytes,
+        ),
+    )
+    sessions = SessionManager(
+        im, grace_period=session_grace_period, store=session_store
     )
+    breakers = [openai_llm.BREAKER, coinmarketcap.BREAKER, hugging_face.BREAKER] + [
+        backend.breaker
+        for backend in openai_llm.ROUTER.backends
+        if backend.api_base and backend.breaker
+    ]
+
+    REGISTRY.collect("sessions", lambda: {"active": len(sessions)})
+    REGISTRY.collect("tasks", lambda: {"in_flight": len(asyncio.all_tasks())})
+    REGISTRY.collect("openai_limiter", openai_llm.LIMITER.stats)
+    REGISTRY.collect("coinmarketcap_limiter", coinmarketcap.LIMITER.stats)
+    REGISTRY.collect(
+        "breaker",
+        lambda: {breaker.name: breaker.stats() for breaker in breakers},
+        label="breaker",
+    )
+    REGISTRY.collect("hedge", openai_llm.HEDGER.stats, label="call_site")
+    REGISTRY.collect("backend", openai_llm.ROUTER.stats, label="backend")
+    REGISTRY.collect("coalescer", openai_llm.COALESCER.stats)
+    REGISTRY.collect("cascade", im.cascade.stats, label="tier")
+    REGISTRY.collect("speculator", SPECULATOR.stats)
+    REGISTRY.collect("response_cache", im.response_cache.stats)
+
+    @app.after_serving
+    async def close_sessions() -> None:
+        """Complete pending session state writes on shutdown"""
+        await sessions.close()
+        await openai_llm.close()
 
     @app.get("/")
     async def index() -> str:
@@ -123,51 +259,151 @@ def get_quart_app(
 
     @app.get("/ping")
     async def ping() -> Response:
-        """Liveness/readiness check endpoint"""
+        """Liveness check endpoint"""
         return Response("PONG", 200, mimetype="text/text")
 
+    @app.get("/ready")
+    async def ready() -> Response:
+        """
+        Readiness check endpoint. The worker stays ready while circuit breakers
+        are open: they are per worker, so failing readiness on them would take
+        every worker out of rotation together during a downstream outage, while
+        the worker can still tell clients to try again later. Open breakers are
+        reported as degraded.
+        """
+        return Response(
+            json.dumps(
+                {
+                    "ready": True,
+                    "degraded": openai_llm.BREAKER.state is BreakerState.OPEN,
+                    "breakers": {breaker.name: breaker.stats() for breaker in breakers},
+                }
+            ),
+            200,
+            mimetype="application/json",
+        )
+
+    @app.get("/metrics")
+    async def metrics() -> Response:
+        """Metrics endpoint in the Prometheus text exposition format"""
+        return Response(REGISTRY.render(), 200, mimetype="text/plain; version=0.0.4")
+
     @app.websocket("/chat")
     async def ws() -> None:
         """
         Quart chat websocket handler
         """
-        with im as icm, TaskManager() as atm:
-            atm.create_task(
-                "send-experts-message", send_experts_message(promoted_persona_count)
-            )
-            with tracer.start_as_current_span("websocket.session"):
-                while True:
+        session = await sessions.resume(websocket.args.get("session_id", ""))
+        resumed = session is not None
+        if session is None:
+            session = sessions.create()
+        try:
+            last_seq = int(websocket.args.get("last_seq", 0))
+        except ValueError:
+            last_seq = 0
+        if resumed:
+            session.catch_up(last_seq)
+        current_session.set(session)
+        outbox = Outbox(websocket.send, session)
+        current_outbox.set(outbox)
+        session.outbox = outbox
+        sessions.attach(session)
+        try:
+            with TaskManager() as atm:
+                await send_session_message(session, resumed, last_seq)
+                atm.create_task("send-frames", outbox.run())
+                if not resumed:
+                    await send_experts_message(promoted_persona_count)
+                with tracer.start_as_current_span("websocket.session") as session_span:
+                    session_span.set_attribute("session.id", session.id)
+                    session_span.set_attribute("session.resumed", resumed)
                     try:
-                        try:
-                            received = await websocket.receive()
-                            message = json.loads(received)
-                            message_type = message["type"]
-                            uid = message.get("id")
-                            if message_type == "reconnect":
-                                history = [
-                                    (item["from"], item["text"])
-                                    for item in message["history"]
-                                ]
-                                await add_messages_to_history(icm, history)
-                            elif message_type == "inquiry":
-                                with tracer.start_as_current_span(
-                                    "websocket.request"
-                                ) as request_span:
-                                    inquiry = message["text"]
-                                    await inquire(uid, inquiry, icm, atm, request_span)
-                            else:
-                                raise ValueError(
-                                    f'Unknown message type "{message_type}"'
-                                )
-                        except (JSONDecodeError, KeyError, ValueError) as e:
-                            app.logger.error(
-                                f"Error parsing websocket message: {received} -- {e}"
-                            )
-                            await send_error_message(
-                                uid, "I could not understand your message"
-                            )
-                    except (asyncio.CancelledError, GeneratorExit):
-                        # Handle disconnect
-                        break
+                        await receive(session)
+                    finally:
+                        for key, value in outbox.stats().items():
+                            session_span.set_attribute(f"outbox.{key}", value)
+                        session_span.set_attribute(
+                            "session.tokens_saved", session.tokens_saved
+                        )
+                        session.icm.usage.record_span(session_span)
+        finally:
+            if session.outbox is outbox:
+                session.outbox = None
+            outbox.close()
+            sessions.detach(session)
+
+    async def receive(session: ChatSession) -> None:
+        """
+        Process the messages received from the chat websocket until it
+        disconnects. Inquiries are processed by tasks of the chat session, so
+        they are answered even if the websocket disconnects.
+        :param session: Chat session of the websocket
+        """
+        icm = session.icm
+        if session.inquiries is None:
+            session.inquiries = InquiryTasks(session.tasks, session.inquiry_lock)
+        inquiries = session.inquiries
+        while True:
+            try:
+                try:
+                    received = await websocket.receive()
+                    message = json.loads(received)
+                    message_type = message["type"]
+                    uid = message.get("id")
+                    if message_type == "reconnect":
+                        history = [
+                            (item["from"], item["text"]) for item in message["history"]
+                        ]
+                        await add_messages_to_history(icm, history)
+                        sessions.save(session)
+                    elif message_type == "inquiry":
+                        inquiries.start(
+                            uid,
+                            process_inquiry(session, uid, message["text"]),
+                            supersede=bool(message.get("supersede")),
+                        )
+                    elif message_type == "cancel":
+                        inquiries.cancel(uid)
+                    else:
+                        raise ValueError(f'Unknown message type "{message_type}"')
+                except (JSONDecodeError, KeyError, ValueError) as e:
+                    app.logger.error(
+                        f"Error parsing websocket message: {received} -- {e}"
+                    )
+                    ERRORS.inc(stage="receive", error=type(e).__name__)
+                    await send_error_message(uid, "I could not understand your message")
+            except (asyncio.CancelledError, GeneratorExit):
+                # Handle disconnect
+                break
+
+    async def process_inquiry(session: ChatSession, uid: str, inquiry: str) -> None:
+        """
+        Process an inquiry received from the chat websocket
+        :param session: Chat session of the websocket
+        :param uid: Unique identifier of the inquiry message
+        :param inquiry: Question to ask
+        """
+        with tracer.start_as_current_span("websocket.request") as request_span:
+            deadline = Deadline(inquiry_deadline_seconds)
+            budget = RetryBudget(retry_budget_seconds)
+            current_retry_budget.set(budget)
+            current_tool_memo.set(session.tool_memo)
+            usage = TokenAccount()
+            INQUIRIES_IN_FLIGHT.inc()
+            try:
+                with accounting(session.icm.usage, usage):
+                    await inquire(
+                        uid, inquiry, session.icm, session.tasks, request_span, deadline
+                    )
+            finally:
+                INQUIRIES_IN_FLIGHT.dec()
+                usage.record_span(request_span)
+                budget.record(request_span)
+                deadline.record(request_span)
+                for breaker in breakers:
+                    request_span.set_attribute(
+                        f"breaker.{breaker.name}", breaker.state.value
+                    )
+                sessions.save(session)
 
     return app
@@ -0,0 +1,293 @@
+"""
+Token and cost accounting of LLM requests
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Literal
+
+from opentelemetry.trace.span import Span
+
+from .metrics import COST, TOKENS, current_persona
+
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "text-davinci-002": (0.02, 0.02),
+    "text-davinci-003": (0.02, 0.02),
+}
+"""
+USD prices per 1,000 prompt and completion tokens by model name. Dated model
+snapshots such as gpt-4-0613 resolve to the longest registered name they start
+with.
+"""
+
+Dimension = Literal["persona", "call_site", "model"]
+DIMENSIONS: tuple[Dimension, ...] = ("persona", "call_site", "model")
+
+
+def register_model_price(model: str, prompt: float, completion: float) -> None:
+    """
+    Register or replace the price of a model
+    :param model: Model name or model name prefix
+    :param prompt: USD per 1,000 prompt tokens
+    :param completion: USD per 1,000 completion tokens
+    """
+    MODEL_PRICES[model] = (prompt, completion)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimate the cost of a request
+    :param model: Model name
+    :param prompt_tokens: Tokens of the prompt
+    :param completion_tokens: Tokens of the completion
+    :return: Estimated cost in USD, 0 for models without a price
+    """
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        prefixes = [name for name in MODEL_PRICES if model.startswith(f"{name}-")]
+        if not prefixes:
+            return 0.0
+        price = MODEL_PRICES[max(prefixes, key=len)]
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1000
+
+
+@dataclass(slots=True)
+class Usage:
+    """Tokens used by LLM requests and their estimated cost"""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    """Estimated cost in USD"""
+    coalesced: int = 0
+    """Requests whose result was shared with an identical request of another
+    caller, which made and accounted for them as well"""
+
+    @property
+    def tokens(self) -> int:
+        """
+        :return: Prompt and completion tokens
+        """
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        coalesced: bool = False,
+    ) -> None:
+        """
+        Add the usage of a request
+        :param prompt_tokens: Tokens of the prompt
+        :param completion_tokens: Tokens of the completion
+        :param cost: Estimated cost in USD
+        :param coalesced: Was the request made by another caller?
+        """
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        self.coalesced += coalesced
+
+    def merge(self, other: "Usage") -> None:
+        """
+        Add the usage of other requests
+        :param other: Usage of the other requests
+        """
+        self.requests += other.requests
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cost += other.cost
+        self.coalesced += other.coalesced
+
+
+class TokenAccount:
+    """
+    Usage of the LLM requests made for a scope, such as a chat session or an
+    inquiry, by persona, call site and model
+    """
+
+    def __init__(self) -> None:
+        self._usage: dict[tuple[str, str, str], Usage] = {}
+
+    def record(
+        self,
+        persona: str,
+        call_site: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        coalesced: bool = False,
+    ) -> None:
+        """
+        Record the usage of a request
+        :param persona: Prompt name of the persona the request was made for, or
+        empty when made for no persona, such as routing
+        :param call_site: Name of the code making the request
+        :param model: Model name
+        :param prompt_tokens: Tokens of the prompt
+        :param completion_tokens: Tokens of the completion
+        :param cost: Estimated cost in USD
+        :param coalesced: Was the request made by another caller?
+        """
+        key = (persona, call_site, model)
+        usage = self._usage.get(key)
+        if usage is None:
+            usage = self._usage[key] = Usage()
+        usage.add(prompt_tokens, completion_tokens, cost, coalesced)
+
+    @property
+    def total(self) -> Usage:
+        """
+        :return: Usage of all the requests
+        """
+        total = Usage()
+        for usage in self._usage.values():
+            total.merge(usage)
+        return total
+
+    def by(self, dimension: Dimension) -> dict[str, Usage]:
+        """
+        :param dimension: Dimension to break the usage down by
+        :return: Usage by persona, call site or model
+        """
+        index = DIMENSIONS.index(dimension)
+        totals: dict[str, Usage] = {}
+        for key, usage in self._usage.items():
+            totals.setdefault(key[index], Usage()).merge(usage)
+        return totals
+
+    def record_span(self, span: Span) -> None:
+        """
+        Record the usage as attributes of a span: the totals, and the tokens and
+        cost by persona and call site
+        :param span: Span
+        """
+        total = self.total
+        span.set_attribute("tokens.requests", total.requests)
+        span.set_attribute("tokens.prompt", total.prompt_tokens)
+        span.set_attribute("tokens.completion", total.completion_tokens)
+        span.set_attribute("tokens.cost_usd", round(total.cost, 6))
+        span.set_attribute("tokens.coalesced", total.coalesced)
+        for dimension in DIMENSIONS[:2]:
+            for name, usage in self.by(dimension).items():
+                prefix = f"tokens.{dimension}.{name or 'none'}"
+                span.set_attribute(f"{prefix}.tokens", usage.tokens)
+                span.set_attribute(f"{prefix}.cost_usd", round(usage.cost, 6))
+
+
+@dataclass(frozen=True, slots=True)
+class UsageRecord:
+    """Usage of a request, as recorded in the metrics and accounts"""
+
+    call_site: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+
+
+current_accounts: ContextVar[tuple[TokenAccount, ...]] = ContextVar(
+    "current_accounts", default=()
+)
+"""Accounts the LLM requests made in the context are recorded in"""
+
+
+@contextmanager
+def accounting(*accounts: TokenAccount) -> Iterator[None]:
+    """
+    Record the usage of the LLM requests made in the context in accounts, in
+    addition to the accounts of the enclosing context
+    :param accounts: Accounts
+    """
+    token = current_accounts.set(current_accounts.get() + accounts)
+    try:
+        yield
+    finally:
+        current_accounts.reset(token)
+
+
+current_records: ContextVar[list[UsageRecord] | None] = ContextVar(
+    "current_records", default=None
+)
+"""Collected usage of the LLM requests made in the context"""
+
+
+@contextmanager
+def collecting(records: list[UsageRecord]) -> Iterator[None]:
+    """
+    Collect the usage of the LLM requests made in the context, so that it can
+    be shared with the callers waiting for the same requests
+    :param records: List the usage is appended to
+    """
+    token = current_records.set(records)
+    try:
+        yield
+    finally:
+        current_records.reset(token)
+
+
+def record_usage(
+    call_site: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cost_per_1k_tokens: float = 0.0,
+) -> None:
+    """
+    Record the usage of a request in the metrics and the current accounts,
+    attributed to the current persona
+    :param call_site: Name of the code making the request
+    :param model: Model name
+    :param prompt_tokens: Tokens of the prompt
+    :param completion_tokens: Tokens of the completion
+    :param cost_per_1k_tokens: USD per 1,000 tokens of the backend serving the
+    request. When 0, the cost is estimated from the price of the model.
+    """
+    if cost_per_1k_tokens:
+        cost = (prompt_tokens + completion_tokens) * cost_per_1k_tokens / 1000
+    else:
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    persona = current_persona.get()
+    labels = {"persona": persona, "call_site": call_site, "model": model}
+    TOKENS.inc(prompt_tokens, kind="prompt", **labels)
+    TOKENS.inc(completion_tokens, kind="completion", **labels)
+    COST.inc(cost, **labels)
+    for account in current_accounts.get():
+        account.record(
+            persona, call_site, model, prompt_tokens, completion_tokens, cost
+        )
+    records = current_records.get()
+    if records is not None:
+        records.append(
+            UsageRecord(call_site, model, prompt_tokens, completion_tokens, cost)
+        )
+
+
+def share_usage(records: Iterable[UsageRecord]) -> None:
+    """
+    Record in the current accounts, attributed to the current persona, the usage
+    of requests made by another caller whose results were shared with this one.
+    The requests are flagged as coalesced and left out of the metrics, which
+    counted them when they were made.
+    :param records: Usage of the requests
+    """
+    persona = current_persona.get()
+    for record in records:
+        for account in current_accounts.get():
+            account.record(
+                persona,
+                record.call_site,
+                record.model,
+                record.prompt_tokens,
+                record.completion_tokens,
+                record.cost,
+                coalesced=True,
+            )
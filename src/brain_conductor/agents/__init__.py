@@ -2,13 +2,24 @@
 Module containing chatbot agent logic
 """
 import abc
+import asyncio
 import logging
-from inspect import getmembers
+import time
 from json import loads
 from json.decoder import JSONDecodeError
 from string import Template
-from typing import List
+from types import MappingProxyType
+from typing import Any, List, Mapping
 from dataclasses import dataclass
+
+from opentelemetry import trace
+
+from ..deadline import Deadline
+from ..errors import DeadlineExceededError
+from ..memo import current_tool_memo
+from ..metrics import ERRORS, STAGE_SECONDS, TOOL_SECONDS, current_persona
+from ..prefetch import Prefetch, current_prefetch
+from ..progress import report
 from .llm.openai import OpenAI
 from .toolkits import ToolResponseType
 from .toolkits.hugging_face.stable_diffusion import AIGeneratedImage
@@ -20,6 +31,9 @@ from .toolkits import (
 
 LOGGER = logging.getLogger("Brain Conductor")
 
+IMAGE_MIN_SECONDS = 20
+"""Seconds which must be left before the deadline to generate an image"""
+
 
 @dataclass
 class AgentResponse:
@@ -35,7 +49,9 @@ class Agent(abc.ABC):
     def __init__(self, tool_kits: List[ToolKit], max_retries: int = 5):
         self._tool_kits = tool_kits
         self._max_retries = max_retries
-        available_methods = self.__build_available_methods_based_on_toolkits()
+        self._tools = self.__build_tool_table(tool_kits, eager=False)
+        self._eager_tools = self.__build_tool_table(tool_kits, eager=True)
+        available_methods = self.__build_available_methods()
         self.toolkit_query_template = Template(
             self.toolkit_query_template.substitute(available_methods=available_methods)
         )
@@ -104,33 +120,139 @@ class Agent(abc.ABC):
     )
 
     @staticmethod
-    def __build_method_description_from_toolkit(toolkit: ToolKit) -> str:
-        description = ""
-        for name, obj in getmembers(toolkit):
-            if isinstance(obj, Tool):
-                description += (
-                    f"{toolkit.prefix}.{name} : "
-                    f"{obj.required} : "
-                    f"{', '.join(obj.args)}\n : "
-                    f"{obj.description}\n\n"
-                )
-        return description
-
-    def __build_available_methods_based_on_toolkits(self) -> str:
+    def __build_tool_table(tool_kits: List[ToolKit], eager: bool) -> Mapping[str, Tool]:
+        tools: dict[str, Tool] = {}
+        for kit in tool_kits:
+            for name, tool in kit.tools().items():
+                if f"{kit.prefix}.{name}" in tools:
+                    raise ValueError(f"Tool registered twice: {kit.prefix}.{name}")
+                if tool.eager == eager:
+                    tools[f"{kit.prefix}.{name}"] = tool
+        return MappingProxyType(tools)
+
+    def __build_available_methods(self) -> str:
         available_methods = ""
-        for kit in self._tool_kits:
-            available_methods += self.__build_method_description_from_toolkit(kit)
+        for name, tool in self._tools.items():
+            available_methods += (
+                f"{name} : "
+                f"{tool.required} : "
+                f"{', '.join(tool.args)}\n : "
+                f"{tool.description}\n\n"
+            )
         return available_methods
 
-    async def process_messages(self, messages: List[dict]) -> AgentResponse:
+    async def process_messages(
+        self, messages: List[dict], deadline: Deadline | None = None
+    ) -> AgentResponse:
         """
-        Process messages and return a response from the agent
+        Process messages and return a response from the agent. Tool calls are
+        limited by the deadline and images are not generated when too little
+        time is left. The toolkits prefetch the data they are likely to need
+        while the tool calls are planned.
         :param messages: List of messages
+        :param deadline: Deadline of the inquiry
         :return: Agent response
         """
+        deadline = deadline or Deadline()
+        prefetch = Prefetch(deadline)
+        token = current_prefetch.set(prefetch)
+        try:
+            inquiry = next(
+                (
+                    message["content"]
+                    for message in reversed(messages)
+                    if message["role"] == "user"
+                ),
+                "",
+            )
+            for toolkit in self._tool_kits:
+                toolkit.prefetch(inquiry)
+            return await self._process_messages(messages, deadline)
+        finally:
+            prefetch.record(trace.get_current_span())
+            prefetch.close()
+            current_prefetch.reset(token)
+
+    @staticmethod
+    async def _call_tool(
+        tool: Tool, key: tuple, args: List[Any], deadline: Deadline
+    ) -> Any:
+        """
+        Call a tool, reusing a fresh enough result of an identical call made
+        earlier in the chat session. Reused data is labeled with its age. The
+        start and end of the call are reported as progress.
+        :param tool: Tool
+        :param key: Toolkit prefix, method and arguments of the call
+        :param args: Arguments
+        :param deadline: Deadline of the inquiry
+        :return: Result
+        """
+        name = f"{key[0]}.{key[1]}"
+        await report("tool-started", tool=name)
+        started = time.monotonic()
+        memo = current_tool_memo.get()
+        age = 0.0
+        try:
+            if memo is None or not tool.max_age:
+                result = await tool(*args, deadline=deadline)
+            else:
+                result, age = await memo.call(
+                    key, tool.max_age, lambda: tool(*args, deadline=deadline)
+                )
+        except Exception as e:
+            ERRORS.inc(stage=name, error=type(e).__name__)
+            await report(
+                "tool-finished",
+                tool=name,
+                seconds=round(time.monotonic() - started, 3),
+                ok=False,
+            )
+            raise
+        seconds = time.monotonic() - started
+        TOOL_SECONDS.observe(seconds, tool=name, persona=current_persona.get())
+        await report(
+            "tool-finished",
+            tool=name,
+            seconds=round(seconds, 3),
+            ok=True,
+            reused=bool(age),
+        )
+        if age and tool.response_type == ToolResponseType.DATA:
+            result = f"(Retrieved {age:.0f} seconds ago) {result}"
+        return result
+
+    async def _call_eager_tools(self, deadline: Deadline) -> str:
+        """
+        Call the eager tools, which are left out of the method catalog
+        :param deadline: Deadline of the inquiry
+        :return: Data retrieved
+        """
+        results = await asyncio.gather(
+            *(
+                self._call_tool(tool, (*name.split("."), ()), [], deadline)
+                for name, tool in self._eager_tools.items()
+            ),
+            return_exceptions=True,
+        )
+        data = ""
+        for name, result in zip(self._eager_tools, results):
+            if isinstance(result, BaseException):
+                LOGGER.warning(f"Eager tool call failed: {name}: {result}")
+            elif result:
+                data += result + "\n"
+        return data
+
+    async def _process_messages(
+        self, messages: List[dict], deadline: Deadline
+    ) -> AgentResponse:
+        known = await self._call_eager_tools(deadline)
         choice_messages = [
             message for message in messages if message["role"] != "system"
         ]
+        if known:
+            choice_messages.append(
+                {"role": "system", "content": f"You already know that:\n{known}"}
+            )
         choice_messages.append(
             {
                 "role": "system",
@@ -138,7 +260,18 @@ class Agent(abc.ABC):
             }
         )
 
-        methods = await self.llm.chat_complete(choice_messages, temperature=1)
+        started = time.monotonic()
+        methods = await deadline.limit(
+            self.llm.chat_complete(
+                choice_messages, temperature=1, call_site="agent-planning"
+            ),
+            "agent-planning",
+        )
+        STAGE_SECONDS.observe(
+            time.monotonic() - started,
+            stage="agent-planning",
+            persona=current_persona.get(),
+        )
         data = ""
         images = []
         try:
@@ -147,46 +280,81 @@ class Agent(abc.ABC):
         except JSONDecodeError:
             LOGGER.error(f"Failed to parse methods from: {methods}")
             loaded_methods = []
+        await report(
+            "plan-ready",
+            tools=[
+                str(item.get("method"))
+                for item in loaded_methods
+                if isinstance(item, dict)
+            ],
+            seconds=round(time.monotonic() - started, 3),
+        )
 
+        planned = set()
         for item in loaded_methods:
             try:
                 prefix, method = item["method"].split(".")
             except (ValueError, KeyError):
                 LOGGER.error(f"Failed to split on method: {item['method']}")
                 continue
+            args = item.get("args") or []
+            call = (prefix, method, tuple(str(arg) for arg in args))
+            if call in planned:
+                LOGGER.info(f"Skipping duplicate call: {prefix}.{method}")
+                continue
+            planned.add(call)
+
+            to_call = self._tools.get(f"{prefix}.{method}")
+            if to_call is None:
+                LOGGER.error(f"Unknown method: {prefix}.{method}")
+                continue
+            if to_call.response_type == ToolResponseType.IMAGE and not deadline.allows(
+                "image", IMAGE_MIN_SECONDS
+            ):
+                LOGGER.info(f"Skipping {prefix}.{method} near the deadline")
+                data += (
+                    "You did not have time to generate an image. "
+                    "Let the user know of this."
+                )
+                continue
+            LOGGER.info(f"Retrieving: {prefix}.{method}")
+            pending = self._call_tool(to_call, call, args, deadline)
 
             pending_data = []
             pending_images = []
-            for toolkit in self._tool_kits:
-                if toolkit.prefix == prefix and hasattr(toolkit, method):
-                    LOGGER.info(f"Retrieving: {prefix}.{method}")
-                    to_call = getattr(toolkit, method)
-                    if item.get("args"):
-                        pending = to_call(*item["args"])
+            if to_call.response_type == ToolResponseType.DATA:
+                pending_data.append(pending)
+            elif to_call.response_type == ToolResponseType.IMAGE:
+                pending_images.append(pending)
+            try:
+                for tool_call in pending_data:
+                    try:
+                        data += await tool_call + "\n" if tool_call else ""
+                    except DeadlineExceededError as e:
+                        LOGGER.warning(f"Tool call abandoned: {e}")
+                for tool_call in pending_images:
+                    try:
+                        image: AIGeneratedImage | None = await tool_call
+                    except DeadlineExceededError as e:
+                        LOGGER.warning(f"Tool call abandoned: {e}")
+                        image = None
+                    if image:
+                        images.append(image.encoded_image)
+                        data += (
+                            f"You have generated an image with the following description:\n "
+                            f"{image.image_generation_prompt}\n\nNote that this"
+                            f"description was made by you based on the user's previous input."
+                            f"They did not give this exact request"
+                        )
                     else:
-                        pending = to_call()
-
-                    if to_call.response_type == ToolResponseType.DATA:
-                        pending_data.append(pending)
-                    elif to_call.response_type == ToolResponseType.IMAGE:
-                        pending_images.append(pending)
-            for response in pending_data:
-                data += await response + "\n" if response else ""
-            for response in pending_images:
-                image: AIGeneratedImage = await response
-                if image:
-                    images.append(image.encoded_image)
-                    data += (
-                        f"You have generated an image with the following description:\n "
-                        f"{image.image_generation_prompt}\n\nNote that this"
-                        f"description was made by you based on the user's previous input."
-                        f"They did not give this exact request"
-                    )
-                else:
-                    data += (
-                        "You tried to generate an image but experienced technical difficulties."
-                        "Let the user know of this."
-                    )
+                        data += (
+                            "You tried to generate an image but experienced technical difficulties."
+                            "Let the user know of this."
+                        )
+            finally:
+                # Close the tool calls left unawaited when cancelled
+                for pending in pending_data + pending_images:
+                    pending.close()
             LOGGER.debug(f"Retrieved Data: {data}")
         if not data:
             data = (
@@ -195,10 +363,16 @@ class Agent(abc.ABC):
             )
         message = {
             "role": "system",
-            "content": self.response_template.substitute(data=data),
+            "content": self.response_template.substitute(data=known + data),
         }
 
-        response = await self.llm.chat_complete(messages + [message])
+        with STAGE_SECONDS.time(stage="agent-response", persona=current_persona.get()):
+            response = await deadline.limit(
+                self.llm.chat_complete(
+                    messages + [message], call_site="agent-response"
+                ),
+                "agent-response",
+            )
         return AgentResponse(response=response, images=images)
 
 
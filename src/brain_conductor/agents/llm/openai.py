@@ -1,14 +1,273 @@
 """OpenAI LLM module"""
+import asyncio
 import logging
+import time
 from typing import List
+import aiohttp
 import openai
-import backoff
+import yarl
+from openai.openai_object import OpenAIObject
+from ...accounting import UsageRecord, collecting, record_usage, share_usage
+from ...breaker import CircuitBreaker, Failure, classify_error
+from ...coalesce import SingleFlight, request_key
 from ...errors import RecoverableError, RateLimitError
+from ...hedge import Hedger
+from ...metrics import COMPLETION_SECONDS, ERRORS
+from ...ratelimit import RateLimiter
+from ...retry import retry
+from ...tokens import get_ledger
 from . import LLM
+from .router import Backend, Router
 
 
 LOGGER = logging.getLogger("Brain Conductor")
 
+LIMITER = RateLimiter(requests_per_minute=3500, tokens_per_minute=90_000)
+"""Rate limiter shared by all OpenAI requests of the worker"""
+
+QUOTA_EXCEEDED_SECONDS = 300
+"""Seconds to stop requests after OpenAI reports the quota is exceeded"""
+
+TEXT_COMPLETION_TOKENS = 16
+"""Default maximum tokens of a text completion"""
+
+
+def classify_openai_error(error: BaseException) -> Failure | None:
+    """
+    Classify the error of an OpenAI request for the circuit breaker
+    :param error: Error raised by the request
+    :return: Kind of failure or None when the error does not indicate a failure
+    of OpenAI
+    """
+    if isinstance(error, openai.error.RateLimitError):
+        if "quota" in error.user_message:
+            return Failure.QUOTA
+        if "overloaded" in error.user_message:
+            return Failure.OVERLOAD
+        return None
+    if isinstance(
+        error,
+        (
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+            openai.error.ServiceUnavailableError,
+        ),
+    ):
+        return Failure.OVERLOAD
+    if isinstance(error, openai.error.APIError):
+        return Failure.OVERLOAD if (error.http_status or 0) >= 500 else None
+    return classify_error(error)
+
+
+BREAKER = CircuitBreaker(
+    "openai",
+    open_seconds=30,
+    quota_open_seconds=QUOTA_EXCEEDED_SECONDS,
+    classify=classify_openai_error,
+)
+"""Circuit breaker of all OpenAI requests of the worker"""
+
+ROUTER = Router(default_breaker=BREAKER, classify=classify_openai_error)
+"""Router of OpenAI requests to the configured backends of the requested models"""
+
+HEDGER = Hedger()
+"""Hedging of slow OpenAI requests of the worker. It is disabled by default."""
+
+COALESCER = SingleFlight()
+"""Sharing of identical concurrent OpenAI requests of the worker's sessions"""
+
+_session: tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession] | None = None
+
+
+async def _on_request_end(
+    session: aiohttp.ClientSession,
+    context,
+    params: aiohttp.TraceRequestEndParams,
+) -> None:
+    # Other backends' rate limits are not OpenAI's
+    if params.url.host == yarl.URL(openai.api_base).host:
+        LIMITER.update(params.response.headers)
+
+
+def _client_session() -> aiohttp.ClientSession:
+    """
+    Get the HTTP session for OpenAI requests, which reuses connections and
+    feeds the rate limit headers of responses to the rate limiter
+    """
+    global _session
+    loop = asyncio.get_running_loop()
+    if _session is None or _session[0] is not loop or _session[1].closed:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(_on_request_end)  # type:ignore
+        _session = (loop, aiohttp.ClientSession(trace_configs=[trace_config]))
+    return _session[1]
+
+
+async def close() -> None:
+    """Close the HTTP session for OpenAI requests"""
+    global _session
+    if _session is not None:
+        await _session[1].close()
+        _session = None
+
+
+async def create_completion(
+    resource: type[openai.ChatCompletion] | type[openai.Completion],
+    estimated_tokens: int,
+    call_site: str = "default",
+    **params,
+) -> OpenAIObject:
+    """
+    Create a completion once the worker's rate limits allow it. All OpenAI
+    requests should be made through this function.
+
+    When OpenAI reports the quota is exceeded or keeps failing, requests fail
+    without being made until the circuit breaker probes that it has recovered.
+    Slow requests are hedged when hedging is enabled. Concurrent requests with
+    identical parameters, such as the same question asked in many sessions, share
+    a single request.
+    :param resource: OpenAI completion resource
+    :param estimated_tokens: Estimate of the prompt and completion tokens
+    :param call_site: Name of the code making the request, which groups the
+    latencies that hedging is based on
+    :param params: Parameters of the completion request
+    :return: Completion
+    :raises QuotaExceededError: When the quota has been reported exceeded
+    :raises CircuitOpenError: When OpenAI has been failing
+    """
+
+    async def request() -> tuple[OpenAIObject, list[UsageRecord]]:
+        records: list[UsageRecord] = []
+        with collecting(records):
+            completion = await HEDGER.run(
+                call_site,
+                lambda: _create_completion(
+                    resource, estimated_tokens, call_site, **params
+                ),
+            )
+        return completion, records
+
+    # Callers sharing the completion account for its usage too
+    completion, _ = await COALESCER.run(
+        request_key(id(resource), params),
+        request,
+        lambda result: share_usage(result[1]),
+    )
+    return completion
+
+
+async def _create_completion(
+    resource: type[openai.ChatCompletion] | type[openai.Completion],
+    estimated_tokens: int,
+    call_site: str,
+    **params,
+) -> OpenAIObject:
+    backend = ROUTER.select(params.get("model", ""))
+    if backend.model:
+        params["model"] = backend.model
+    if backend.api_base:
+        params["api_base"] = backend.api_base
+        params["api_key"] = backend.api_key or openai.api_key
+        with (backend.breaker or BREAKER).guard():
+            return await _request_backend(resource, backend, call_site, **params)
+    with BREAKER.guard():
+        await LIMITER.acquire(estimated_tokens)
+        try:
+            completion = await _request_backend(resource, backend, call_site, **params)
+        except openai.error.RateLimitError as e:
+            if "quota" in e.user_message:
+                LIMITER.exceed_quota(QUOTA_EXCEEDED_SECONDS)
+            elif "retry-after" not in e.headers:
+                LIMITER.pause(1)
+            raise
+    if completion and "usage" in completion:
+        LIMITER.settle(estimated_tokens, completion.usage.total_tokens)
+    return completion
+
+
+async def _request_backend(
+    resource: type[openai.ChatCompletion] | type[openai.Completion],
+    backend: Backend,
+    call_site: str,
+    **params,
+) -> OpenAIObject:
+    session = openai.aiosession.set(_client_session())
+    start = time.monotonic()
+    try:
+        completion = await resource.acreate(**params)
+    except Exception as e:
+        # Any error counts against the backend's routing, such as a client error
+        # of a misconfigured backend, even when it does not trip its breaker
+        ROUTER.record(backend, time.monotonic() - start, True)
+        ERRORS.inc(stage=call_site, error=type(e).__name__)
+        raise
+    finally:
+        openai.aiosession.reset(session)
+    seconds = time.monotonic() - start
+    ROUTER.record(backend, seconds, False)
+    model = params.get("model", "")
+    COMPLETION_SECONDS.observe(seconds, call_site=call_site, model=model)
+    if completion and "usage" in completion:
+        record_usage(
+            call_site,
+            model,
+            completion.usage.get("prompt_tokens", 0),
+            completion.usage.get("completion_tokens", 0),
+            backend.cost_per_1k_tokens,
+        )
+    return completion
+
+
+async def create_chat_completion(
+    model: str, messages: List[dict], call_site: str = "chat", **params
+) -> OpenAIObject:
+    """
+    Create a chat completion once the worker's rate limits allow it
+    :param model: Chat completion model
+    :param messages: Prompt messages
+    :param call_site: Name of the code making the request
+    :param params: Additional parameters of the completion request
+    :return: Chat completion
+    """
+    ledger = get_ledger(model)
+    estimated_tokens = (
+        sum(ledger.count_message(message) for message in messages)
+        + ledger.REPLY_OVERHEAD
+        + params.get("max_tokens", ledger.completion_tokens)
+    )
+    return await create_completion(
+        openai.ChatCompletion,
+        estimated_tokens,
+        call_site,
+        model=model,
+        messages=messages,
+        **params,
+    )
+
+
+async def create_text_completion(
+    model: str, prompt: str, call_site: str = "text", **params
+) -> OpenAIObject:
+    """
+    Create a text completion once the worker's rate limits allow it
+    :param model: Text completion model
+    :param prompt: Prompt text
+    :param call_site: Name of the code making the request
+    :param params: Additional parameters of the completion request
+    :return: Text completion
+    """
+    estimated_tokens = get_ledger(model).count(prompt) + params.get(
+        "max_tokens", TEXT_COMPLETION_TOKENS
+    )
+    return await create_completion(
+        openai.Completion,
+        estimated_tokens,
+        call_site,
+        model=model,
+        prompt=prompt,
+        **params,
+    )
+
 
 class OpenAI(LLM):
     """OpenAI LLM implementation"""
@@ -20,11 +279,11 @@ class OpenAI(LLM):
     ):
         super().__init__(chat_completion_model, text_completion_model)
 
-    @backoff.on_exception(backoff.expo, RecoverableError)
+    @retry(RecoverableError)
     async def chat_complete(self, messages: List[dict], **kwargs) -> str:
         try:
-            response = await openai.ChatCompletion.acreate(
-                model=self.chat_completion_model, messages=messages, **kwargs
+            response = await create_chat_completion(
+                self.chat_completion_model, messages, **kwargs
             )
         except openai.error.RateLimitError as e:
             LOGGER.debug(f"Chat complete rate limited: {e}")
@@ -32,11 +291,11 @@ class OpenAI(LLM):
 
         return response.choices[0].message.content
 
-    @backoff.on_exception(backoff.expo, RecoverableError)
+    @retry(RecoverableError)
     async def text_complete(self, prompt: str, **kwargs) -> str:
         try:
-            response = await openai.Completion.acreate(
-                model=self.text_completion_model, prompt=prompt, **kwargs
+            response = await create_text_completion(
+                self.text_completion_model, prompt, **kwargs
             )
         except openai.error.RateLimitError as e:
             LOGGER.debug(f"Text complete rate limited: {e}")
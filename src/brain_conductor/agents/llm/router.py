@@ -0,0 +1,245 @@
+"""
+Routing of LLM requests between OpenAI compatible backends
+"""
+import random
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterable
+
+from ...breaker import CircuitBreaker, Failure, classify_error
+
+
+class RoutingPolicy(Enum):
+    """Policy for choosing the backend of a request"""
+
+    WEIGHTED = "weighted"
+    """Random healthy backend in proportion to the backend weights"""
+    FASTEST = "fastest"
+    """Healthy backend with the lowest recent latency, given its error rate"""
+    CHEAPEST = "cheapest"
+    """Cheapest healthy backend whose recent latency is within the SLO"""
+
+
+@dataclass
+class Backend:
+    """
+    OpenAI compatible endpoint serving a model. Backends with an API base URL
+    have their own circuit breaker. The others are OpenAI itself and share the
+    router's default circuit breaker.
+    """
+
+    name: str
+    route: str
+    """Model name requested by callers which the backend serves"""
+    model: str
+    """Model name sent to the backend"""
+    api_base: str | None = None
+    api_key: str | None = None
+    weight: float = 1.0
+    cost_per_1k_tokens: float = 0.0
+    breaker: CircuitBreaker | None = None
+    latency: float | None = None
+    """Exponentially weighted moving average of the latency in seconds"""
+    error_rate: float = 0.0
+    """Exponentially weighted moving average of the share of failed requests"""
+    requests: int = 0
+    errors: int = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Backend":
+        """
+        Create a backend from configuration
+        :param config: Mapping with the name, route, model, and optionally the
+        api_base, api_key, weight, and cost_per_1k_tokens of the backend
+        :return: Backend
+        """
+        return cls(
+            name=config["name"],
+            route=config["route"],
+            model=config.get("model", config["route"]),
+            api_base=config.get("api_base"),
+            api_key=config.get("api_key"),
+            weight=float(config.get("weight", 1.0)),
+            cost_per_1k_tokens=float(config.get("cost_per_1k_tokens", 0.0)),
+        )
+
+    @property
+    def healthy(self) -> bool:
+        """
+        :return: Would the circuit breaker of the backend allow a request?
+        """
+        return self.breaker is None or self.breaker.available
+
+    @property
+    def reliability(self) -> float:
+        """
+        :return: Recent share of successful requests, at least 0.1 so the
+        backend is not ruled out
+        """
+        return max(1 - self.error_rate, 0.1)
+
+    def stats(self) -> dict[str, float | str]:
+        """
+        :return: Metrics of the backend
+        """
+        return {
+            "route": self.route,
+            "model": self.model,
+            "latency": self.latency or 0.0,
+            "error_rate": self.error_rate,
+            "requests": self.requests,
+            "errors": self.errors,
+            "healthy": float(self.healthy),
+        }
+
+
+class Router:
+    """
+    Registry of the LLM backends by the model name callers request. A request
+    for a model without backends is sent to OpenAI. Otherwise, the router tracks
+    the latency and error rate of each backend and picks one per request
+    according to its policy among the backends whose circuit breakers are closed.
+    Failing backends are chosen less often in proportion to their error rate.
+    """
+
+    def __init__(
+        self,
+        default_breaker: CircuitBreaker | None = None,
+        backends: Iterable[Backend] = (),
+        policy: RoutingPolicy = RoutingPolicy.WEIGHTED,
+        latency_slo: float = 10.0,
+        smoothing: float = 0.2,
+        exploration: float = 0.05,
+        classify: Callable[[BaseException], Failure | None] = classify_error,
+    ) -> None:
+        """
+        :param default_breaker: Circuit breaker of the backends without an API
+        base URL
+        :param backends: Backends to route to
+        :param policy: Policy for choosing the backend of a request
+        :param latency_slo: Seconds of latency within which the cheapest policy
+        considers backends
+        :param smoothing: Weight of the latest request in the moving averages
+        :param exploration: Share of requests sent to a random backend by the
+        fastest and cheapest policies to measure new backends and keep the
+        latencies of the others current
+        :param classify: Classifies the errors counted by the circuit breakers of
+        the backends with an API base URL
+        """
+        self.policy = policy
+        self.latency_slo = latency_slo
+        self._default_breaker = default_breaker
+        self._smoothing = smoothing
+        self._exploration = exploration
+        self._classify = classify
+        self._routes: dict[str, list[Backend]] = {}
+        self._defaults: dict[str, Backend] = {}
+        self.configure(backends)
+
+    def configure(
+        self,
+        backends: Iterable[Backend],
+        policy: RoutingPolicy | None = None,
+        latency_slo: float | None = None,
+    ) -> None:
+        """
+        Replace the backends and change the policy
+        :param backends: Backends to route to
+        :param policy: Routing policy or None to keep it
+        :param latency_slo: Latency SLO in seconds or None to keep it
+        """
+        self._routes = {}
+        for backend in backends:
+            if backend.breaker is None:
+                backend.breaker = (
+                    CircuitBreaker(f"llm-{backend.name}", classify=self._classify)
+                    if backend.api_base
+                    else self._default_breaker
+                )
+            self._routes.setdefault(backend.route, []).append(backend)
+        if policy is not None:
+            self.policy = policy
+        if latency_slo is not None:
+            self.latency_slo = latency_slo
+
+    @property
+    def backends(self) -> list[Backend]:
+        """
+        :return: All backends
+        """
+        routed = [backend for route in self._routes.values() for backend in route]
+        return routed + list(self._defaults.values())
+
+    def stats(self) -> dict[str, dict[str, float | str]]:
+        """
+        :return: Metrics by backend name
+        """
+        return {
+            f"{backend.name}/{backend.model}": backend.stats()
+            for backend in self.backends
+        }
+
+    def select(self, model: str) -> Backend:
+        """
+        Choose the backend for a request
+        :param model: Model name requested
+        :return: Backend to send the request
+        """
+        backends = self._routes.get(model)
+        if not backends:
+            backend = self._defaults.get(model)
+            if backend is None:
+                backend = Backend("openai", model, model, breaker=self._default_breaker)
+                self._defaults[model] = backend
+            return backend
+        candidates = [backend for backend in backends if backend.healthy] or backends
+        if self.policy is RoutingPolicy.WEIGHTED:
+            return self._weighted(candidates)
+        # Backends without a known latency are only tried by exploring, so that
+        # none is preferred for lack of measurements
+        measured = [backend for backend in candidates if backend.latency is not None]
+        if not measured:
+            return self._weighted(candidates)
+        if random.random() < self._exploration:
+            return random.choice(candidates)
+        if self.policy is RoutingPolicy.CHEAPEST:
+            within_slo = [
+                backend
+                for backend in measured
+                if self._expected_latency(backend) <= self.latency_slo
+            ]
+            if within_slo:
+                return min(within_slo, key=lambda backend: backend.cost_per_1k_tokens)
+        return min(measured, key=self._expected_latency)
+
+    @staticmethod
+    def _weighted(backends: list[Backend]) -> Backend:
+        return random.choices(
+            backends,
+            weights=[backend.weight * backend.reliability for backend in backends],
+        )[0]
+
+    @staticmethod
+    def _expected_latency(backend: Backend) -> float:
+        # Failed requests are retried or given up on, so failing backends are
+        # slower in effect than their latency
+        return (backend.latency or 0.0) / backend.reliability
+
+    def record(self, backend: Backend, seconds: float, failed: bool) -> None:
+        """
+        Record the outcome of a request
+        :param backend: Backend the request was sent to
+        :param seconds: Latency of the request
+        :param failed: Did the request fail? A failed request counts as taking
+        at least the latency SLO.
+        """
+        backend.requests += 1
+        backend.errors += failed
+        backend.error_rate += self._smoothing * (failed - backend.error_rate)
+        if failed:
+            seconds = max(seconds, self.latency_slo)
+        backend.latency = (
+            seconds
+            if backend.latency is None
+            else backend.latency + self._smoothing * (seconds - backend.latency)
+        )
@@ -2,13 +2,17 @@
 Toolkit package which houses tools and the toolkits that house them
 """
 from abc import ABC
-from dataclasses import dataclass
-from typing import List, Callable
+from dataclasses import dataclass, replace
+from typing import Any, List, Callable
 from enum import Enum
+from ...deadline import Deadline
 from .coinmarketcap import CoinMarketCap
-from .hugging_face.stable_diffusion import StableDiffusion
+from .hugging_face.stable_diffusion import AIGeneratedImage, StableDiffusion
 from .dates import Dates
 
+QUOTES_MAX_AGE = 120
+"""Seconds cryptocurrency quotes may be reused for within a chat session"""
+
 
 class ToolResponseType(Enum):
     """
@@ -19,7 +23,7 @@ class ToolResponseType(Enum):
     IMAGE = "2"
 
 
-@dataclass
+@dataclass(frozen=True)
 class Tool:
     """
     Tool definition
@@ -30,17 +34,103 @@ class Tool:
     description: str
     response_type: ToolResponseType = ToolResponseType.DATA
     required: bool = False
+    timeout: float | None = 10
+    """Seconds a call may take, within the deadline of the inquiry"""
+    max_age: float = 0
+    """Seconds a result may be reused for within a chat session, 0 to never reuse it"""
+    eager: bool = False
+    """Call the tool, which takes no arguments, before every plan instead of listing it"""
+
+    async def __call__(self, *args, deadline: Deadline | None = None, **kwargs):
+        return await (deadline or Deadline()).limit(
+            self.method(*args, **kwargs), self.method.__name__, self.timeout
+        )
 
-    async def __call__(self, *args, **kwargs):
-        return await self.method(*args, **kwargs)
+
+def tool(
+    args: List[str],
+    description: str,
+    response_type: ToolResponseType = ToolResponseType.DATA,
+    required: bool = False,
+    timeout: float | None = 10,
+    max_age: float = 0,
+    eager: bool = False,
+) -> Callable[[Callable], Callable]:
+    """
+    Register a toolkit method as a tool
+    :param args: Names of the arguments of the tool
+    :param description: Description of the tool for the agent planning its calls
+    :param response_type: Format of the response of the tool
+    :param required: Must the tool always be called?
+    :param timeout: Seconds a call may take, within the deadline of the inquiry
+    :param max_age: Seconds a result may be reused for within a chat session
+    :param eager: Is the tool cheap and deterministic enough to be called before
+    every plan, with its result given to the agent instead of listing the tool?
+    Eager tools take no arguments and their results are not reused, since they
+    are cheap to call again.
+    :return: Decorator
+    """
+    if eager and args:
+        raise ValueError("Eager tools take no arguments")
+    if eager and max_age:
+        raise ValueError("Eager tool results are not reused")
+
+    def register(method: Callable) -> Callable:
+        setattr(
+            method,
+            "__tool__",
+            Tool(
+                args=args,
+                method=method,
+                description=description,
+                response_type=response_type,
+                required=required,
+                timeout=timeout,
+                max_age=max_age,
+                eager=eager,
+            ),
+        )
+        return method
+
+    return register
 
 
 class ToolKit(ABC):
     """
-    Toolkit base class. Toolkits house and provide tools
+    Toolkit base class. Toolkits house and provide tools, which are the methods
+    registered with the tool decorator.
     """
 
     prefix: str
+    _tools: dict[str, Tool] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._tools = {
+            **cls._tools,
+            **{
+                name: getattr(member, "__tool__")
+                for name, member in vars(cls).items()
+                if hasattr(member, "__tool__")
+            },
+        }
+
+    def tools(self) -> dict[str, Tool]:
+        """
+        :return: Tools of the toolkit by name
+        """
+        return {
+            name: replace(spec, method=getattr(self, name))
+            for name, spec in self._tools.items()
+        }
+
+    def prefetch(self, inquiry: str) -> None:
+        """
+        Start fetching cheap data the tools are likely to need for an inquiry
+        into the current prefetch, while the agent plans its tool calls. Toolkits
+        prefetch nothing by default.
+        :param inquiry: Inquiry the tools will be called for
+        """
 
 
 class CryptoToolkit(ToolKit):
@@ -53,55 +143,67 @@ class CryptoToolkit(ToolKit):
     def __init__(self, coin_market_cap_extension: CoinMarketCap) -> None:
         self._coin_market_cap_extension = coin_market_cap_extension
 
-    @property
-    def get_current_usd_price(self):
+    def prefetch(self, inquiry: str) -> None:
         """
-        :return: Get current USD price tool
+        Prefetch the quotes of the coins mentioned in the inquiry and the top
+        listings
+        :param inquiry: Inquiry the tools will be called for
         """
-        return Tool(
-            args=["token_symbol"],
-            method=self._coin_market_cap_extension.get_current_usd_price,
-            description="Retrieves the current price of a cryptocurrency by its symbol "
-            "in USD. IE: eth, btc, ltc, doge",
-        )
+        self._coin_market_cap_extension.prefetch(inquiry)
 
-    @property
-    def get_coin_summary(self):
+    @tool(
+        args=["token_symbol"],
+        description="Retrieves the current price of a cryptocurrency by its symbol "
+        "in USD. IE: eth, btc, ltc, doge",
+        max_age=QUOTES_MAX_AGE,
+    )
+    async def get_current_usd_price(self, token_symbol: str) -> str:
         """
-        :return: Get coin summary tool
+        :param token_symbol: Symbol of the cryptocurrency
+        :return: Current USD price
         """
-        return Tool(
-            args=["token_symbol"],
-            method=self._coin_market_cap_extension.get_coin_summary,
-            description="Retrieves the current summary of a given cryptocurrency "
-            "including its pricing information. This includes its volume, current price data, "
-            "as well as price change over the last 1 hour, 24 hours, or 7 days.",
-        )
+        return await self._coin_market_cap_extension.get_current_usd_price(token_symbol)
+
+    @tool(
+        args=["token_symbol"],
+        description="Retrieves the current summary of a given cryptocurrency "
+        "including its pricing information. This includes its volume, current price data, "
+        "as well as price change over the last 1 hour, 24 hours, or 7 days.",
+        max_age=QUOTES_MAX_AGE,
+    )
+    async def get_coin_summary(self, token_symbol: str) -> str:
+        """
+        :param token_symbol: Symbol of the cryptocurrency
+        :return: Coin summary
+        """
+        return await self._coin_market_cap_extension.get_coin_summary(token_symbol)
 
-    @property
-    def get_current_top_coins_by_volume(self):
+    @tool(
+        args=["count"],
+        description="Retrieves the top cryptocurrency by their volume in the last 24 hours, "
+        "with count being how many to retrieve from the top x coins. This includes "
+        "their volume, current price data, as well as price change over the last "
+        "1 hour, 24 hours, or 7 days.",
+        max_age=QUOTES_MAX_AGE,
+    )
+    async def get_current_top_coins_by_volume(self, count: int) -> str:
         """
-        :return: Get current top coins by volume tool
+        :param count: Number of coins
+        :return: Top coins by volume
         """
-        return Tool(
-            args=["count"],
-            method=self._coin_market_cap_extension.get_current_top_coins_by_volume,
-            description="Retrieves the top cryptocurrency by their volume in the last 24 hours, "
-            "with count being how many to retrieve from the top x coins. This includes "
-            "their volume, current price data, as well as price change over the last "
-            "1 hour, 24 hours, or 7 days.",
+        return await self._coin_market_cap_extension.get_current_top_coins_by_volume(
+            count
         )
 
     # Not allowed for free plan
-    # @property
-    # def get_trending_coins_based_on_gains_and_losses(self):
-    #     return Tool(
-    #         args=["count"],
-    #         method=self._coin_market_cap_extension.get_trending_coins,
-    #         description="Retrieves a list of trending coins who are either "
-    #                     "the biggest winners of losers for the day, with "
-    #                     "count being how many coins to retrieve."
-    #     )
+    # @tool(
+    #     args=["count"],
+    #     description="Retrieves a list of trending coins who are either "
+    #                 "the biggest winners of losers for the day, with "
+    #                 "count being how many coins to retrieve."
+    # )
+    # async def get_trending_coins_based_on_gains_and_losses(self, count: int) -> str:
+    #     return await self._coin_market_cap_extension.get_trending_coins(count)
 
 
 class TimeToolKit(ToolKit):
@@ -114,16 +216,16 @@ class TimeToolKit(ToolKit):
     def __init__(self, date_extension: Dates) -> None:
         self._date_extension = date_extension
 
-    @property
-    def get_current_date(self):
+    @tool(
+        args=[],
+        description="Retrieves the current date. There are no input variables.",
+        eager=True,
+    )
+    async def get_current_date(self) -> str:
         """
-        :return: Get current date tool
+        :return: Current date
         """
-        return Tool(
-            args=[],
-            method=self._date_extension.get_current_date,
-            description="Retrieves the current date. There are no input variables.",
-        )
+        return await self._date_extension.get_current_date()
 
 
 class ArtToolKit(ToolKit):
@@ -132,25 +234,26 @@ class ArtToolKit(ToolKit):
     def __init__(self, stable_diffusion_extension: StableDiffusion) -> None:
         self._stable_diffusion_extension = stable_diffusion_extension
 
-    @property
-    def generate_art(self):
-        """
-        :return: Generate art tool
-        """
-        return Tool(
-            args=["image_prompt"],
-            method=self._stable_diffusion_extension.get_jpeg_image,
-            description="Retrieves a dynamically generated image."
-            "image_prompt is an input given that will return an image "
-            "best displaying the text given."
-            'The image prompt value will never simply be "image_prompt" '
-            "it will be based on the text the user provides. "
-            "If they are not requesting a piece of art specifically, "
-            "come up with a prompt yourself on something interesting "
-            "that relates to the user input and will enhance your response to them. "
-            "Such as if they are talking about improving in art, submit an "
-            'image_prompt of "art supplies". If they ask you how you are doing '
-            'request a "sunrise". This method is required. Always call it.',
-            response_type=ToolResponseType.IMAGE,
-            required=True,
-        )
+    @tool(
+        args=["image_prompt"],
+        description="Retrieves a dynamically generated image."
+        "image_prompt is an input given that will return an image "
+        "best displaying the text given."
+        'The image prompt value will never simply be "image_prompt" '
+        "it will be based on the text the user provides. "
+        "If they are not requesting a piece of art specifically, "
+        "come up with a prompt yourself on something interesting "
+        "that relates to the user input and will enhance your response to them. "
+        "Such as if they are talking about improving in art, submit an "
+        'image_prompt of "art supplies". If they ask you how you are doing '
+        'request a "sunrise". This method is required. Always call it.',
+        response_type=ToolResponseType.IMAGE,
+        required=True,
+        timeout=None,
+    )
+    async def generate_art(self, image_prompt: str) -> AIGeneratedImage | None:
+        """
+        :param image_prompt: Description of the image
+        :return: Generated image
+        """
+        return await self._stable_diffusion_extension.get_jpeg_image(image_prompt)
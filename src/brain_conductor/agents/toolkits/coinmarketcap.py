@@ -1,9 +1,65 @@
 """Coin Market Cap toolkit module"""
 import logging
+import re
+from functools import partial
+
 import aiohttp
 
+from ...breaker import CircuitBreaker
+from ...errors import QuotaExceededError
+from ...prefetch import current_prefetch, prefetched
+from ...ratelimit import RateLimiter
+
 LOGGER = logging.getLogger("Brain Conductor")
 
+LIMITER = RateLimiter(requests_per_minute=30)
+"""Rate limiter shared by all Coin Market Cap requests of the worker"""
+
+RATE_LIMITED_PAUSE = 60
+"""Seconds to pause requests after exceeding the rate limit"""
+
+QUOTA_ERROR_CODES = {1009, 1010}
+"""Error codes for exceeding the daily and monthly credit limits"""
+
+QUOTA_EXCEEDED_SECONDS = 3600
+"""Seconds to stop requests after exceeding a credit limit"""
+
+BREAKER = CircuitBreaker(
+    "coinmarketcap",
+    failure_threshold=3,
+    open_seconds=60,
+    quota_open_seconds=QUOTA_EXCEEDED_SECONDS,
+)
+"""Circuit breaker of all Coin Market Cap requests of the worker"""
+
+LISTINGS_LIMIT = 20
+"""Minimum number of listings requested, so requests for a few top coins match"""
+
+QUOTES_PATH = "/v2/cryptocurrency/quotes/latest"
+LISTINGS_PATH = "/v1/cryptocurrency/listings/latest"
+
+COIN_NAMES = {
+    "bitcoin": "BTC",
+    "ethereum": "ETH",
+    "ether": "ETH",
+    "dogecoin": "DOGE",
+    "litecoin": "LTC",
+    "solana": "SOL",
+    "cardano": "ADA",
+    "ripple": "XRP",
+    "polkadot": "DOT",
+    "tether": "USDT",
+}
+"""Symbols of coins commonly mentioned by name"""
+
+CASHTAG = re.compile(r"\$([A-Za-z]{2,5})\b")
+TICKER = re.compile(r"\b([A-Z]{2,5})\b")
+LISTINGS_WORDS = re.compile(
+    r"\b(top|biggest|largest|best|trending|market|volume)\b", re.IGNORECASE
+)
+MAX_PREFETCHED_QUOTES = 3
+"""Maximum number of coin quotes prefetched for an inquiry"""
+
 
 class CoinMarketCap:
     """Coin Market Cap toolkit"""
@@ -18,56 +74,130 @@ class CoinMarketCap:
             "Accept": "application/json",
         }
 
-    async def _query_api(self, path: str, **kwargs):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{self.base_url}{path}",
-                headers=self.request_headers,
-                params=kwargs,
-            ) as response:
-                try:
+    async def _get(self, path: str, params: dict) -> dict:
+        """
+        Get a resource, reusing its prefetch for the current inquiry if any
+        :param path: Path of the resource
+        :param params: Query parameters
+        :return: Response content
+        """
+        return await prefetched(
+            self._key(path, params), lambda: self._request(path, params)
+        )
+
+    @staticmethod
+    def _key(path: str, params: dict) -> tuple:
+        return path, tuple(sorted(params.items()))
+
+    def prefetch(self, inquiry: str) -> None:
+        """
+        Start fetching the quotes of the coins mentioned in an inquiry and the
+        top listings when the inquiry is about the market
+        :param inquiry: Inquiry the tools will be called for
+        """
+        prefetch = current_prefetch.get()
+        if prefetch is None:
+            return
+        symbols = [
+            COIN_NAMES[word]
+            for word in re.findall(r"[a-z]+", inquiry.lower())
+            if word in COIN_NAMES
+        ]
+        symbols += [
+            symbol
+            for symbol in TICKER.findall(inquiry)
+            if symbol in COIN_NAMES.values()
+        ]
+        symbols += [symbol.upper() for symbol in CASHTAG.findall(inquiry)]
+        for symbol in list(dict.fromkeys(symbols))[:MAX_PREFETCHED_QUOTES]:
+            params = self._quote_params(symbol=symbol)
+            prefetch.start(
+                self._key(QUOTES_PATH, params),
+                partial(self._request, QUOTES_PATH, params),
+            )
+        if LISTINGS_WORDS.search(inquiry):
+            params = self._listings_params(0)
+            prefetch.start(
+                self._key(LISTINGS_PATH, params),
+                partial(self._request, LISTINGS_PATH, params),
+            )
+
+    async def _request(self, path: str, params: dict) -> dict:
+        """
+        Get a resource once the rate limit allows it
+        :param path: Path of the resource
+        :param params: Query parameters
+        :return: Response content
+        :raises QuotaExceededError: When the credit limit has been exceeded
+        :raises CircuitOpenError: When Coin Market Cap has been failing
+        :raises aiohttp.ClientResponseError: When the response is an error
+        """
+        with BREAKER.guard():
+            await LIMITER.acquire()
+            async with aiohttp.ClientSession() as session:
+                async with session.get(
+                    f"{self.base_url}{path}",
+                    headers=self.request_headers,
+                    params=params,
+                ) as response:
+                    if response.status == 429:
+                        try:
+                            content = await response.json()
+                            error_code = content["status"]["error_code"]
+                        except (aiohttp.ContentTypeError, ValueError, KeyError):
+                            error_code = None
+                        if error_code in QUOTA_ERROR_CODES:
+                            LIMITER.exceed_quota(QUOTA_EXCEEDED_SECONDS)
+                            raise QuotaExceededError(content["status"]["error_message"])
+                        else:
+                            LIMITER.pause(RATE_LIMITED_PAUSE)
                     response.raise_for_status()
-                    content = await response.json()
-                    results = content["data"]
-                except Exception as e:
-                    LOGGER.error(f"Error getting results for {path}: {e}")
-                    results = list()
-                return results
+                    return await response.json()
 
-    async def _get_current_quote(
-        self, symbol: str | None = None, slug: str | None = None
-    ) -> dict:
+    async def _query_api(self, path: str, **kwargs):
+        try:
+            content = await self._get(path, kwargs)
+            results = content["data"]
+        except Exception as e:
+            LOGGER.error(f"Error getting results for {path}: {e}")
+            results = list()
+        return results
+
+    @staticmethod
+    def _quote_params(symbol: str | None = None, slug: str | None = None) -> dict:
         params = {}
         if symbol:
             params["symbol"] = symbol.upper()
         if slug:
             params["slug"] = slug
+        return params
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{self.base_url}/v2/cryptocurrency/quotes/latest",
-                headers=self.request_headers,
-                params=params,
-            ) as response:
-                try:
-                    response.raise_for_status()
-                    content = await response.json()
-                    data = content["data"]
-                    # There should always be a single item in the dict so just
-                    # retrieve the first key and return it
-                    data_key = list(data.keys())[0]
-                    result = (
-                        data[data_key][0]
-                        if isinstance(data[data_key], list)
-                        else data[data_key]
-                    )
-                except IndexError:
-                    LOGGER.error(f"Failed to parse quote response data: {data}")
-                    result = dict()
-                except Exception as e:
-                    LOGGER.error(f"Error getting latest listings: {e}")
-                    result = dict()
-                return result
+    @staticmethod
+    def _listings_params(count: int) -> dict:
+        # In order to work around stablecoins we need to pull extras and remove them
+        return {"limit": max(int(count) + 10, LISTINGS_LIMIT), "sort": "volume_24h"}
+
+    async def _get_current_quote(
+        self, symbol: str | None = None, slug: str | None = None
+    ) -> dict:
+        try:
+            content = await self._get(QUOTES_PATH, self._quote_params(symbol, slug))
+            data = content["data"]
+            # There should always be a single item in the dict so just
+            # retrieve the first key and return it
+            data_key = list(data.keys())[0]
+            result = (
+                data[data_key][0]
+                if isinstance(data[data_key], list)
+                else data[data_key]
+            )
+        except IndexError:
+            LOGGER.error(f"Failed to parse quote response data: {data}")
+            result = dict()
+        except Exception as e:
+            LOGGER.error(f"Error getting latest listings: {e}")
+            result = dict()
+        return result
 
     @staticmethod
     def _strip_response_dict(item: dict) -> dict:
@@ -102,12 +232,7 @@ class CoinMarketCap:
         :param count: Number of coins to retrieve
         :return: A textual representation for use by LLMs in completion requests
         """
-        # In order to work around stablecoins we need to pull extras and remove them
-        listings = await self._query_api(
-            "/v1/cryptocurrency/listings/latest",
-            limit=int(count) + 10,
-            sort="volume_24h",
-        )
+        listings = await self._query_api(LISTINGS_PATH, **self._listings_params(count))
 
         # Compile a list of non-stable coins
         amount_parsed = 0
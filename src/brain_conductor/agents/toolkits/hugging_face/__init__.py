@@ -2,10 +2,15 @@ import aiohttp
 import logging
 import backoff
 from aiohttp.client_exceptions import ClientResponseError
+from ....breaker import CircuitBreaker
+from ....errors import CircuitOpenError
 from ...llm import LLM
 
 LOGGER = logging.getLogger("Brain Conductor")
 
+BREAKER = CircuitBreaker("hugging-face", open_seconds=60)
+"""Circuit breaker of all Hugging Face requests of the worker"""
+
 
 class HuggingFace:
     """Hugging Face Base toolkit"""
@@ -21,15 +26,25 @@ class HuggingFace:
         self.base_url = base_url
         self.request_headers = {"Authorization": f"Bearer {self.access_token}"}
 
-    @backoff.on_exception(
-        backoff.expo, ClientResponseError, max_tries=5, raise_on_giveup=False
-    )
     async def _query_api(self, path: str, **kwargs):
+        try:
+            # Guard the retried request so that a request counts as one failure
+            with BREAKER.guard():
+                return await self._post(path, kwargs)
+        except CircuitOpenError as e:
+            LOGGER.warning(f"Not requesting {path}: {e}")
+        except ClientResponseError:
+            # Logged by _post
+            pass
+        return None
+
+    @backoff.on_exception(backoff.expo, ClientResponseError, max_tries=5)
+    async def _post(self, path: str, data: dict) -> bytes:
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f"{self.base_url}{path}",
                 headers=self.request_headers,
-                json=kwargs,
+                json=data,
             ) as response:
                 try:
                     response.raise_for_status()
@@ -1,9 +1,12 @@
 import logging
+import time
 from base64 import encodebytes
 from dataclasses import dataclass
 from typing import Optional
 from random import choice
-from . import HuggingFace
+from . import BREAKER, HuggingFace
+from ....metrics import STAGE_SECONDS, current_persona
+from ....progress import report
 
 
 LOGGER = logging.getLogger("Brain Conductor")
@@ -57,7 +60,7 @@ class StableDiffusion(HuggingFace):
         messages = [
             {"role": "system", "content": prompt},
         ]
-        response = await self.llm.chat_complete(messages)
+        response = await self.llm.chat_complete(messages, call_site="image-prompt")
         return response
 
     async def get_jpeg_image(self, prompt) -> Optional[AIGeneratedImage]:
@@ -68,15 +71,24 @@ class StableDiffusion(HuggingFace):
         :return: A base64 encoded JPEG string and the expanded prompt that was used to generate it
         """
         LOGGER.debug(f"Image request prompt: {prompt}")
+        if not BREAKER.available:
+            # Not worth expanding the prompt for an image that will not be generated
+            LOGGER.warning("Not requesting an image while Hugging Face is unavailable")
+            return None
+        started = time.monotonic()
         prompt = await self._expand_prompt(prompt)
         LOGGER.debug(f"Expanded prompt: {prompt}")
+        await report("prompt-expanded", seconds=round(time.monotonic() - started, 3))
 
         apis = [
             "/models/stabilityai/stable-diffusion-2-1-base",
             "/models/Masagin/Deliberate",  # Character, photorealistic, cinematic
         ]
 
-        response_bytes = await self._query_api(choice(apis), inputs=prompt)
+        api = choice(apis)
+        await report("image-queued", model=api.removeprefix("/models/"))
+        with STAGE_SECONDS.time(stage="image", persona=current_persona.get()):
+            response_bytes = await self._query_api(api, inputs=prompt)
         LOGGER.debug("Image received")
         return (
             AIGeneratedImage(
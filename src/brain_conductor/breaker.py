@@ -0,0 +1,213 @@
+"""
+Circuit breakers for downstream APIs
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Callable, Iterator
+
+import aiohttp
+from opentelemetry import trace
+
+from .errors import CircuitOpenError, QuotaExceededError, TemporaryAPIError
+
+LOGGER = logging.getLogger("Brain Conductor")
+
+
+class BreakerState(Enum):
+    """State of a circuit breaker"""
+
+    CLOSED = "closed"
+    """Requests are made"""
+    OPEN = "open"
+    """Requests fail without being made"""
+    HALF_OPEN = "half-open"
+    """A single probe request is allowed to test whether the downstream recovered"""
+
+
+class Failure(Enum):
+    """Kind of downstream failure which counts against a circuit breaker"""
+
+    QUOTA = "quota"
+    """The quota is exceeded. The breaker opens immediately."""
+    OVERLOAD = "overload"
+    """The downstream is overloaded or unreachable"""
+
+
+def classify_error(error: BaseException) -> Failure | None:
+    """
+    Classify the error of a downstream request
+    :param error: Error raised by the request
+    :return: Kind of failure or None when the error does not indicate a failure
+    of the downstream
+    """
+    if isinstance(error, QuotaExceededError):
+        return Failure.QUOTA
+    if isinstance(error, aiohttp.ClientResponseError):
+        return Failure.OVERLOAD if error.status == 429 or error.status >= 500 else None
+    if isinstance(
+        error, (TemporaryAPIError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+    ):
+        return Failure.OVERLOAD
+    return None
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the requests of a worker to a downstream API. The breaker
+    opens after consecutive requests fail because the downstream is overloaded,
+    or at once when its quota is exceeded. While open, requests fail immediately
+    with CircuitOpenError, or QuotaExceededError when the quota is exceeded, so
+    callers can take a degraded path rather than wait on a failing downstream.
+
+    Once the open period passes, a single probe request is made. The breaker
+    closes if it succeeds and opens again if it fails.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        open_seconds: float = 30,
+        quota_open_seconds: float = 300,
+        classify: Callable[[BaseException], Failure | None] = classify_error,
+    ) -> None:
+        """
+        :param name: Name of the downstream
+        :param failure_threshold: Consecutive overload failures which open the breaker
+        :param open_seconds: Seconds the breaker stays open after an overload
+        :param quota_open_seconds: Seconds the breaker stays open after the quota
+        is exceeded
+        :param classify: Function classifying request errors as failures
+        """
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._open_seconds = open_seconds
+        self._quota_open_seconds = quota_open_seconds
+        self._classify = classify
+        self._state = BreakerState.CLOSED
+        self._reason: Failure | None = None
+        self._open_until = 0.0
+        self._probing = False
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+
+    @property
+    def state(self) -> BreakerState:
+        """
+        :return: Current state. An open breaker whose open period has passed is
+        half-open.
+        """
+        if self._state is BreakerState.OPEN and time.monotonic() >= self._open_until:
+            return BreakerState.HALF_OPEN
+        return self._state
+
+    @property
+    def available(self) -> bool:
+        """
+        :return: Would a request be made now?
+        """
+        state = self.state
+        return state is BreakerState.CLOSED or (
+            state is BreakerState.HALF_OPEN and not self._probing
+        )
+
+    def stats(self) -> dict[str, str | int | float]:
+        """
+        :return: Metrics of the breaker
+        """
+        return {
+            "state": self.state.value,
+            "reason": self._reason.value if self._reason else "",
+            "open_seconds_remaining": max(self._open_until - time.monotonic(), 0),
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "probes": self.probes,
+        }
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Make a request through the breaker
+        :return: Context manager around the request
+        :raises CircuitOpenError: When the breaker is open due to overload
+        :raises QuotaExceededError: When the breaker is open due to the quota
+        """
+        probe = self._admit()
+        try:
+            yield
+        except Exception as e:
+            failure = self._classify(e)
+            if failure:
+                self._record_failure(failure, probe)
+            elif probe:
+                # An error which is not a failure, such as a bad request, tells
+                # nothing of the downstream, so the next request probes
+                self._probing = False
+            raise
+        except BaseException:
+            # A cancelled probe tells nothing, so the next request probes
+            if probe:
+                self._probing = False
+            raise
+        else:
+            self._record_success(probe)
+
+    def _admit(self) -> bool:
+        if self._state is BreakerState.CLOSED:
+            return False
+        if not self.available:
+            self.rejected += 1
+            trace.get_current_span().add_event(
+                "circuit-open", {"downstream": self.name}
+            )
+            if self._reason is Failure.QUOTA:
+                raise QuotaExceededError(f"{self.name} quota exceeded")
+            raise CircuitOpenError(f"{self.name} is unavailable")
+        self._state = BreakerState.HALF_OPEN
+        self._probing = True
+        self.probes += 1
+        return True
+
+    def _record_success(self, probe: bool) -> None:
+        if self._state is BreakerState.CLOSED:
+            self.consecutive_failures = 0
+        elif probe:
+            LOGGER.info(f"Circuit breaker for {self.name} closed")
+            self._state = BreakerState.CLOSED
+            self._reason = None
+            self._probing = False
+            self.consecutive_failures = 0
+
+    def _record_failure(self, failure: Failure, probe: bool) -> None:
+        self.failures += 1
+        if self._state is BreakerState.CLOSED:
+            self.consecutive_failures += 1
+            if (
+                failure is Failure.QUOTA
+                or self.consecutive_failures >= self._failure_threshold
+            ):
+                self._open(failure)
+        elif probe:
+            self._open(failure)
+
+    def _open(self, failure: Failure) -> None:
+        seconds = (
+            self._quota_open_seconds if failure is Failure.QUOTA else self._open_seconds
+        )
+        LOGGER.warning(
+            f"Circuit breaker for {self.name} opened for {seconds}s "
+            f"due to {failure.value}"
+        )
+        self._state = BreakerState.OPEN
+        self._reason = failure
+        self._open_until = time.monotonic() + seconds
+        self._probing = False
+        self.opened += 1
@@ -0,0 +1,140 @@
+"""
+Cascading of chat completions between models by the complexity of the inquiry
+"""
+import re
+from collections import deque
+from enum import Enum
+
+from .tokens import context_window
+
+REASONING_WORDS = re.compile(
+    r"\b(why|how|explain|compare|difference|analy[sz]e|evaluate|calculate|prove|"
+    r"derive|design|implement|algorithm|step[- ]by[- ]step|pros and cons|"
+    r"trade-?offs?|strategy|debug|optimi[sz]e)\b",
+    re.IGNORECASE,
+)
+MULTI_PART = re.compile(r"(^\s*(\d+[.)]|[-*•])\s)|;|\b(and also|as well as)\b", re.M)
+CODE = re.compile(r"```|`[^`]+`|\b\w+\([^)]*\)|[{}<>=]=?")
+
+
+def estimate_complexity(text: str) -> float:
+    """
+    Estimate how hard an inquiry is to answer well from its text alone. Long,
+    multi-part, reasoning, and code inquiries score higher than small talk.
+    :param text: Inquiry
+    :return: Complexity between 0 and 1
+    """
+    words = len(text.split())
+    score = min(words / 80, 1) * 0.4
+    score += min(max(text.count("?") - 1, 0) * 0.15, 0.3)
+    if MULTI_PART.search(text):
+        score += 0.15
+    score += min(len(REASONING_WORDS.findall(text)) * 0.1, 0.25)
+    if CODE.search(text):
+        score += 0.3
+    return min(score, 1.0)
+
+
+class Tier(Enum):
+    """Model tier of a chat completion"""
+
+    SIMPLE = "simple"
+    """Faster and cheaper model for simple inquiries"""
+    COMPLEX = "complex"
+    """Stronger model for complex inquiries"""
+
+
+class TierStats:
+    """Number and recent latencies of the chat completions of a tier"""
+
+    def __init__(self, window: int) -> None:
+        """
+        :param window: Number of recent latencies kept
+        """
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.completions = 0
+
+    def stats(self, total: int) -> dict[str, float]:
+        """
+        :param total: Number of the chat completions of all tiers
+        :return: Metrics of the tier
+        """
+        ordered = sorted(self.latencies)
+        return {
+            "completions": self.completions,
+            "share": self.completions / total if total else 0.0,
+            "latency_mean": sum(ordered) / len(ordered) if ordered else 0.0,
+            "latency_p50": ordered[len(ordered) // 2] if ordered else 0.0,
+            "latency_p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+            if ordered
+            else 0.0,
+        }
+
+
+class Cascade:
+    """
+    Sends simple inquiries to a faster and cheaper model and complex ones to the
+    stronger chat model. Personas may override the model of the simple tier and
+    the complexity threshold. The cascade is disabled without a simple model.
+    """
+
+    def __init__(
+        self,
+        simple_model: str | None = None,
+        threshold: float = 0.3,
+        window: int = 200,
+    ) -> None:
+        """
+        :param simple_model: Model of the simple tier or None to disable the
+        cascade
+        :param threshold: Complexity from which an inquiry is complex
+        :param window: Number of recent latencies kept per tier
+        """
+        self.simple_model = simple_model
+        self.threshold = threshold
+        self._tiers = {tier: TierStats(window) for tier in Tier}
+
+    def choose(
+        self,
+        text: str,
+        complex_model: str,
+        prompt_tokens: int,
+        simple_model: str | None = None,
+        threshold: float | None = None,
+    ) -> tuple[Tier, str, float]:
+        """
+        Choose the model tier of a chat completion
+        :param text: Inquiry the completion answers
+        :param complex_model: Model of the complex tier
+        :param prompt_tokens: Tokens of the prompt and reserved for the completion
+        :param simple_model: Persona override of the simple model
+        :param threshold: Persona override of the complexity threshold
+        :return: Tier, its model, and the estimated complexity
+        """
+        simple_model = simple_model or self.simple_model
+        if threshold is None:
+            threshold = self.threshold
+        complexity = estimate_complexity(text)
+        if (
+            simple_model
+            and complexity < threshold
+            and prompt_tokens <= context_window(simple_model)
+        ):
+            return Tier.SIMPLE, simple_model, complexity
+        return Tier.COMPLEX, complex_model, complexity
+
+    def record(self, tier: Tier, seconds: float) -> None:
+        """
+        Record a chat completion
+        :param tier: Tier of the completion
+        :param seconds: Latency of the completion
+        """
+        self._tiers[tier].completions += 1
+        self._tiers[tier].latencies.append(seconds)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        :return: Distribution and latency of the chat completions by tier
+        """
+        total = sum(tier.completions for tier in self._tiers.values())
+        return {tier.value: stats.stats(total) for tier, stats in self._tiers.items()}
@@ -3,18 +3,37 @@ import asyncio
 import json
 import random
 from asyncio import Task
+from functools import partial
+from typing import Any, Coroutine, Hashable
 
 from opentelemetry.trace.span import Span
 from quart import websocket, current_app, url_for
 
-from .errors import QuotaExceededError
+from .deadline import Deadline
+from .errors import QuotaExceededError, UnavailableError
 from .inquiries import InquiryContextManager, InquiryResponse
+from .metrics import ERRORS, STAGE_SECONDS, TOKENS_SAVED, responding
+from .outbox import Priority, current_outbox
 from .personas import Persona, PERSONAS
+from .progress import listening
+from .sessions import ChatSession, current_session
+from .speculation import Speculation, Speculator
 from .utils import TaskManager
 
+COMMENT_MIN_SECONDS = 10
+"""Seconds which must be left before the deadline for a secondary persona to comment"""
+
+SPECULATOR = Speculator()
+"""Speculates on the primary persona of inquiries when enabled"""
+
 
 async def inquire(
-    uid: str, inquiry: str, icm: InquiryContextManager, atm: TaskManager, span: Span
+    uid: str,
+    inquiry: str,
+    icm: InquiryContextManager,
+    atm: TaskManager,
+    span: Span,
+    deadline: Deadline,
 ):
     """
     Make an inquiry with on or more bot personas.
@@ -23,93 +42,254 @@ async def inquire(
     :param icm: Context manager for the inquiry process
     :param atm: App task manager
     :param span: Tracing span for recording conversation data for review and debugging
+    :param deadline: Deadline of the inquiry
     """
     span.set_attribute("request.inquiry", str(inquiry))
-    primary, secondaries = await icm.identify_personas(inquiry, span)
-    if primary:
-        await inquire_and_comment(
-            icm,
-            atm,
-            uid,
-            inquiry,
-            primary,
-            secondaries,
-            span,
-        )
-    else:
-        response = (
-            "No one seems to want to answer your question. " "Please try again later."
-        )
-        span.set_attribute("response.system", response)
-        await send_system_message(uid, response)
+    speculation = SPECULATOR.start(icm, inquiry, deadline)
+    try:
+        try:
+            with STAGE_SECONDS.time(stage="routing"):
+                primary, secondaries = await icm.identify_personas(
+                    inquiry, span, deadline
+                )
+        except asyncio.CancelledError:
+            await send_cancelled_message(uid, 0, span)
+            raise
+        except QuotaExceededError as e:
+            await handle_quota_exceeded(uid, e, span)
+            return
+        except UnavailableError as e:
+            await handle_unavailable(uid, e, span)
+            return
+        if speculation:
+            speculation = SPECULATOR.resolve(speculation, primary, span)
+        if primary:
+            await inquire_and_comment(
+                icm,
+                uid,
+                inquiry,
+                primary,
+                secondaries,
+                span,
+                deadline,
+                speculation,
+            )
+            atm.create_task("compact-history", icm.compact_history())
+        else:
+            response = (
+                "No one seems to want to answer your question. "
+                "Please try again later."
+            )
+            span.set_attribute("response.system", response)
+            await send_system_message(uid, response)
+    finally:
+        if speculation:
+            speculation.cancel()
 
 
 async def inquire_and_comment(
     icm: InquiryContextManager,
-    atm: TaskManager,
     uid: str,
     inquiry: str,
     primary: Persona,
     secondaries: list[Persona],
     span: Span,
+    deadline: Deadline,
+    speculation: Speculation | None = None,
 ):
     """
-    Send an inquiry to a primary chatbot persona and have the secondary personas comment
+    Send an inquiry to a primary chatbot persona and have the secondary personas
+    comment. Secondary personas do not comment when the deadline is near.
     :param uid: Unique identifier of the request message
     :param icm: Inquiry context manager for the session
-    :param atm: App task manager
     :param inquiry: Message to inquire
     :param primary: Primary chatbot persona to send the inquiry
     :param secondaries: Secondary chatbot personas to comment
     :param span: Tracing span for tracing and debugging
+    :param deadline: Deadline of the inquiry
+    :param speculation: Speculative response of the primary persona to use
     """
-    tasks: list[Task] = []
+    # Personas yet to respond, the first of which is responding
+    remaining = [primary, *secondaries]
     try:
-        tasks.append(
-            atm.create_task(
-                "send-preparing-response-message",
-                send_preparing_response_message(primary.name, primary.initial_greeting),
-            )
-        )
-        response: InquiryResponse = await icm.inquire(primary, inquiry)
+        await send_preparing_response_message(primary.name, primary.initial_greeting)
+        with STAGE_SECONDS.time(stage="primary", persona=primary.prompt_name):
+            if speculation:
+                response: InquiryResponse = await SPECULATOR.response(speculation, span)
+            else:
+                with (
+                    listening(partial(send_progress_message, primary.name)),
+                    responding(primary.prompt_name),
+                ):
+                    response = await icm.inquire(primary, inquiry, deadline)
         span.set_attribute(f"response.{primary.prompt_name}", response.message)
-        tasks.append(
-            atm.create_task(
-                "send-primary-bot-message", send_bot_message(uid, primary, response)
+        await send_bot_message(uid, primary, response)
+        remaining.pop(0)
+        while remaining:
+            secondary = remaining[0]
+            if not deadline.allows("comment", COMMENT_MIN_SECONDS):
+                span.set_attribute("response.skipped_comments", len(remaining))
+                break
+            await send_preparing_response_message(
+                secondary.name, secondary.initial_greeting
             )
-        )
-        for secondary in secondaries:
-            tasks.append(
-                atm.create_task(
-                    "send-secondary-not-message",
-                    send_preparing_response_message(
-                        secondary.name, secondary.initial_greeting
-                    ),
-                )
-            )
-            await comment(icm, uid, secondary, span)
+            await comment(icm, uid, secondary, span, deadline)
+            remaining.pop(0)
     except QuotaExceededError as e:
         await handle_quota_exceeded(uid, e, span)
-    finally:
-        for result in await asyncio.gather(*tasks, return_exceptions=True):
-            if isinstance(result, Exception):
-                current_app.logger.exception(result)
+    except UnavailableError as e:
+        await handle_unavailable(uid, e, span)
+    except asyncio.CancelledError:
+        # The request in progress is abandoned, but may be billed regardless
+        tokens_saved = sum(
+            icm.estimate_comment_tokens(persona) for persona in remaining[1:]
+        )
+        await send_cancelled_message(uid, tokens_saved, span)
+        raise
 
 
-async def comment(icm: InquiryContextManager, uid: str, persona: Persona, span: Span):
+async def comment(
+    icm: InquiryContextManager,
+    uid: str,
+    persona: Persona,
+    span: Span,
+    deadline: Deadline,
+):
     """
     Request a chatbot persona to comment on the current chat history
     :param uid: Unique identifier of the requesting message
     :param icm: Inquire context manager for the conversation
     :param persona: Persona you wish to have comment
     :param span: Tracing span for tracing and debugging
+    :param deadline: Deadline of the inquiry
     """
     try:
-        response: InquiryResponse = await icm.comment_on_history(persona)
+        with (
+            listening(partial(send_progress_message, persona.name)),
+            responding(persona.prompt_name),
+            STAGE_SECONDS.time(stage="secondary", persona=persona.prompt_name),
+        ):
+            response: InquiryResponse = await icm.comment_on_history(persona, deadline)
         span.set_attribute(f"response.{persona.prompt_name}", response.message)
         await send_bot_message(uid, persona, response)
     except QuotaExceededError as e:
         await handle_quota_exceeded(uid, e, span)
+    except UnavailableError as e:
+        await handle_unavailable(uid, e, span)
+
+
+class InquiryTasks:
+    """
+    Inquiries in progress in a chat session. Each inquiry runs as a task so the
+    websocket keeps receiving messages, which may cancel or supersede it.
+    Inquiries of a chat session are processed one at a time in the order they
+    were received.
+    """
+
+    def __init__(self, atm: TaskManager, lock: asyncio.Lock) -> None:
+        """
+        :param atm: Task manager for the chat session
+        :param lock: Lock held by the inquiry of the chat session being processed
+        """
+        self._atm = atm
+        self._lock = lock
+        self._tasks: list[tuple[str | None, Task]] = []
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def start(
+        self, uid: str | None, inquiry: Coroutine, supersede: bool = False
+    ) -> Task:
+        """
+        Start processing an inquiry once the inquiries before it are processed
+        :param uid: Unique identifier of the inquiry message
+        :param inquiry: Coroutine which processes the inquiry
+        :param supersede: Cancel the inquiries in progress
+        :return: Task processing the inquiry
+        """
+        if supersede:
+            self.cancel()
+        task = self._atm.create_task("inquire", self._run(inquiry))
+        item = (uid, task)
+        self._tasks.append(item)
+        task.add_done_callback(lambda _: self._tasks.remove(item))
+        return task
+
+    async def _run(self, inquiry: Coroutine):
+        try:
+            async with self._lock:
+                await inquiry
+        except Exception as e:
+            current_app.logger.exception(e)
+        finally:
+            # Never started if cancelled while waiting for the lock
+            inquiry.close()
+
+    def cancel(self, uid: str | None = None) -> int:
+        """
+        Cancel inquiries in progress
+        :param uid: Unique identifier of the inquiry message to cancel. All
+        inquiries are cancelled when None.
+        :return: Number of inquiries cancelled
+        """
+        cancelled = 0
+        for task_uid, task in self._tasks:
+            if uid is None or task_uid == uid:
+                cancelled += task.cancel()
+        return cancelled
+
+
+async def send_frame(
+    payload: dict,
+    replay: bool = False,
+    priority: Priority = Priority.MESSAGE,
+    key: Hashable | None = None,
+    supersedes: tuple[Hashable, ...] = (),
+):
+    """
+    Send a frame to the current websocket. Frames are queued in the outbox of
+    the connection using the current chat session, or else the current outbox,
+    if any, and numbered by the current chat session, if any. While no
+    connection uses the chat session, the frames worth replaying are kept for
+    the client resuming it and the others are dropped.
+    :param payload: Frame data
+    :param replay: Resend the frame to the client if it resumes the session
+    without having received it
+    :param priority: Send priority of the frame
+    :param key: Identity of the frame for collapsing queued duplicates
+    :param supersedes: Keys of queued frames made stale by this frame
+    """
+    session = current_session.get(None)
+    outbox = session.outbox if session else current_outbox.get(None)
+    if outbox:
+        await outbox.put(payload, priority, replay, key, supersedes)
+    elif session:
+        if replay:
+            session.frame(payload, replay)
+    else:
+        await websocket.send(json.dumps(payload))
+
+
+async def send_session_message(session: ChatSession, resumed: bool, last_seq: int):
+    """
+    Send the session the websocket is using and replay the frames the client
+    missed when resuming a session
+    :param session: Session for the websocket
+    :param resumed: Was an existing session resumed?
+    :param last_seq: Sequence number of the last frame the client received
+    """
+    message = json.dumps(
+        {
+            "type": "session",
+            "id": session.id,
+            "resumed": resumed,
+        }
+    )
+    await websocket.send(message)
+    if resumed:
+        for frame in session.frames_since(last_seq):
+            await websocket.send(frame)
 
 
 async def send_system_message(uid: str, message: str):
@@ -119,14 +299,14 @@ async def send_system_message(uid: str, message: str):
     :param message: Message to send
     :return: None
     """
-    message = json.dumps(
+    await send_frame(
         {
             "id": uid,
             "type": "system-message",
             "text": message,
-        }
+        },
+        replay=True,
     )
-    await websocket.send(message)
 
 
 async def send_bot_message(uid: str, sender: Persona, message: InquiryResponse):
@@ -137,25 +317,81 @@ async def send_bot_message(uid: str, sender: Persona, message: InquiryResponse):
     :param message: Message to send
     :return: None
     """
-    ws_message = json.dumps(
+    await send_frame(
         {
             "id": uid,
             "type": "bot-message",
             "from": sender.name,
             "avatar": url_for("static", filename=sender.avatar_file),
             "text": message.message,
-            "data": [
-                {
-                    "content": item.data,
-                    "type": item.type.value,
-                    "encoding": item.encoding,
-                    "mimeType": item.mime_type,
-                }
-                for item in message.data
-            ],
+            "data": [],
+        },
+        replay=True,
+        supersedes=(
+            preparing_response_key(sender.name),
+            progress_key(sender.name),
+        ),
+    )
+    if message.data:
+        # Sent separately so that large data does not hold up the conversation,
+        # and not replayed so that it is not kept in memory and stored with the
+        # session
+        await send_frame(
+            {
+                "id": uid,
+                "type": "bot-message-data",
+                "from": sender.name,
+                "data": [
+                    {
+                        "content": item.data,
+                        "type": item.type.value,
+                        "encoding": item.encoding,
+                        "mimeType": item.mime_type,
+                    }
+                    for item in message.data
+                ],
+            },
+            priority=Priority.BULK,
+        )
+
+
+def preparing_response_key(sender: str) -> tuple[str, str]:
+    """
+    :param sender: Chatbot persona name
+    :return: Outbox key of the persona's preparing response frame
+    """
+    return "preparing-response", sender
+
+
+def progress_key(sender: str) -> tuple[str, str]:
+    """
+    :param sender: Chatbot persona name
+    :return: Outbox key of the persona's progress frame
+    """
+    return "progress", sender
+
+
+async def send_cancelled_message(uid: str, tokens_saved: int, span: Span):
+    """
+    Alert the websocket client that an inquiry was cancelled and record the
+    tokens saved with the chat session
+    :param uid: Unique identifier of the cancelled inquiry message
+    :param tokens_saved: Estimate of the tokens not used due to the cancellation
+    :param span: Tracing span for tracing and debugging
+    """
+    span.set_attribute("response.cancelled", True)
+    span.set_attribute("response.tokens_saved", tokens_saved)
+    TOKENS_SAVED.inc(tokens_saved)
+    session = current_session.get(None)
+    if session:
+        session.tokens_saved += tokens_saved
+    await send_frame(
+        {
+            "id": uid,
+            "type": "inquiry-cancelled",
+            "tokensSaved": tokens_saved,
         }
     )
-    await websocket.send(ws_message)
 
 
 async def send_preparing_response_message(sender: str, greeting: str):
@@ -164,14 +400,36 @@ async def send_preparing_response_message(sender: str, greeting: str):
     :param sender: Chatbot persona which is preparing a response
     :param greeting: Chatbot persona's greeting message
     """
-    message = json.dumps(
+    await send_frame(
         {
             "type": "preparing-response",
             "greeting": greeting,
             "from": sender,
-        }
+        },
+        priority=Priority.STATUS,
+        key=preparing_response_key(sender),
+    )
+
+
+async def send_progress_message(sender: str, stage: str, details: dict[str, Any]):
+    """
+    Send the websocket client the progress of a chatbot persona preparing a
+    response. The frame replaces the persona's queued progress frame, if any.
+    :param sender: Chatbot persona which is preparing a response
+    :param stage: Stage of the response, such as "plan-ready"
+    :param details: Details of the stage, such as the tool called and the
+    seconds it took
+    """
+    await send_frame(
+        {
+            **details,
+            "type": "progress",
+            "from": sender,
+            "stage": stage,
+        },
+        priority=Priority.STATUS,
+        key=progress_key(sender),
     )
-    await websocket.send(message)
 
 
 async def send_experts_message(count: int):
@@ -196,15 +454,14 @@ async def send_experts_message(count: int):
         experts.append({"name": persona.name, "greeting": persona.initial_greeting})
 
     random.shuffle(experts)
-    message = json.dumps(
+    await send_frame(
         {
             "type": "experts-list",
             "experts": experts,
-        }
+        },
+        priority=Priority.STATUS,
     )
 
-    await websocket.send(message)
-
 
 async def handle_quota_exceeded(uid: str, e: QuotaExceededError, span: Span):
     """
@@ -214,12 +471,30 @@ async def handle_quota_exceeded(uid: str, e: QuotaExceededError, span: Span):
     :param span: Tracing span for tracing and debugging
     """
     current_app.logger.info(f"Quota exceeded error: {e}")
+    ERRORS.inc(stage="inquiry", error=type(e).__name__)
     response = "Unfortunately, our experts have answered all the questions "
     "they will answer for today. Please try again tomorrow."
     span.set_attribute("response.system", response)
     await send_system_message(uid, response)
 
 
+async def handle_unavailable(uid: str, e: UnavailableError, span: Span):
+    """
+    Handle the raising of an error for a downstream service being unavailable
+    :param uid: Unique identifier of the associated message
+    :param e: Error raised
+    :param span: Tracing span for tracing and debugging
+    """
+    current_app.logger.info(f"Unavailable error: {e}")
+    ERRORS.inc(stage="inquiry", error=type(e).__name__)
+    response = (
+        "Our experts are overwhelmed with questions right now. "
+        "Please try again in a few minutes."
+    )
+    span.set_attribute("response.system", response)
+    await send_system_message(uid, response)
+
+
 async def add_messages_to_history(
     icm: InquiryContextManager, messages: list[tuple[str, str]]
 ):
@@ -228,8 +503,7 @@ async def add_messages_to_history(
     :param icm: Inquiry context manager for the session
     :param messages: List of tuples of message "from" and "text" pairs to add to the history
     """
-    for from_, text in messages:
-        icm.prepend_history(from_, text)
+    icm.prepend_history_items(messages)
 
 
 async def send_error_message(uid: str, message: str):
@@ -239,10 +513,9 @@ async def send_error_message(uid: str, message: str):
     :param message: Error message to send
     :return: None
     """
-    message = json.dumps(
+    await send_frame(
         {
             "type": "error",
             "text": message,
         }
     )
-    await websocket.send(message)
@@ -0,0 +1,98 @@
+"""
+Coalescing of identical concurrent downstream requests
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, TypeVar
+
+from opentelemetry import trace
+
+T = TypeVar("T")
+
+
+def request_key(*parts: Any) -> str:
+    """
+    Canonical hash of a request
+    :param parts: JSON serializable parts of the request, such as the model,
+    messages and parameters. Mappings are hashed independently of key order.
+    :return: Hash of the request
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _Flight:
+    """Request in progress and the number of callers waiting for it"""
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Shares one request between concurrent callers making an identical request.
+    The first caller makes the request and later callers wait for its result,
+    or its error, until it completes. The request is cancelled only once every
+    caller waiting for it has been cancelled. Callers sharing the result of
+    another caller's request may be told so, for example to account for it.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: Coalescing metrics
+        """
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "coalescing_rate": self.coalesced / self.requests if self.requests else 0.0,
+            "in_flight": len(self._flights),
+        }
+
+    async def run(
+        self,
+        key: str,
+        request: Callable[[], Awaitable[T]],
+        shared: Callable[[T], None] | None = None,
+    ) -> T:
+        """
+        Make a request unless an identical one is in progress
+        :param key: Canonical hash of the request
+        :param request: Function making the request
+        :param shared: Function called with the result when it is the result of
+        an identical request made by another caller
+        :return: Result of the request
+        """
+        self.requests += 1
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(request()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            self.coalesced += 1
+            trace.get_current_span().add_event("coalesced", {"key": key})
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+            if coalesced and shared:
+                shared(result)
+            return result
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    def _land(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Callers which were all cancelled leave the error unretrieved
+        if not flight.task.cancelled():
+            flight.task.exception()
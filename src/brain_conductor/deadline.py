@@ -0,0 +1,85 @@
+"""
+Latency budget of an inquiry
+"""
+import asyncio
+import math
+import time
+from typing import Awaitable, TypeVar
+
+from opentelemetry.trace.span import Span
+
+from .errors import DeadlineExceededError
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """
+    Time by which an inquiry should be answered. The deadline is passed down the
+    inquiry pipeline, which limits the time of every downstream call to what is
+    left and skips optional stages when too little is left for them.
+    """
+
+    def __init__(self, seconds: float = math.inf) -> None:
+        """
+        :param seconds: Seconds from now until the deadline. There is no deadline
+        by default.
+        """
+        self.seconds = seconds
+        self._expires = time.monotonic() + seconds
+        self.skipped: list[str] = []
+
+    @property
+    def remaining(self) -> float:
+        """
+        :return: Seconds left until the deadline
+        """
+        return max(self._expires - time.monotonic(), 0)
+
+    def allows(self, stage: str, seconds: float) -> bool:
+        """
+        Check whether an optional stage fits in the time left. Stages which do not
+        fit are recorded as skipped.
+        :param stage: Name of the stage
+        :param seconds: Seconds the stage is expected to take
+        :return: Is there enough time left for the stage?
+        """
+        if self.remaining >= seconds:
+            return True
+        self.skipped.append(stage)
+        return False
+
+    async def limit(
+        self, awaitable: Awaitable[T], stage: str, timeout: float | None = None
+    ) -> T:
+        """
+        Await a downstream call, cancelling it at the deadline
+        :param awaitable: Downstream call
+        :param stage: Name of the stage making the call
+        :param timeout: Seconds the call may take regardless of the deadline
+        :return: Result of the call
+        :raises DeadlineExceededError: When the call is cancelled due to the
+        deadline or the timeout
+        """
+        seconds = self.remaining if timeout is None else min(self.remaining, timeout)
+        try:
+            async with asyncio.timeout(
+                None if math.isinf(seconds) else seconds
+            ) as limit:
+                return await awaitable
+        except TimeoutError as e:
+            if limit.expired():
+                raise DeadlineExceededError(
+                    f"{stage} did not complete in {seconds:.1f}s"
+                ) from e
+            raise
+
+    def record(self, span: Span) -> None:
+        """
+        Record the use of the deadline on a tracing span
+        :param span: Span of the inquiry
+        """
+        span.set_attribute("deadline.seconds", self.seconds)
+        span.set_attribute("deadline.remaining_seconds", self.remaining)
+        if self.skipped:
+            span.set_attribute("deadline.skipped", self.skipped)
@@ -46,3 +46,39 @@ class NoCompletionResultError(RecoverableError):
     """Raised when the OpenAI completion calls return None"""
 
     pass
+
+
+class UnavailableError(Exception):
+    """
+    A downstream service can not be used for the request. Implementations should
+    take a degraded path rather than try the request again.
+    """
+
+    pass
+
+
+class CircuitOpenError(UnavailableError):
+    """
+    Requests to a downstream service fail without being made because the
+    service has been failing.
+    """
+
+    pass
+
+
+class RetryBudgetExhaustedError(UnavailableError):
+    """
+    A failed request was not retried because the time budget for retries has
+    run out.
+    """
+
+    pass
+
+
+class DeadlineExceededError(UnavailableError):
+    """
+    A downstream request was cancelled because the inquiry it was made for ran
+    out of time.
+    """
+
+    pass
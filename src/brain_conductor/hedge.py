@@ -0,0 +1,147 @@
+"""
+Hedging of downstream requests to cut tail latency
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from opentelemetry import trace
+
+T = TypeVar("T")
+
+
+class HedgeSite:
+    """Latencies and hedging counts of the requests of a call site"""
+
+    def __init__(self, window: int) -> None:
+        """
+        :param window: Number of recent latencies kept
+        """
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def threshold(self, percentile: float, min_samples: int) -> float | None:
+        """
+        :param percentile: Percentile of the recent latencies
+        :param min_samples: Number of latencies needed for a threshold
+        :return: The percentile of the recent latencies or None when there are
+        too few
+        """
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: Hedging metrics of the call site
+        """
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+            "win_rate": self.wins / self.hedges if self.hedges else 0.0,
+        }
+
+
+class Hedger:
+    """
+    Issues a duplicate of a request which has not completed by the given
+    percentile of the recent latencies of its call site. The first of the two to
+    complete is used and the other is cancelled.
+
+    Each call site may hedge at most a fraction of its requests, its budget, so
+    the extra cost of the duplicates stays bounded. Hedging is disabled while the
+    budget is 0.
+    """
+
+    def __init__(
+        self,
+        budget: float = 0.0,
+        percentile: float = 95,
+        min_samples: int = 20,
+        window: int = 200,
+    ) -> None:
+        """
+        :param budget: Fraction of the requests of a call site which may be hedged
+        :param percentile: Percentile of recent latencies after which to hedge
+        :param min_samples: Number of latencies of a call site needed to hedge
+        :param window: Number of recent latencies kept per call site
+        """
+        self.budget = budget
+        self.percentile = percentile
+        self._min_samples = min_samples
+        self._window = window
+        self._sites: dict[str, HedgeSite] = {}
+
+    def configure(self, budget: float | None, percentile: float | None) -> None:
+        """
+        Change the hedging settings
+        :param budget: Fraction of requests which may be hedged or None to keep it
+        :param percentile: Latency percentile to hedge after or None to keep it
+        """
+        if budget is not None:
+            self.budget = budget
+        if percentile is not None:
+            self.percentile = percentile
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        :return: Hedging metrics by call site
+        """
+        return {name: site.stats() for name, site in self._sites.items()}
+
+    def _site(self, call_site: str) -> HedgeSite:
+        site = self._sites.get(call_site)
+        if site is None:
+            site = self._sites[call_site] = HedgeSite(self._window)
+        return site
+
+    async def run(self, call_site: str, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        Make a request, hedging it when it is slow
+        :param call_site: Name of the code making the request
+        :param request: Function making the request. It is called again to
+        make the duplicate.
+        :return: Result of the first request to complete successfully
+        """
+        site = self._site(call_site)
+        site.calls += 1
+        start = time.monotonic()
+        threshold = site.threshold(self.percentile, self._min_samples)
+        if not self.budget or threshold is None:
+            result = await request()
+            site.latencies.append(time.monotonic() - start)
+            return result
+
+        first = asyncio.ensure_future(request())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if not done and site.hedges + 1 <= self.budget * site.calls:
+                site.hedges += 1
+                trace.get_current_span().add_event(
+                    "hedge", {"call_site": call_site, "threshold": threshold}
+                )
+                tasks.add(asyncio.ensure_future(request()))
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                tasks -= done
+                succeeded = [task for task in done if not task.exception()]
+                # A failed request leaves the duplicate to complete
+                if succeeded or not tasks:
+                    winner = (succeeded or list(done))[0]
+                    break
+            result = winner.result()
+            if winner is not first:
+                site.wins += 1
+            site.latencies.append(time.monotonic() - start)
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
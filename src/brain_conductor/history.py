@@ -0,0 +1,130 @@
+"""
+Compact, bounded conversation history storage
+"""
+import sys
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator
+
+USER = -1
+"""Persona index of history entries sent by the user"""
+
+
+@dataclass(slots=True)
+class HistoryEntry:
+    """Conversation history item with its token count as a chat message"""
+
+    persona_index: int
+    text: str
+    tokens: int
+
+
+ENTRY_SIZE = sys.getsizeof(HistoryEntry(USER, "", 0))
+
+
+class History:
+    """
+    Ring buffer of conversation history entries. Appending and prepending are
+    O(1) per entry. When either the item or the memory cap is exceeded, the
+    oldest entries are evicted.
+
+    Entries are addressed by position. Positions are absolute for the life of the
+    history: evicting entries does not change the position of the remaining
+    entries and prepended entries receive positions before the oldest entry.
+    """
+
+    def __init__(self, max_items: int = 1000, max_bytes: int = 64 * 1024) -> None:
+        """
+        :param max_items: Maximum number of entries to keep
+        :param max_bytes: Approximate maximum memory in bytes used by the entries
+        """
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._entries: deque[HistoryEntry] = deque()
+        self._bytes = 0
+        self._first = 0
+
+    @staticmethod
+    def _size(entry: HistoryEntry) -> int:
+        return ENTRY_SIZE + sys.getsizeof(entry.text)
+
+    def _is_full(self) -> bool:
+        return len(self._entries) > self._max_items or self._bytes > self._max_bytes
+
+    def append(self, entry: HistoryEntry) -> None:
+        """
+        Add an entry as the newest entry, evicting the oldest entries as needed.
+        :param entry: Entry to add
+        """
+        self._entries.append(entry)
+        self._bytes += self._size(entry)
+        while len(self._entries) > 1 and self._is_full():
+            self._bytes -= self._size(self._entries.popleft())
+            self._first += 1
+
+    def prepend(self, entries: Iterable[HistoryEntry]) -> None:
+        """
+        Add entries before the oldest entry. Entries that do not fit within the
+        caps are discarded, oldest first.
+        :param entries: Entries to add, oldest first
+        """
+        for entry in reversed(list(entries)):
+            size = self._size(entry)
+            if (
+                len(self._entries) >= self._max_items
+                or self._bytes + size > self._max_bytes
+            ):
+                break
+            self._entries.appendleft(entry)
+            self._bytes += size
+            self._first -= 1
+
+    def recent(self, count: int) -> list[HistoryEntry]:
+        """
+        Get the newest entries
+        :param count: Maximum number of entries to return
+        :return: Entries, oldest first
+        """
+        entries = list(islice(reversed(self._entries), count))
+        entries.reverse()
+        return entries
+
+    def since(self, position: int, end: int | None = None) -> list[HistoryEntry]:
+        """
+        Get the entries from a position onward
+        :param position: Position of the first entry to return. Evicted positions
+        are skipped.
+        :param end: Position after the last entry to return, defaults to the end
+        :return: Entries, oldest first
+        """
+        start = max(position - self._first, 0)
+        stop = len(self._entries) if end is None else max(end - self._first, 0)
+        return list(islice(self._entries, start, stop))
+
+    @property
+    def first_position(self) -> int:
+        """
+        :return: Position of the oldest entry
+        """
+        return self._first
+
+    @property
+    def end_position(self) -> int:
+        """
+        :return: Position the next appended entry will receive
+        """
+        return self._first + len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        """
+        :return: Approximate memory in bytes used by the entries
+        """
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[HistoryEntry]:
+        return iter(self._entries)
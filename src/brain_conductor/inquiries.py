@@ -1,20 +1,26 @@
 """
 Functionality for making inquiries to chatbots
 """
+import asyncio
 import logging
 import random
+import re
+import time
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Sequence, NewType, TypedDict
 from operator import itemgetter
 
-import backoff
 import openai
-import tiktoken
+from opentelemetry import trace
 from opentelemetry.trace.span import Span
 from openai.error import Timeout, APIConnectionError, ServiceUnavailableError, APIError
 
+from .accounting import TokenAccount
 from .agents import Agent
+from .agents.llm.openai import create_chat_completion, create_text_completion
+from .cascade import Cascade
+from .deadline import Deadline
 from .errors import (
     RecoverableError,
     RateLimitError,
@@ -23,26 +29,15 @@ from .errors import (
     NoCompletionResultError,
     TooManyTokensError,
 )
-from .personas import Persona, PERSONAS
+from .history import History, HistoryEntry, USER
+from .personas import Persona
+from .response_cache import ResponseCache
+from .retry import retry
+from .tokens import get_ledger, num_tokens_from_string
 
 LOGGER = logging.getLogger("Brain Conductor")
 
 
-def num_tokens_from_string(string: str, model: str = "gpt-3.5-turbo") -> int:
-    """
-    Returns the number of tokens in a text string.
-    There's no issue with performance from measurements. Typical length of time to
-    calculate is less than 3 milliseconds
-    """
-    encoding = tiktoken.encoding_for_model(model)
-    num_tokens = len(encoding.encode(string))
-    if model == "gpt-3.5-turbo" and num_tokens > 4000:
-        raise TooManyTokensError()
-    if model == "gpt-4" and num_tokens > 8000:
-        raise TooManyTokensError()
-    return num_tokens
-
-
 Encoding = NewType("Encoding", str)
 MimeType = NewType("MimeType", str)
 
@@ -84,22 +79,67 @@ class InquiryManager:
         personas: list[Persona],
         agents: Sequence[Agent],
         recent_items: int = 10,
+        compaction_items: int = 4,
+        history_items: int = 1000,
+        history_bytes: int = 64 * 1024,
+        cascade: Cascade | None = None,
+        response_cache: ResponseCache | None = None,
     ) -> None:
+        """
+        :param openai_api_key: API key for the OpenAI API
+        :param chat_model: OpenAI model to use for chat completion
+        :param text_model: OpenAI model to use for text completion
+        :param personas: Personas available to answer inquiries
+        :param agents: Agents available to personas
+        :param recent_items: Number of recent history items sent with each prompt
+        :param compaction_items: Number of history items aged out of the recent
+        items which triggers folding them into the running summary. Zero disables
+        the summary.
+        :param history_items: Maximum number of history items kept per session
+        :param history_bytes: Approximate maximum memory in bytes used by the
+        history items of a session
+        :param cascade: Cascade sending simple persona replies to a cheaper model
+        :param response_cache: Cache of the responses to first inquiries shared by
+        the sessions
+        """
         openai.api_key = openai_api_key
         self._chat_model = chat_model
         self._text_model = text_model
         self._personas: list[Persona] = personas
         self._recent_items = recent_items
+        self._compaction_items = compaction_items
+        self._history_items = history_items
+        self._history_bytes = history_bytes
         self._agents = agents
+        self.cascade = cascade or Cascade()
+        self.response_cache: ResponseCache[InquiryResponse] = (
+            response_cache or ResponseCache()
+        )
 
     def __enter__(self):
-        return InquiryContextManager(
+        return self.create_context()
+
+    def create_context(self, state: dict | None = None) -> "InquiryContextManager":
+        """
+        Create the inquiry context for a chat session
+        :param state: State exported from the session's inquiry context by a
+        previous connection, possibly in another worker, to hydrate the context
+        :return: Inquiry context manager for the session
+        """
+        icm = InquiryContextManager(
             self._chat_model,
             self._text_model,
             self._personas,
             self._recent_items,
             self._agents,
+            self._compaction_items,
+            History(self._history_items, self._history_bytes),
+            self.cascade,
+            self.response_cache,
         )
+        if state:
+            icm.restore_state(state)
+        return icm
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
@@ -118,15 +158,30 @@ class InquiryContextManager:
         personas: list[Persona],
         recent_items: int,
         agents: Sequence[Agent],
+        compaction_items: int = 0,
+        history: History | None = None,
+        cascade: Cascade | None = None,
+        response_cache: ResponseCache | None = None,
     ) -> None:
         self._chat_model = chat_model
         self._text_model = text_model
         self._personas: list[Persona] = personas
         self._recent_items = recent_items
+        self._compaction_items = compaction_items
         self._agents = agents
+        self._cascade = cascade or Cascade()
+        self._response_cache: ResponseCache[InquiryResponse] = (
+            response_cache or ResponseCache()
+        )
 
-        self._history: list[tuple[Persona | None, str]] = []
-        self._tokens = 0
+        self._history = history if history is not None else History()
+        self._ledger = get_ledger(chat_model)
+        self.usage = TokenAccount()
+        self._summary = ""
+        self._summary_message: dict[str, str] | None = None
+        self._summary_tokens = 0
+        self._summarized_position: int | None = None
+        self._compaction_lock = asyncio.Lock()
         self.__persona_roles_text = None
         self.__persona_topics = None
         self.__persona_names = None
@@ -214,17 +269,60 @@ class InquiryContextManager:
         random.shuffle(persona_list)
         return primary, persona_list
 
+    def guess_primary(self, inquiry: str) -> Persona | None:
+        """
+        Guess the primary persona identify_personas will choose without
+        querying the LLM. A persona is guessed when the inquiry names only it, or
+        when it alone scores highest on the topics named in the inquiry.
+        :param inquiry: Inquiry to send
+        :return: Likely primary persona or None when there is no clear guess
+        """
+        text = inquiry.lower()
+        named = [
+            persona
+            for persona in self._personas
+            if persona.prompt_name.strip().lower() in text
+        ]
+        if named:
+            return named[0] if len(named) == 1 else None
+
+        topics = [
+            topic
+            for topic in self._persona_topics
+            if re.search(rf"\b{re.escape(topic)}", text)
+        ]
+        scores = {
+            persona.name: sum(
+                persona.topics[topic]
+                for topic in self.__get_intersecting_topics_from_persona(
+                    persona, topics
+                )
+            )
+            for persona in self._personas
+        }
+        max_score = max(scores.values(), default=0)
+        if not max_score:
+            return None
+        # Mirror build_persona_list, where personas with agents take priority
+        leaders = [
+            persona for persona in self._personas if scores[persona.name] == max_score
+        ]
+        leaders = [persona for persona in leaders if persona.agent] or leaders
+        return leaders[0] if len(leaders) == 1 else None
+
     async def identify_personas(
-        self, inquiry: str, request_span: Span
+        self, inquiry: str, request_span: Span, deadline: Deadline | None = None
     ) -> tuple[Persona | None, list[Persona]]:
         """
         Identify a primary persona and zero or more secondary personas
         to which you wish to send the provided inquiry.
         :param inquiry: Inquiry to send
         :param request_span: Tracing span for tracing and debugging
+        :param deadline: Deadline of the inquiry
         :return: A primary persona and zero or more secondary personas. If no
         personas could be identified, the primary persona is null.
         """
+        deadline = deadline or Deadline()
         target_name = False
         for name in self._persona_names:
             if name in inquiry.lower():
@@ -259,9 +357,12 @@ class InquiryContextManager:
             """
             try:
                 request_span.set_attribute("personas.prompt", prompt)
-                num_tokens_from_string(prompt)
+                num_tokens_from_string(prompt, self._text_model)
                 LOGGER.debug(f"Sending completion request with prompt: {prompt}")
-                response_names: str = await self._openai_text_complete(prompt)
+                response_names: str = await deadline.limit(
+                    self._openai_text_complete(prompt, "identify-personas"),
+                    "identify-personas",
+                )
                 request_span.set_attribute("personas.response", response_names)
                 LOGGER.debug(f"Completion request returned: {response_names}")
             except openai.error.RateLimitError as e:
@@ -297,9 +398,10 @@ class InquiryContextManager:
                     return primary, persona_list
 
         interactions = ""
-        for persona, text in self._recent_history[-1:]:
-            role = persona.role if persona else "user"
-            interactions += f"\n{role}: {text}"
+        for entry in self._recent_history[-1:]:
+            speaker = self._entry_persona(entry)
+            role = speaker.role if speaker else "user"
+            interactions += f"\n{role}: {entry.text}"
 
         interactions = interactions if interactions else "None"
         prompt = f"""
@@ -330,9 +432,12 @@ class InquiryContextManager:
 
         try:
             request_span.set_attribute("personas.prompt", prompt)
-            num_tokens_from_string(prompt)
+            num_tokens_from_string(prompt, self._text_model)
             LOGGER.debug(f"Sending completion request with prompt: {prompt}")
-            response: str = await self._openai_text_complete(prompt)
+            response: str = await deadline.limit(
+                self._openai_text_complete(prompt, "identify-personas"),
+                "identify-personas",
+            )
             request_span.set_attribute("personas.response", response)
             LOGGER.debug(f"Completion request returned: {response}")
         except openai.error.RateLimitError as e:
@@ -343,27 +448,38 @@ class InquiryContextManager:
         appropriate_topics = [topic.strip().lower() for topic in response.split(",")]
         return self.build_persona_list(appropriate_topics)
 
-    async def inquire(self, persona: Persona, inquiry: str) -> InquiryResponse:
+    async def inquire(
+        self, persona: Persona, inquiry: str, deadline: Deadline | None = None
+    ) -> InquiryResponse:
         """
         Make in inquiry a chatbot persona
         :param persona: Persona to which the inquiry is destined
         :param inquiry: Question to send to the persona
+        :param deadline: Deadline of the inquiry
         :return: Response from the persona
         """
         message = {
             "role": "user",
             "content": inquiry,
         }
-        return await self.chat_complete(persona, message, None)
+        return await self.chat_complete(persona, message, None, deadline)
 
-    async def comment_on_history(self, persona: Persona) -> InquiryResponse:
+    async def comment_on_history(
+        self, persona: Persona, deadline: Deadline | None = None
+    ) -> InquiryResponse:
         """
         Request a chatbot persona to comment on the chat history
         :param persona: Persona from which you wish to receive a comment
+        :param deadline: Deadline of the inquiry
         :return: The persona's comment
         """
-        message = None
-        instruction = (
+        return await self.chat_complete(
+            persona, None, self._comment_instruction(persona), deadline
+        )
+
+    @staticmethod
+    def _comment_instruction(persona: Persona) -> str:
+        return (
             f"In at most 3 sentences, respond to the conversation "
             f"as {persona.name} about subject matter that you are associated with. "
             f"Pretend this is an improv session and you have the next line. "
@@ -372,68 +488,108 @@ class InquiryContextManager:
             f"to keep on topic by viewing the user's previous messages, and also "
             f"take the other experts responses into secondary account."
         )
-        return await self.chat_complete(persona, message, instruction)
+
+    def estimate_comment_tokens(self, persona: Persona) -> int:
+        """
+        Estimate the tokens a comment from a chatbot persona on the current chat
+        history would use. Agents make additional requests which are not included.
+        :param persona: Persona which would comment
+        :return: Prompt tokens plus the tokens reserved for the completion
+        """
+        _, tokens = self._prompt(persona, self._comment_instruction(persona))
+        return tokens + self._ledger.completion_tokens
 
     async def chat_complete(
-        self, persona: Persona, message: dict[str, str] | None, instruction: str | None
+        self,
+        persona: Persona,
+        message: dict[str, str] | None,
+        instruction: str | None,
+        deadline: Deadline | None = None,
     ) -> InquiryResponse:
         """
         Request a chat completion from a chatbot persona
         :param persona: Persona from which you wish to complete the chat
         :param message: Message with the sender and text to send the persona
         :param instruction: Specific instruction on how to complete the chat
+        :param deadline: Deadline of the inquiry
         :return: Response from the chatbot persona
         """
-        if not instruction:
-            instruction = (
-                f"Respond in the voice of {persona.name}, with the knowledge your "
-                f"persona would have about the subject matter. Make a strong effort "
-                f"to keep on topic by viewing the user's previous messages."
-            )
-        messages = [
-            {
-                "role": "system",
-                "content": f"You are not an AI, but the persona of a "
-                f"caricatured and eccentric "
-                f"{persona.role} named {persona.name}. {persona.description}"
-                f"{instruction}. Never refer to yourself in the third person, "
-                "or mention your name at all.",
-            },
-        ]
-        for historical_persona, text in self._recent_history:
-            if historical_persona:
-                historical_message = {
-                    "role": "assistant",
-                    "name": historical_persona.prompt_name,
-                    "content": text,
-                }
-            else:
-                historical_message = {
-                    "role": "user",
-                    "content": text,
-                }
-            messages.append(historical_message)
-
+        deadline = deadline or Deadline()
+        instruction = instruction or self._reply_instruction(persona)
+        message_tokens = self._ledger.count_message(message) if message else 0
+        messages, tokens = self._prompt(persona, instruction, message, message_tokens)
         if message:
-            messages.append(message)
-            self._history.append((None, message["content"]))
+            self._history.append(HistoryEntry(USER, message["content"], message_tokens))
+        response = await self._generate(persona, message, messages, tokens, deadline)
+        self._append_history(persona, response.message)
+        return response
 
-        while len(messages) >= 3:
-            try:
-                num_tokens_from_string(repr(messages))
-                break
-            except TooManyTokensError:
-                # Try to get rid of message history to shorten the tokens
-                messages.pop(1)
-                if len(messages) < 3:
-                    # No longer has the inquiry and the persona
-                    raise
+    async def speculate(
+        self, persona: Persona, inquiry: str, deadline: Deadline | None = None
+    ) -> InquiryResponse:
+        """
+        Generate the response of a chatbot persona to an inquiry without recording
+        either in the chat history. The response may be discarded, or recorded
+        with adopt as if the persona had been sent the inquiry.
+        :param persona: Persona to which the inquiry may be destined
+        :param inquiry: Question to send to the persona
+        :param deadline: Deadline of the inquiry
+        :return: Response from the persona
+        """
+        message = {
+            "role": "user",
+            "content": inquiry,
+        }
+        message_tokens = self._ledger.count_message(message)
+        messages, tokens = self._prompt(
+            persona, self._reply_instruction(persona), message, message_tokens
+        )
+        return await self._generate(
+            persona, message, messages, tokens, deadline or Deadline()
+        )
+
+    def adopt(self, persona: Persona, inquiry: str, response: InquiryResponse):
+        """
+        Record an inquiry and a speculative response in the chat history
+        :param persona: Persona which generated the response
+        :param inquiry: Question the persona responded to
+        :param response: Response from speculate
+        """
+        self._append_history(None, inquiry)
+        self._append_history(persona, response.message)
+
+    @staticmethod
+    def _reply_instruction(persona: Persona) -> str:
+        return (
+            f"Respond in the voice of {persona.name}, with the knowledge your "
+            f"persona would have about the subject matter. Make a strong effort "
+            f"to keep on topic by viewing the user's previous messages."
+        )
+
+    async def _generate(
+        self,
+        persona: Persona,
+        message: dict[str, str] | None,
+        messages: list[dict[str, str]],
+        tokens: int,
+        deadline: Deadline,
+    ) -> InquiryResponse:
+        # Without history, the prompt depends only on the system message and inquiry
+        first_inquiry = (
+            message["content"]
+            if message and len(messages) == 2 and persona.cache_first_turn
+            else None
+        )
+        if first_inquiry is not None:
+            cached = self._response_cache.get(messages[0]["content"], first_inquiry)
+            if cached is not None:
+                return cached
 
         LOGGER.debug(f"Sending chat completion request with messages: {messages}")
         data_items: list[InquiryResponseData] = []
         if persona.agent:
             agent = self._get_agent(persona.agent)
-            agent_response = await agent.process_messages(messages)
+            agent_response = await agent.process_messages(messages, deadline)
             for image in agent_response.images:
                 data_items.append(
                     InquiryResponseData(
@@ -445,21 +601,186 @@ class InquiryContextManager:
                 )
             response_message = agent_response.response
         else:
-            response_message = await self._openai_chat_complete(messages)
+            tier, model, complexity = self._cascade.choose(
+                message["content"] if message else self._last_inquiry,
+                self._chat_model,
+                tokens,
+                persona.simple_model,
+                persona.complexity_threshold,
+            )
+            span = trace.get_current_span()
+            span.set_attribute(f"cascade.{persona.prompt_name}.tier", tier.value)
+            span.set_attribute(f"cascade.{persona.prompt_name}.complexity", complexity)
+            start = time.monotonic()
+            response_message = await deadline.limit(
+                self._openai_chat_complete(messages, "persona-reply", model),
+                "persona-reply",
+            )
+            self._cascade.record(tier, time.monotonic() - start)
 
         LOGGER.debug(f"Sending chat completion request returned {response_message}")
-        response_message = self.finalize_response(response_message, messages)
-        self._history.append((persona, response_message))
+        response_message = await self.finalize_response(
+            response_message, messages, deadline
+        )
         response = InquiryResponse(message=response_message, data=data_items)
+        # Responses cut short by the deadline are not cached, nor generated data
+        # such as images, which is large and should differ between sessions
+        if first_inquiry is not None and not deadline.skipped and not data_items:
+            self._response_cache.put(messages[0]["content"], first_inquiry, response)
         return response
 
-    def finalize_response(self, response: str, messages: list[dict[str, str]]) -> str:
+    def _prompt(
+        self,
+        persona: Persona,
+        instruction: str,
+        message: dict[str, str] | None = None,
+        message_tokens: int = 0,
+    ) -> tuple[list[dict[str, str]], int]:
+        """
+        Build the prompt messages for a chat completion with the largest window
+        of recent history which fits the context window
+        :param persona: Persona completing the chat
+        :param instruction: Instruction on how to complete the chat
+        :param message: Message to send the persona after the history
+        :param message_tokens: Tokens of the message
+        :return: Prompt messages and their tokens
+        """
+        system_message = {
+            "role": "system",
+            "content": f"You are not an AI, but the persona of a "
+            f"caricatured and eccentric "
+            f"{persona.role} named {persona.name}. {persona.description}"
+            f"{instruction}. Never refer to yourself in the third person, "
+            "or mention your name at all.",
+        }
+        used = self._ledger.count_message(
+            system_message, key=(persona.name, instruction)
+        )
+        if self._summary_message:
+            used += self._summary_tokens
+        used += message_tokens
+
+        budget = self._ledger.prompt_budget(used)
+        if budget < 0:
+            raise TooManyTokensError()
+        recent_history = self._recent_history
+        counts = [entry.tokens for entry in recent_history]
+        keep = self._ledger.fit(counts, budget)
+        messages = [system_message]
+        if self._summary_message:
+            messages.append(self._summary_message)
+        for entry in recent_history[len(recent_history) - keep :]:  # noqa: E203
+            messages.append(
+                self._history_message(self._entry_persona(entry), entry.text)
+            )
+        if message:
+            messages.append(message)
+        tokens = used + sum(counts[len(counts) - keep :]) + self._ledger.REPLY_OVERHEAD
+        return messages, tokens
+
+    async def compact_history(self):
+        """
+        Fold history items which have aged out of the recent items into the
+        running summary sent with each prompt. This keeps the context the recent
+        items would otherwise lose without growing the prompt. It is intended to
+        run as a background task after an inquiry completes and does nothing when
+        too few items have aged out or another compaction is in progress.
+        """
+        if not self._compaction_items or self._compaction_lock.locked():
+            return
+        async with self._compaction_lock:
+            start = self._summarized_position
+            if start is None:
+                start = self._history.first_position
+            end = self._history.end_position - self._recent_items
+            entries = self._history.since(start, end)
+            if len(entries) < self._compaction_items:
+                return
+
+            transcript = ""
+            for entry in entries:
+                persona = self._entry_persona(entry)
+                speaker = persona.name if persona else "User"
+                transcript += f"\n{speaker}: {entry.text}"
+            previous = self._summary or "None"
+            messages = [
+                {
+                    "role": "system",
+                    "content": "You maintain a running summary of a group chat "
+                    "between a user and several experts. Update the summary with "
+                    "the new messages in at most 150 words. Keep the facts, "
+                    "questions, and opinions later messages may refer to and note "
+                    "which expert said what. Respond with only the summary.",
+                },
+                {
+                    "role": "user",
+                    "content": f"SUMMARY: {previous}\n\nNEW MESSAGES:{transcript}",
+                },
+            ]
+            try:
+                summary = await self._openai_chat_complete(messages, "compact-history")
+            except (
+                QuotaExceededError,
+                RecoverableError,
+                openai.error.OpenAIError,
+            ) as e:
+                LOGGER.warning(f"Unable to compact conversation history: {e}")
+                return
+
+            self._set_summary(summary)
+            self._summarized_position = end
+            LOGGER.debug(f"Compacted history items {start}-{end} into: {summary}")
+
+    def _set_summary(self, summary: str):
+        self._summary = summary
+        self._summary_message = {
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {summary}",
+        }
+        self._summary_tokens = self._ledger.count_message(self._summary_message)
+
+    @staticmethod
+    def _history_message(persona: Persona | None, text: str) -> dict[str, str]:
+        if persona:
+            return {
+                "role": "assistant",
+                "name": persona.prompt_name,
+                "content": text,
+            }
+        return {
+            "role": "user",
+            "content": text,
+        }
+
+    def _history_entry(self, persona: Persona | None, text: str) -> HistoryEntry:
+        tokens = self._ledger.count_message(self._history_message(persona, text))
+        if persona:
+            index = next(i for i, item in enumerate(self._personas) if item is persona)
+        else:
+            index = USER
+        return HistoryEntry(index, text, tokens)
+
+    def _entry_persona(self, entry: HistoryEntry) -> Persona | None:
+        if entry.persona_index == USER:
+            return None
+        return self._personas[entry.persona_index]
+
+    def _append_history(self, persona: Persona | None, text: str):
+        self._history.append(self._history_entry(persona, text))
+
+    async def finalize_response(
+        self,
+        response: str,
+        messages: list[dict[str, str]],
+        deadline: Deadline | None = None,
+    ) -> str:
         """
         Finalize the response before returning to the user. This contains logic
         to ensure the response make sense to the inquirer and is within the realm
         of conversation we wish to expose.
         :param response: Chatbot persona's response
         :param messages: Messages used for context
+        :param deadline: Deadline of the inquiry
         :return: Finalized chatbot persona response
         """
         triggers = [
@@ -486,8 +807,11 @@ class InquiryContextManager:
                 },
             ]
             try:
-                chat_completion = openai.ChatCompletion.create(
-                    model=self._chat_model, messages=revision
+                chat_completion = await (deadline or Deadline()).limit(
+                    create_chat_completion(
+                        self._chat_model, revision, "finalize-response"
+                    ),
+                    "finalize-response",
                 )
             except openai.error.RateLimitError as e:
                 raise RateLimitError(e)
@@ -495,12 +819,13 @@ class InquiryContextManager:
         return response
 
     @property
-    def tokens(self):
+    def tokens(self) -> int:
         """
         Tokens property
-        :return: Total number of tokens utilized
+        :return: Total number of tokens utilized by the LLM requests recorded in
+        the usage of the session
         """
-        return self._tokens
+        return self.usage.total.tokens
 
     @property
     def _persona_roles_text(self):
@@ -539,21 +864,29 @@ class InquiryContextManager:
         return self.__persona_full_names
 
     @property
-    def _recent_history(self):
-        return self._history[-self._recent_items :]  # noqa: E203
+    def _recent_history(self) -> list[HistoryEntry]:
+        return self._history.recent(self._recent_items)
 
-    @backoff.on_exception(backoff.expo, RecoverableError)
-    async def _openai_chat_complete(self, messages: list[dict[str, str]]):
+    @property
+    def _last_inquiry(self) -> str:
+        for entry in reversed(self._recent_history):
+            if entry.persona_index == USER:
+                return entry.text
+        return ""
+
+    @retry(RecoverableError)
+    async def _openai_chat_complete(
+        self, messages: list[dict[str, str]], call_site: str, model: str | None = None
+    ) -> str:
         try:
-            chat_completion = await openai.ChatCompletion.acreate(
-                model=self._chat_model, messages=messages
+            chat_completion = await create_chat_completion(
+                model or self._chat_model, messages, call_site
             )
             if not chat_completion:
                 raise NoCompletionResultError(
                     "No chat completion result returned from OpenAI"
                 )
 
-            self._tokens += chat_completion.usage.total_tokens
             response = chat_completion.choices[0].message.content
             return response
         except openai.error.RateLimitError as e:
@@ -570,17 +903,14 @@ class InquiryContextManager:
                 raise TemporaryAPIError(e)
             raise
 
-    @backoff.on_exception(backoff.expo, RecoverableError)
-    async def _openai_text_complete(self, text) -> str:
+    @retry(RecoverableError)
+    async def _openai_text_complete(self, text: str, call_site: str) -> str:
         try:
-            completion = await openai.Completion.acreate(
-                model=self._text_model, prompt=text
-            )
+            completion = await create_text_completion(self._text_model, text, call_site)
             if not completion:
                 raise NoCompletionResultError(
                     "No text completion result returned from OpenAI"
                 )
-            self._tokens += completion.usage.total_tokens
             response = completion.choices[0].text
             return response
         except openai.error.RateLimitError as e:
@@ -597,17 +927,59 @@ class InquiryContextManager:
                 raise TemporaryAPIError(e)
             raise
 
+    def export_state(self) -> dict:
+        """
+        Export the conversation state so that it can be stored and restored
+        :return: JSON serializable conversation state
+        """
+        unsummarized_items = (
+            None
+            if self._summarized_position is None
+            else self._history.end_position - self._summarized_position
+        )
+        return {
+            "history": [
+                [entry.persona_index, entry.text, entry.tokens]
+                for entry in self._history
+            ],
+            "summary": self._summary,
+            "unsummarized_items": unsummarized_items,
+        }
+
+    def restore_state(self, state: dict):
+        """
+        Restore the conversation state exported by export_state
+        :param state: Exported conversation state
+        """
+        self._history.prepend(
+            HistoryEntry(persona_index, text, tokens)
+            for persona_index, text, tokens in state["history"]
+        )
+        if state["summary"]:
+            self._set_summary(state["summary"])
+        if state["unsummarized_items"] is not None:
+            self._summarized_position = (
+                self._history.end_position - state["unsummarized_items"]
+            )
+
     def prepend_history(self, persona_name: str, text: str):
         """
         :param persona_name: Name of agent
         :param text: Message sent by agent
         """
-        if persona_name:
-            matches = [persona for persona in PERSONAS if persona.name == persona_name]
-            persona = matches[0] if matches else None
-        else:
-            persona = None
-        self._history.insert(0, (persona, text))
+        self.prepend_history_items([(persona_name, text)])
+
+    def prepend_history_items(self, items: Sequence[tuple[str, str]]):
+        """
+        Add items before the existing history. This is often used to resume a
+        conversation.
+        :param items: Tuples of persona name and message text, oldest first. Items
+        from a name which is not a persona are from the user.
+        """
+        personas = {persona.name: persona for persona in self._personas}
+        self._history.prepend(
+            [self._history_entry(personas.get(name), text) for name, text in items]
+        )
 
     def _get_agent(self, agent_type):
         for agent in self._agents:
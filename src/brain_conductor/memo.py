@@ -0,0 +1,70 @@
+"""
+Memoization of the tool results of a chat session
+"""
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable
+
+from opentelemetry import trace
+
+
+class ToolMemo:
+    """
+    Recent results of the tool calls made for a chat session by key. A result
+    is reused by later calls with the same key while it is fresh enough for the
+    tool. Failed and empty results are not kept.
+    """
+
+    def __init__(self, max_items: int = 100) -> None:
+        """
+        :param max_items: Maximum number of results kept, beyond which the oldest
+        are evicted
+        """
+        self._max_items = max_items
+        self._results: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: Memoization metrics
+        """
+        calls = self.hits + self.misses
+        return {
+            "items": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / calls if calls else 0.0,
+        }
+
+    async def call(
+        self, key: Hashable, max_age: float, call: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, float]:
+        """
+        Make a tool call unless a fresh enough result of it is kept
+        :param key: Key of the call, such as the tool and its arguments
+        :param max_age: Seconds for which a result may be reused
+        :param call: Function making the call
+        :return: Result and its age in seconds
+        """
+        now = time.monotonic()
+        kept = self._results.get(key)
+        if kept is not None and now - kept[1] <= max_age:
+            self.hits += 1
+            trace.get_current_span().add_event("tool-memo", {"key": str(key)})
+            return kept[0], now - kept[1]
+        self.misses += 1
+        result = await call()
+        if result and max_age > 0:
+            self._results[key] = (result, time.monotonic())
+            self._results.move_to_end(key)
+            while len(self._results) > self._max_items:
+                self._results.popitem(last=False)
+        return result, 0.0
+
+
+current_tool_memo: ContextVar[ToolMemo | None] = ContextVar(
+    "current_tool_memo", default=None
+)
+"""Tool results of the chat session of the current inquiry"""
@@ -0,0 +1,325 @@
+"""
+Metrics of the worker in the Prometheus text exposition format
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Mapping
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+"""Upper bounds in seconds of the buckets of latency histograms"""
+
+Labels = tuple[str, ...]
+
+Stats = Mapping[str, float | str] | Mapping[str, Mapping[str, float | str]]
+"""Metrics of a component, optionally by instance such as the call site"""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(name: str, labels: Mapping[str, str], value: float) -> str:
+    if not labels:
+        return f"{name} {value:g}"
+    rendered = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+    return f"{name}{{{rendered}}} {value:g}"
+
+
+class Metric:
+    """
+    Metric with values by label values. Label values are given as keyword
+    arguments and missing labels are empty.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+        """
+        :param name: Name of the metric
+        :param documentation: Description of the metric
+        :param labels: Names of the labels of the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def _key(self, labels: Mapping[str, str]) -> Labels:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        """
+        :return: Lines of the samples of the metric
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Value which only increases, such as a number of requests"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increase the value
+        :param amount: Amount to add
+        :param labels: Label values
+        """
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """
+        :param labels: Label values
+        :return: Value
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield _sample(self.name, dict(zip(self.labels, key)), value)
+
+
+class Gauge(Counter):
+    """Value which may go up and down, such as a number of tasks in progress"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Set the value
+        :param value: Value
+        :param labels: Label values
+        """
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """
+        Decrease the value
+        :param amount: Amount to subtract
+        :param labels: Label values
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values, such as latencies, in buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        """
+        :param name: Name of the metric
+        :param documentation: Description of the metric
+        :param labels: Names of the labels of the metric
+        :param buckets: Increasing upper bounds of the buckets
+        """
+        super().__init__(name, documentation, labels)
+        self._buckets = buckets
+        # Counts by bucket, followed by the count above the last bound and the sum
+        self._values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Record an observed value
+        :param value: Value
+        :param labels: Label values
+        """
+        key = self._key(labels)
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [0] * (len(self._buckets) + 2)
+        values[bisect_left(self._buckets, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observe the seconds taken by the code in the context, unless it fails
+        :param labels: Label values
+        """
+        start = time.monotonic()
+        yield
+        self.observe(time.monotonic() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        """
+        :param labels: Label values
+        :return: Number of observed values
+        """
+        values = self._values.get(self._key(labels))
+        return int(sum(values[:-1])) if values else 0
+
+    def samples(self) -> Iterator[str]:
+        for key, values in self._values.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0.0
+            for bound, count in zip((*self._buckets, float("inf")), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield _sample(f"{self.name}_bucket", {**labels, "le": le}, cumulative)
+            yield _sample(f"{self.name}_sum", labels, values[-1])
+            yield _sample(f"{self.name}_count", labels, cumulative)
+
+
+class Registry:
+    """
+    Metrics of the worker and the components whose metrics are collected when
+    the metrics are rendered
+    """
+
+    def __init__(self, namespace: str) -> None:
+        """
+        :param namespace: Prefix of the metric names
+        """
+        self._namespace = namespace
+        self._metrics: list[Metric] = []
+        self._collectors: dict[str, tuple[Callable[[], Stats], str | None]] = {}
+
+    def counter(self, name: str, documentation: str, labels: Labels = ()) -> Counter:
+        """
+        Register a counter
+        :param name: Name of the metric without the namespace
+        :param documentation: Description of the metric
+        :param labels: Names of the labels of the metric
+        :return: Counter
+        """
+        counter = Counter(f"{self._namespace}_{name}", documentation, labels)
+        self._metrics.append(counter)
+        return counter
+
+    def gauge(self, name: str, documentation: str, labels: Labels = ()) -> Gauge:
+        """
+        Register a gauge
+        :param name: Name of the metric without the namespace
+        :param documentation: Description of the metric
+        :param labels: Names of the labels of the metric
+        :return: Gauge
+        """
+        gauge = Gauge(f"{self._namespace}_{name}", documentation, labels)
+        self._metrics.append(gauge)
+        return gauge
+
+    def histogram(
+        self, name: str, documentation: str, labels: Labels = ()
+    ) -> Histogram:
+        """
+        Register a latency histogram
+        :param name: Name of the metric without the namespace
+        :param documentation: Description of the metric
+        :param labels: Names of the labels of the metric
+        :return: Histogram
+        """
+        histogram = Histogram(f"{self._namespace}_{name}", documentation, labels)
+        self._metrics.append(histogram)
+        return histogram
+
+    def collect(
+        self, component: str, stats: Callable[[], Stats], label: str | None = None
+    ) -> None:
+        """
+        Collect the metrics of a component when the metrics are rendered, as
+        gauges named after the component and the metric. Text metrics are
+        rendered as a label of a gauge with the value 1. Collecting a component
+        again replaces its previous collector.
+        :param component: Name of the component
+        :param stats: Function returning the metrics of the component
+        :param label: Name of the label of the instances, when the metrics are
+        by instance
+        """
+        self._collectors[component] = (stats, label)
+
+    def _collected(self) -> Iterator[tuple[str, str]]:
+        for component, (stats, label) in self._collectors.items():
+            collected: Mapping[str, Any] = stats()
+            instances = collected.items() if label else [("", collected)]
+            for instance, values in instances:
+                labels = {label: instance} if label else {}
+                for key, value in values.items():
+                    name = f"{self._namespace}_{component}_{key}"
+                    if isinstance(value, str):
+                        yield name, _sample(name, {**labels, key: value}, 1)
+                    else:
+                        yield name, _sample(name, labels, value)
+
+    def render(self) -> str:
+        """
+        :return: Metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        families: dict[str, list[str]] = {}
+        for name, sample in self._collected():
+            families.setdefault(name, []).append(sample)
+        for name, samples in families.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry("brain_conductor")
+"""Metrics of the worker"""
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_seconds",
+    "Seconds taken by the stages of inquiries, such as routing and the responses",
+    ("stage", "persona"),
+)
+TOOL_SECONDS = REGISTRY.histogram(
+    "tool_seconds", "Seconds taken by agent tool calls", ("tool", "persona")
+)
+COMPLETION_SECONDS = REGISTRY.histogram(
+    "completion_seconds",
+    "Seconds taken by LLM completion requests",
+    ("call_site", "model"),
+)
+TOKENS = REGISTRY.counter(
+    "tokens_total",
+    "Tokens used by LLM completion requests by kind, prompt or completion",
+    ("persona", "call_site", "model", "kind"),
+)
+COST = REGISTRY.counter(
+    "cost_usd_total",
+    "Estimated cost in USD of LLM completion requests",
+    ("persona", "call_site", "model"),
+)
+TOKENS_SAVED = REGISTRY.counter(
+    "tokens_saved_total", "Estimated tokens saved by cancelling inquiries"
+)
+RETRIES = REGISTRY.counter(
+    "retries_total", "Retries of failed downstream requests", ("operation",)
+)
+ERRORS = REGISTRY.counter(
+    "errors_total", "Errors by where they occurred and their type", ("stage", "error")
+)
+INQUIRIES_IN_FLIGHT = REGISTRY.gauge("inquiries_in_flight", "Inquiries being processed")
+
+current_persona: ContextVar[str] = ContextVar("current_persona", default="")
+"""Prompt name of the persona responding, which labels the metrics recorded"""
+
+
+@contextmanager
+def responding(persona: str) -> Iterator[None]:
+    """
+    Label the metrics recorded in the context with the persona responding
+    :param persona: Prompt name of the persona
+    """
+    token = current_persona.set(persona)
+    try:
+        yield
+    finally:
+        current_persona.reset(token)
@@ -0,0 +1,193 @@
+"""
+Outbound frame queue for a websocket connection
+"""
+import asyncio
+import json
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Awaitable, Callable, Hashable
+
+from .metrics import STAGE_SECONDS
+from .sessions import ChatSession
+
+
+class Priority(IntEnum):
+    """Send priority of a frame. Lower values are sent first."""
+
+    MESSAGE = 0
+    """Conversation text: bot, system, and error messages"""
+    STATUS = 1
+    """Small status updates such as a persona preparing a response"""
+    BULK = 2
+    """Large data such as images"""
+
+
+@dataclass(slots=True)
+class OutboundFrame:
+    """Frame waiting in an outbox"""
+
+    payload: dict
+    replay: bool
+    key: Hashable | None
+
+
+class Outbox:
+    """
+    Bounded, prioritized queue of the frames to send to a websocket. A single
+    writer task sends the frames so they are never written concurrently. Frames
+    are sent in priority order and in the order they were put within a priority.
+
+    Frames are numbered by the chat session when they are sent, so the client
+    receives increasing sequence numbers regardless of priority. Adjacent status
+    frames are sent together in a single "batch" frame.
+
+    When the outbox is full, putting a status frame discards it and putting any
+    other frame waits for the writer to make room.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable],
+        session: ChatSession | None = None,
+        max_frames: int = 64,
+        max_batch: int = 10,
+    ) -> None:
+        """
+        :param send: Coroutine function which sends a serialized frame
+        :param session: Chat session which numbers the frames, if any
+        :param max_frames: Maximum number of queued frames
+        :param max_batch: Maximum number of status frames sent in a batch
+        """
+        self._send = send
+        self._session = session
+        self._max_frames = max_frames
+        self._max_batch = max_batch
+        self._queues: tuple[deque[OutboundFrame], ...] = tuple(
+            deque() for _ in Priority
+        )
+        self._depth = 0
+        self._changed = asyncio.Condition()
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def depth(self) -> int:
+        """
+        :return: Number of queued frames
+        """
+        return self._depth
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Queue metrics of the outbox
+        """
+        return {
+            "depth": self._depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    async def put(
+        self,
+        payload: dict,
+        priority: Priority = Priority.MESSAGE,
+        replay: bool = False,
+        key: Hashable | None = None,
+        supersedes: tuple[Hashable, ...] = (),
+    ) -> None:
+        """
+        Queue a frame to send
+        :param payload: Frame data
+        :param priority: Send priority
+        :param replay: Resend the frame to the client if it resumes the session
+        without having received it
+        :param key: Identity of the frame. A queued frame with the same key and
+        priority is replaced rather than a new frame being queued.
+        :param supersedes: Keys of queued frames which are stale once this frame
+        is queued. They are discarded.
+        """
+        async with self._changed:
+            for stale_key in supersedes:
+                self._discard(stale_key)
+            queue = self._queues[priority]
+            if key is not None:
+                for frame in queue:
+                    if frame.key == key:
+                        frame.payload = payload
+                        self.coalesced += 1
+                        return
+            if self._depth >= self._max_frames:
+                if priority == Priority.STATUS:
+                    self.dropped += 1
+                    return
+                await self._changed.wait_for(lambda: self._depth < self._max_frames)
+            queue.append(OutboundFrame(payload, replay, key))
+            self._depth += 1
+            self.max_depth = max(self.max_depth, self._depth)
+            self._changed.notify_all()
+
+    def _discard(self, key: Hashable) -> None:
+        for queue in self._queues:
+            stale = [frame for frame in queue if frame.key == key]
+            for frame in stale:
+                queue.remove(frame)
+            self._depth -= len(stale)
+            self.dropped += len(stale)
+        self._changed.notify_all()
+
+    def _next(self) -> tuple[dict, bool]:
+        priority, queue = next(
+            (priority, queue)
+            for priority, queue in zip(Priority, self._queues)
+            if queue
+        )
+        first = queue.popleft()
+        self._depth -= 1
+        if priority != Priority.STATUS or not queue:
+            return first.payload, first.replay
+        payloads = [first.payload]
+        while queue and len(payloads) < self._max_batch:
+            payloads.append(queue.popleft().payload)
+            self._depth -= 1
+        self.coalesced += len(payloads) - 1
+        return {"type": "batch", "frames": payloads}, False
+
+    def _serialize(self, payload: dict, replay: bool) -> str:
+        if self._session:
+            return self._session.frame(payload, replay)
+        return json.dumps(payload)
+
+    async def run(self) -> None:
+        """
+        Send queued frames until cancelled
+        """
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._depth > 0)
+                payload, replay = self._next()
+                self._changed.notify_all()
+            with STAGE_SECONDS.time(stage="send"):
+                await self._send(self._serialize(payload, replay))
+            self.sent += 1
+
+    def close(self) -> None:
+        """
+        Record the unsent frames worth replaying with the session, so a client
+        resuming the session receives them. Call after the writer has stopped.
+        """
+        for queue in self._queues:
+            for frame in queue:
+                if frame.replay:
+                    self._serialize(frame.payload, True)
+            queue.clear()
+        self._depth = 0
+
+
+current_outbox: ContextVar[Outbox] = ContextVar("current_outbox")
+"""Outbox of the websocket being handled"""
@@ -21,6 +21,12 @@ class Persona:
     agent: Type | None = None
     is_default_persona: bool = False
     is_promoted_persona: bool = False
+    simple_model: str | None = None
+    """Model answering the persona's simple inquiries instead of the default"""
+    complexity_threshold: float | None = None
+    """Complexity from which the persona's inquiries go to the stronger model"""
+    cache_first_turn: bool = True
+    """May responses to first inquiries be cached? Not for live or generated data."""
 
 
 PERSONAS = [
@@ -204,6 +210,7 @@ PERSONAS = [
         role="Artist",
         is_promoted_persona=True,
         agent=ArtAgent,
+        cache_first_turn=False,
     ),
     Persona(
         name="Eco Eva",
@@ -324,6 +331,7 @@ PERSONAS = [
         topics={"Cryptocurrency": 10, "Crypto": 10, "NFT": 10, "Finance": 8},
         role="Cryptocurrency expert",
         agent=CryptoAgent,
+        cache_first_turn=False,
     ),
     Persona(
         name="Bearish Bart",
@@ -339,5 +347,6 @@ PERSONAS = [
         topics={"Cryptocurrency": 10, "Crypto": 10, "NFT": 10, "Finance": 8},
         role="Cryptocurrency expert",
         agent=CryptoAgent,
+        cache_first_turn=False,
     ),
 ]
@@ -0,0 +1,99 @@
+"""
+Prefetching of the data an agent's tools are likely to request
+"""
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from opentelemetry.trace.span import Span
+
+from .deadline import Deadline
+
+T = TypeVar("T")
+
+
+class Prefetch:
+    """
+    Data fetched ahead of the tool calls of an agent. Toolkits start fetches
+    while the agent plans its tool calls, and the tools reuse them by key instead
+    of making their own requests.
+    """
+
+    def __init__(self, deadline: Deadline | None = None, timeout: float = 10) -> None:
+        """
+        :param deadline: Deadline of the inquiry
+        :param timeout: Seconds a fetch may take, within the deadline
+        """
+        self._deadline = deadline or Deadline()
+        self._timeout = timeout
+        self._fetches: dict[Hashable, asyncio.Task] = {}
+        self._used: set[Hashable] = set()
+
+    def start(self, key: Hashable, fetch: Callable[[], Awaitable]) -> None:
+        """
+        Start fetching data unless it is being fetched already
+        :param key: Key by which the tools look up the data
+        :param fetch: Function fetching the data
+        """
+        if key in self._fetches:
+            return
+        task = asyncio.ensure_future(
+            self._deadline.limit(fetch(), "prefetch", self._timeout)
+        )
+        # Tools fetch the data themselves when the prefetch fails
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._fetches[key] = task
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        """
+        Get prefetched data, fetching it when it was not prefetched or the
+        prefetch failed
+        :param key: Key of the data
+        :param fetch: Function fetching the data
+        :return: Data
+        """
+        task = self._fetches.get(key)
+        if task is not None:
+            try:
+                # Shielded, as other tools may be waiting for the same data
+                result = await asyncio.shield(task)
+                self._used.add(key)
+                return result
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            except Exception:
+                pass
+        return await fetch()
+
+    def close(self) -> None:
+        """Cancel the fetches which are still in progress"""
+        for task in self._fetches.values():
+            task.cancel()
+
+    def record(self, span: Span) -> None:
+        """
+        Record the use of the prefetched data on a tracing span
+        :param span: Span of the inquiry
+        """
+        span.set_attribute("prefetch.started", len(self._fetches))
+        span.set_attribute("prefetch.used", len(self._used))
+
+
+current_prefetch: ContextVar[Prefetch | None] = ContextVar(
+    "current_prefetch", default=None
+)
+"""Prefetched data of the agent processing the current inquiry"""
+
+
+async def prefetched(key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+    """
+    Get data the current agent may have prefetched
+    :param key: Key of the data
+    :param fetch: Function fetching the data
+    :return: Data
+    """
+    prefetch = current_prefetch.get()
+    if prefetch is None:
+        return await fetch()
+    return await prefetch.get(key, fetch)
@@ -0,0 +1,43 @@
+"""
+Progress of the stages of persona responses
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator
+
+from opentelemetry import trace
+
+ProgressListener = Callable[[str, dict[str, Any]], Awaitable[None]]
+"""Coroutine function called with the stage and details of progress events"""
+
+current_progress: ContextVar[ProgressListener | None] = ContextVar(
+    "current_progress", default=None
+)
+"""Listener for the progress of the response in progress"""
+
+
+@contextmanager
+def listening(listener: ProgressListener) -> Iterator[None]:
+    """
+    Have a listener receive the progress events reported in the context
+    :param listener: Listener for progress events
+    """
+    token = current_progress.set(listener)
+    try:
+        yield
+    finally:
+        current_progress.reset(token)
+
+
+async def report(stage: str, **details: Any) -> None:
+    """
+    Report a progress event to the current listener, if any, and record it as an
+    event of the current span
+    :param stage: Stage of the response, such as "plan-ready"
+    :param details: Details of the event, such as the tool called and the
+    seconds it took. Values must be usable as span attributes.
+    """
+    trace.get_current_span().add_event(f"progress.{stage}", details)
+    listener = current_progress.get()
+    if listener:
+        await listener(stage, details)
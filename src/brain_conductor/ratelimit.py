@@ -0,0 +1,356 @@
+"""
+Rate limiting of downstream API requests
+"""
+import asyncio
+import fcntl
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from contextlib import contextmanager
+from dataclasses import astuple, dataclass
+from typing import Iterator, Mapping
+
+from opentelemetry import trace
+
+from .errors import QuotaExceededError
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float | None:
+    """
+    Parse a duration in the format of rate limit reset headers, such as "1s",
+    "250ms" or "6m0s"
+    :param value: Duration text
+    :return: Seconds or None when the value is not a duration
+    """
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+@dataclass(slots=True)
+class LimiterValues:
+    """
+    Values of a rate limiter: token buckets for requests and tokens, each of
+    which refills continuously to its capacity over a minute, and the times until
+    which acquiring is paused or the quota is exceeded. Times are monotonic.
+    """
+
+    requests_per_minute: float
+    requests: float
+    tokens_per_minute: float
+    tokens: float
+    updated: float
+    paused_until: float = 0.0
+    quota_exceeded_until: float = 0.0
+
+    def refill(self, now: float) -> None:
+        """
+        Add the requests and tokens accrued since the last refill
+        :param now: Current monotonic time
+        """
+        elapsed = max(now - self.updated, 0) / 60
+        self.requests = min(
+            self.requests_per_minute, self.requests + elapsed * self.requests_per_minute
+        )
+        self.tokens = min(
+            self.tokens_per_minute, self.tokens + elapsed * self.tokens_per_minute
+        )
+        self.updated = now
+
+    def delay(self, tokens: float, now: float) -> float:
+        """
+        :param tokens: Tokens to take with a request
+        :param now: Current monotonic time
+        :return: Seconds until a request with the tokens may be made
+        """
+        missing_requests = max(1 - self.requests, 0)
+        missing_tokens = max(min(tokens, self.tokens_per_minute) - self.tokens, 0)
+        return max(
+            self.paused_until - now,
+            missing_requests * 60 / self.requests_per_minute,
+            missing_tokens * 60 / self.tokens_per_minute if missing_tokens else 0,
+        )
+
+
+class LimiterState:
+    """Rate limiter values held in worker memory"""
+
+    def __init__(self, values: LimiterValues) -> None:
+        """
+        :param values: Initial values
+        """
+        self._values = values
+
+    @contextmanager
+    def transaction(self) -> Iterator[LimiterValues]:
+        """
+        Read and modify the values atomically
+        :return: Context manager yielding the values to read and modify
+        """
+        yield self._values
+
+    def close(self) -> None:
+        """Release resources"""
+        pass
+
+
+class SharedLimiterState(LimiterState):
+    """
+    Rate limiter values in a memory-mapped file shared by all processes on a
+    host which use the same path. Transactions hold an exclusive lock on the
+    file, so every process sees the requests and tokens taken by the others.
+    """
+
+    MAGIC = 0x42434C494D495431
+    """Marker of an initialized file"""
+    FORMAT = struct.Struct("=Q7d")
+
+    def __init__(self, path: str, values: LimiterValues) -> None:
+        """
+        :param path: Path of the file. It is created if it does not exist.
+        :param values: Initial values used when the file is not initialized
+        """
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size < self.FORMAT.size:
+                    os.ftruncate(self._fd, self.FORMAT.size)
+                self._map = mmap.mmap(self._fd, self.FORMAT.size)
+                magic, *fields = self.FORMAT.unpack_from(self._map)
+                # Monotonic times from before a reboot are meaningless
+                if (
+                    magic != self.MAGIC
+                    or LimiterValues(*fields).updated > time.monotonic()
+                ):
+                    self.FORMAT.pack_into(self._map, 0, self.MAGIC, *astuple(values))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    @contextmanager
+    def transaction(self) -> Iterator[LimiterValues]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            _, *fields = self.FORMAT.unpack_from(self._map)
+            values = LimiterValues(*fields)
+            yield values
+            self.FORMAT.pack_into(self._map, 0, self.MAGIC, *astuple(values))
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+class RateLimiter:
+    """
+    Requests per minute and tokens per minute limits for a downstream API shared
+    by all callers in a worker, or by all workers on a host when the limiter is
+    shared. Callers acquire capacity before each request and wait in first come,
+    first served order when there is none.
+
+    Token counts are estimated before a request and settled with the actual
+    usage afterward. The limits adapt to the rate limit headers of responses
+    and acquiring pauses after a response reports the limit has been exceeded.
+    """
+
+    def __init__(
+        self, requests_per_minute: float, tokens_per_minute: float = math.inf
+    ) -> None:
+        """
+        :param requests_per_minute: Initial requests per minute limit
+        :param tokens_per_minute: Initial tokens per minute limit
+        """
+        self._state = LimiterState(
+            LimiterValues(
+                requests_per_minute,
+                requests_per_minute,
+                tokens_per_minute,
+                tokens_per_minute,
+                time.monotonic(),
+            )
+        )
+        self._queue = asyncio.Lock()
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def share(self, path: str) -> None:
+        """
+        Share the limiter with the other processes on the host which share a
+        limiter with the same path. The current values of this limiter are used
+        if no other process has shared the limiter yet.
+        :param path: Path of the file holding the limiter state
+        """
+        with self._state.transaction() as values:
+            state = SharedLimiterState(path, values)
+        self._state.close()
+        self._state = state
+
+    def close(self) -> None:
+        """Release the resources of a shared limiter"""
+        self._state.close()
+
+    @property
+    def requests_per_minute(self) -> float:
+        """
+        :return: Current requests per minute limit
+        """
+        with self._state.transaction() as values:
+            return values.requests_per_minute
+
+    @property
+    def tokens_per_minute(self) -> float:
+        """
+        :return: Current tokens per minute limit
+        """
+        with self._state.transaction() as values:
+            return values.tokens_per_minute
+
+    @property
+    def quota_exceeded(self) -> bool:
+        """
+        :return: Has the downstream quota been reported exceeded?
+        """
+        with self._state.transaction() as values:
+            return values.quota_exceeded_until > time.monotonic()
+
+    def set_limits(
+        self, requests_per_minute: float | None, tokens_per_minute: float | None
+    ) -> None:
+        """
+        Change the limits
+        :param requests_per_minute: Requests per minute limit or None to keep it
+        :param tokens_per_minute: Tokens per minute limit or None to keep it
+        """
+        with self._state.transaction() as values:
+            if requests_per_minute is not None:
+                values.requests_per_minute = max(requests_per_minute, 1)
+            if tokens_per_minute is not None:
+                values.tokens_per_minute = max(tokens_per_minute, 1)
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: Metrics of the limiter
+        """
+        with self._state.transaction() as values:
+            return {
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+                "requests_per_minute": values.requests_per_minute,
+                "tokens_per_minute": values.tokens_per_minute,
+            }
+
+    def try_acquire(self, tokens: int) -> float:
+        """
+        Take capacity for a request if there is enough
+        :param tokens: Estimated tokens the request will use
+        :return: 0 when the capacity was taken, otherwise seconds until there is
+        enough capacity
+        :raises QuotaExceededError: When the quota has been reported exceeded
+        """
+        now = time.monotonic()
+        with self._state.transaction() as values:
+            if values.quota_exceeded_until > now:
+                raise QuotaExceededError("Quota exceeded")
+            values.refill(now)
+            delay = values.delay(tokens, now)
+            if delay <= 0:
+                values.requests -= 1
+                values.tokens -= min(tokens, values.tokens_per_minute)
+            return max(delay, 0)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        Wait for capacity for a request
+        :param tokens: Estimated tokens the request will use
+        :return: Seconds waited
+        :raises QuotaExceededError: When the quota has been reported exceeded
+        """
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._queue:
+                while (delay := self.try_acquire(tokens)) > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if waited > 0.001:
+            trace.get_current_span().add_event(
+                "rate-limit-wait", {"wait.seconds": waited, "tokens": tokens}
+            )
+        return waited
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """
+        Correct the tokens taken for a request with its actual usage
+        :param estimated: Tokens acquired for the request
+        :param actual: Tokens the request used
+        """
+        with self._state.transaction() as values:
+            values.tokens += min(estimated, values.tokens_per_minute) - actual
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop granting capacity for a time
+        :param seconds: Seconds to pause
+        """
+        with self._state.transaction() as values:
+            values.paused_until = max(values.paused_until, time.monotonic() + seconds)
+
+    def exceed_quota(self, seconds: float) -> None:
+        """
+        Record that the downstream quota has been exceeded. Acquiring raises
+        QuotaExceededError for the time given.
+        :param seconds: Seconds until the quota may be available
+        """
+        with self._state.transaction() as values:
+            values.quota_exceeded_until = time.monotonic() + seconds
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """
+        Adapt to the rate limit headers of a response. Limits are adopted from
+        the headers and remaining capacity is lowered to what the headers report.
+        :param headers: Response headers
+        """
+        pause = 0.0
+        with self._state.transaction() as values:
+            for kind in ("requests", "tokens"):
+                limit = self._header_value(headers, f"x-ratelimit-limit-{kind}")
+                if limit is not None:
+                    setattr(values, f"{kind}_per_minute", max(limit, 1))
+                remaining = self._header_value(headers, f"x-ratelimit-remaining-{kind}")
+                if remaining is None:
+                    continue
+                setattr(values, kind, min(getattr(values, kind), remaining))
+                if remaining <= 0:
+                    reset = headers.get(f"x-ratelimit-reset-{kind}", "")
+                    pause = max(pause, parse_duration(reset) or 0)
+        pause = max(pause, self._header_value(headers, "retry-after") or 0)
+        if pause:
+            self.pause(pause)
+
+    @staticmethod
+    def _header_value(headers: Mapping[str, str], name: str) -> float | None:
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError):
+            return None
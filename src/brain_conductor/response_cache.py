@@ -0,0 +1,195 @@
+"""
+Cache of responses to the first inquiries of chat sessions
+"""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, TypeVar
+
+from opentelemetry import trace
+
+T = TypeVar("T")
+
+NEAR_DUPLICATE_MIN_WORDS = 4
+"""Words an inquiry needs before near duplicates of it are matched"""
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize an inquiry so that trivially different spellings match
+    :param text: Inquiry
+    :return: Lower case words of the inquiry separated by single spaces
+    """
+    return " ".join(re.findall(r"[\w']+", text.lower()))
+
+
+def simhash(text: str, bits: int = 64) -> int:
+    """
+    SimHash fingerprint of the words of a normalized text. Texts sharing most of
+    their words have fingerprints differing in few bits.
+    :param text: Normalized text
+    :param bits: Number of bits of the fingerprint
+    :return: Fingerprint
+    """
+    weights = [0] * bits
+    for word in set(text.split()):
+        digest = hashlib.blake2b(word.encode(), digest_size=bits // 8).digest()
+        value = int.from_bytes(digest, "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def approximate_size(value: object) -> int:
+    """
+    Approximate the memory taken by a cached value
+    :param value: Value
+    :return: Length of the representation of the value
+    """
+    return len(repr(value))
+
+
+@dataclass(slots=True)
+class _Entry(Generic[T]):
+    value: T
+    expires: float
+    fingerprint: int | None
+    size: int
+
+
+class ResponseCache(Generic[T]):
+    """
+    Bounded cache of responses by scope and normalized inquiry, where the scope
+    is what else the response depends on, such as the persona. Entries expire
+    after a time to live and the least recently used entries are evicted when the
+    cache holds too many entries or bytes. Optionally, an inquiry without an
+    entry matches the entry of a near duplicate in the same scope, whose SimHash
+    fingerprint differs in at most a given number of bits. The cache is disabled
+    by default.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl: float = 3600,
+        max_items: int = 1000,
+        max_distance: int = 0,
+        max_bytes: int = 10_000_000,
+        size: Callable[[T], int] = approximate_size,
+    ) -> None:
+        """
+        :param enabled: Cache responses?
+        :param ttl: Seconds an entry is used for
+        :param max_items: Maximum number of entries
+        :param max_distance: Maximum number of bits in which the fingerprints
+        of near duplicates differ. 0 matches exact normalized inquiries only.
+        :param max_bytes: Maximum total size of the entries. Responses larger
+        than this are not cached.
+        :param size: Function approximating the size of a response in bytes
+        """
+        self.enabled = enabled
+        self._ttl = ttl
+        self._max_items = max_items
+        self._max_distance = max_distance
+        self._max_bytes = max_bytes
+        self._size = size
+        self._entries: OrderedDict[tuple[Hashable, str], _Entry[T]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: Cache metrics
+        """
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "items": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+    def _fingerprint(self, text: str) -> int | None:
+        if not self._max_distance or len(text.split()) < NEAR_DUPLICATE_MIN_WORDS:
+            return None
+        return simhash(text)
+
+    def get(self, scope: Hashable, inquiry: str) -> T | None:
+        """
+        Get the cached response to an inquiry
+        :param scope: What else the response depends on
+        :param inquiry: Inquiry
+        :return: Cached response or None
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        text = normalize(inquiry)
+        key = (scope, text)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= now:
+            self._remove(key)
+            entry = None
+        outcome = "hit"
+        if entry is None:
+            entry = self._near_duplicate(scope, text, now)
+            outcome = "near-hit"
+        if entry is None:
+            self.misses += 1
+            trace.get_current_span().add_event("response-cache", {"outcome": "miss"})
+            return None
+        if outcome == "hit":
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.near_hits += 1
+        trace.get_current_span().add_event("response-cache", {"outcome": outcome})
+        return entry.value
+
+    def _near_duplicate(
+        self, scope: Hashable, text: str, now: float
+    ) -> _Entry[T] | None:
+        fingerprint = self._fingerprint(text)
+        if fingerprint is None:
+            return None
+        for (entry_scope, _), entry in self._entries.items():
+            if (
+                entry_scope == scope
+                and entry.fingerprint is not None
+                and entry.expires > now
+                and (entry.fingerprint ^ fingerprint).bit_count() <= self._max_distance
+            ):
+                return entry
+        return None
+
+    def put(self, scope: Hashable, inquiry: str, response: T) -> None:
+        """
+        Cache the response to an inquiry
+        :param scope: What else the response depends on
+        :param inquiry: Inquiry
+        :param response: Response
+        """
+        if not self.enabled:
+            return
+        size = self._size(response)
+        if size > self._max_bytes:
+            return
+        text = normalize(inquiry)
+        key = (scope, text)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(
+            response, time.monotonic() + self._ttl, self._fingerprint(text), size
+        )
+        self._bytes += size
+        while len(self._entries) > self._max_items or self._bytes > self._max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: tuple[Hashable, str]) -> None:
+        self._bytes -= self._entries.pop(key).size
@@ -0,0 +1,145 @@
+"""
+Retrying of failed downstream requests within a time budget
+"""
+import asyncio
+import functools
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, Mapping, ParamSpec, TypeVar
+
+from opentelemetry import trace
+
+from .errors import RetryBudgetExhaustedError
+from .metrics import RETRIES
+
+DEFAULT_BUDGET_SECONDS = 30.0
+"""Retry budget of calls made outside an inquiry"""
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class RetryBudget:
+    """
+    Time available for retrying the failed requests of an inquiry. All retries
+    made while processing the inquiry draw on the same budget, so a downstream
+    outage delays the inquiry by at most the budget.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        """
+        :param seconds: Seconds from now in which retries may be made
+        """
+        self._expires = time.monotonic() + seconds
+        self.retries = 0
+        self.wasted_seconds = 0.0
+
+    @property
+    def remaining(self) -> float:
+        """
+        :return: Seconds left for retries
+        """
+        return max(self._expires - time.monotonic(), 0)
+
+    def record(self, span: trace.Span) -> None:
+        """
+        Record the retries made on a tracing span
+        :param span: Span of the inquiry
+        """
+        span.set_attribute("retry.count", self.retries)
+        span.set_attribute("retry.wasted_seconds", self.wasted_seconds)
+
+
+current_retry_budget: ContextVar[RetryBudget] = ContextVar("current_retry_budget")
+"""Retry budget of the inquiry being processed"""
+
+
+def retry_after(error: BaseException) -> float | None:
+    """
+    Get the delay a server asked for before retrying, from the headers of the
+    error or of the errors it was raised from
+    :param error: Error raised by a request
+    :return: Seconds to wait or None when the server gave no hint
+    """
+    seen = set()
+    errors: list[object] = [error]
+    while errors:
+        item = errors.pop()
+        if id(item) in seen or not isinstance(item, BaseException):
+            continue
+        seen.add(id(item))
+        headers = getattr(item, "headers", None)
+        if isinstance(headers, Mapping):
+            for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1)):
+                try:
+                    return float(headers[name]) * scale
+                except (KeyError, ValueError):
+                    pass
+        errors.extend((item.__cause__, item.__context__, *item.args))
+    return None
+
+
+def retry(
+    exceptions: type[BaseException] | tuple[type[BaseException], ...],
+    base: float = 0.5,
+    cap: float = 8.0,
+) -> Callable[
+    [Callable[P, Coroutine[Any, Any, T]]], Callable[P, Coroutine[Any, Any, T]]
+]:
+    """
+    Decorator retrying a coroutine function while it raises the given
+    exceptions. The delay before each retry is the one the server asked for or a
+    random delay between 0 and an exponentially growing ceiling (full jitter).
+    Retries stop when the delay would exceed the current retry budget.
+    :param exceptions: Exceptions which are retried
+    :param base: Ceiling of the first delay in seconds
+    :param cap: Maximum ceiling of the delays in seconds
+    :return: Decorator
+    :raises RetryBudgetExhaustedError: When the budget is too small to retry
+    """
+
+    def decorator(
+        function: Callable[P, Coroutine[Any, Any, T]]
+    ) -> Callable[P, Coroutine[Any, Any, T]]:
+        @functools.wraps(function)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            budget = current_retry_budget.get(None)
+            attempt = 0
+            while True:
+                start = time.monotonic()
+                try:
+                    return await function(*args, **kwargs)
+                except exceptions as e:
+                    if budget is None:
+                        budget = RetryBudget(DEFAULT_BUDGET_SECONDS)
+                    attempt += 1
+                    delay = retry_after(e)
+                    if delay is None:
+                        delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+                    budget.wasted_seconds += time.monotonic() - start
+                    if delay >= budget.remaining:
+                        trace.get_current_span().add_event(
+                            "retry-budget-exhausted",
+                            {"function": function.__qualname__, "error": repr(e)},
+                        )
+                        raise RetryBudgetExhaustedError(
+                            f"No time left to retry {function.__qualname__}"
+                        ) from e
+                    trace.get_current_span().add_event(
+                        "retry",
+                        {
+                            "function": function.__qualname__,
+                            "attempt": attempt,
+                            "delay": delay,
+                            "error": repr(e),
+                        },
+                    )
+                    budget.retries += 1
+                    RETRIES.inc(operation=function.__qualname__)
+                    budget.wasted_seconds += delay
+                    await asyncio.sleep(delay)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,207 @@
+"""
+Storage of chat session state. Stores allow a session to be resumed after the
+worker which held it in memory has discarded it, or by a different worker.
+"""
+import abc
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+LOGGER = logging.getLogger("Brain Conductor")
+
+
+class SessionStore(abc.ABC):
+    """
+    Abstract base class for session state stores. Entries expire when they have
+    not been written for the store's time to live.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        """
+        :param ttl: Seconds after its last write that an entry expires
+        """
+        self._ttl = ttl
+
+    @abc.abstractmethod
+    async def get(self, session_id: str) -> dict | None:
+        """
+        Get the state of a session
+        :param session_id: Unique identifier of the session
+        :return: Session state or None if there is no unexpired state
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, session_id: str, state: dict) -> None:
+        """
+        Store the state of a session. Stores may write asynchronously, but a get
+        following the put in the same worker returns the state.
+        :param session_id: Unique identifier of the session
+        :param state: JSON serializable session state
+        """
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        """Complete pending writes"""
+        pass
+
+    async def close(self) -> None:
+        """Complete pending writes and release resources"""
+        await self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Store keeping session state in worker memory. The least recently used entries
+    are evicted when the store is full.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 10_000) -> None:
+        """
+        :param ttl: Seconds after its last write that an entry expires
+        :param max_entries: Maximum number of entries to keep
+        """
+        super().__init__(ttl)
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, session_id: str) -> dict | None:
+        item = self._entries.get(session_id)
+        if item is None:
+            return None
+        expires, state = item
+        if expires < time.monotonic():
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return state
+
+    def put(self, session_id: str, state: dict) -> None:
+        self._entries[session_id] = (time.monotonic() + self._ttl, state)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store keeping session state in a SQLite database in write-ahead logging mode.
+    All workers on a host configured with the same database path share sessions.
+
+    Writes are queued and written in batches by a background task. Only the
+    latest state of a session is written. Database access happens on a dedicated
+    thread so the event loop is never blocked.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        flush_interval: float = 0.05,
+        batch_size: int = 100,
+    ) -> None:
+        """
+        :param path: Path of the SQLite database file
+        :param ttl: Seconds after its last write that an entry expires
+        :param flush_interval: Maximum seconds a write is queued
+        :param batch_size: Number of queued writes which triggers writing early
+        """
+        super().__init__(ttl)
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._pending: dict[str, str] = {}
+        self._flushing: dict[str, str] = {}
+        self._flush_requested = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="session-store")
+        self._connection = self._executor.submit(self._connect, path).result()
+        self._last_expired = 0.0
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, state TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        return connection
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args
+        )
+
+    def _select(self, session_id: str) -> str | None:
+        row = self._connection.execute(
+            "SELECT state FROM sessions WHERE id = ? AND expires > ?",
+            (session_id, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _write(self, states: dict[str, str], expire: bool) -> None:
+        now = time.time()
+        expires = now + self._ttl
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany(
+                "INSERT INTO sessions (id, state, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "state = excluded.state, expires = excluded.expires",
+                [(session_id, state, expires) for session_id, state in states.items()],
+            )
+            if expire:
+                self._connection.execute(
+                    "DELETE FROM sessions WHERE expires <= ?", (now,)
+                )
+
+    async def get(self, session_id: str) -> dict | None:
+        state = self._pending.get(session_id) or self._flushing.get(session_id)
+        if state is None:
+            state = await self._run(self._select, session_id)
+        return json.loads(state) if state else None
+
+    def put(self, session_id: str, state: dict) -> None:
+        self._pending[session_id] = json.dumps(state)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(
+                self._write_pending(), name="session-store-writer"
+            )
+        if len(self._pending) >= self._batch_size:
+            self._flush_requested.set()
+
+    async def _write_pending(self) -> None:
+        while self._pending:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), self._flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            self._flushing, self._pending = self._pending, {}
+            expire = time.monotonic() - self._last_expired > self._ttl
+            if expire:
+                self._last_expired = time.monotonic()
+            try:
+                await self._run(self._write, self._flushing, expire)
+            except sqlite3.Error as e:
+                LOGGER.error(f"Failed to write {len(self._flushing)} sessions: {e}")
+            finally:
+                self._flushing = {}
+
+    async def flush(self) -> None:
+        if self._writer and not self._writer.done():
+            self._flush_requested.set()
+            await self._writer
+
+    async def close(self) -> None:
+        await self.flush()
+        await self._run(self._connection.close)
+        self._executor.shutdown()
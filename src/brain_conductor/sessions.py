@@ -0,0 +1,246 @@
+"""
+Chat sessions which outlive their websocket connections
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+from .inquiries import InquiryManager, InquiryContextManager
+from .memo import ToolMemo
+from .session_store import SessionStore
+from .utils import TaskManager
+
+if TYPE_CHECKING:
+    from .chat import InquiryTasks
+    from .outbox import Outbox
+
+
+class ChatSession:
+    """
+    State of a chat session. Every frame sent to the client is given a sequence
+    number and the frames worth replaying are kept so a client which reconnects
+    can be sent only the frames it missed.
+
+    The inquiries of a session run as tasks of the session rather than of a
+    connection, so an inquiry answered while the client is reconnecting is
+    replayed once it resumes the session. They are cancelled when the session
+    is closed.
+    """
+
+    def __init__(
+        self, session_id: str, icm: InquiryContextManager, replay_frames: int
+    ) -> None:
+        """
+        :param session_id: Unique identifier of the session
+        :param icm: Inquiry context manager for the session
+        :param replay_frames: Maximum number of frames kept for replay
+        """
+        self.id = session_id
+        self.icm = icm
+        self.connections = 0
+        self.detached_at: float | None = None
+        self.version = 0
+        self.inquiry_lock = asyncio.Lock()
+        self.tokens_saved = 0
+        self.tool_memo = ToolMemo()
+        self.tasks = TaskManager().__enter__()
+        self.inquiries: InquiryTasks | None = None
+        """Inquiries in progress, once a connection received one"""
+        self.outbox: Outbox | None = None
+        """Outbox of the connection using the session, if any"""
+        self._seq = 0
+        self._frames: deque[tuple[int, str]] = deque(maxlen=replay_frames)
+
+    @property
+    def last_seq(self) -> int:
+        """
+        :return: Sequence number of the last frame sent
+        """
+        return self._seq
+
+    def frame(self, payload: dict, replay: bool = False) -> str:
+        """
+        Serialize a frame for the client with the next sequence number
+        :param payload: Frame data
+        :param replay: Keep the frame to replay to a reconnecting client
+        :return: Serialized frame
+        """
+        self._seq += 1
+        frame = json.dumps({**payload, "seq": self._seq})
+        if replay:
+            self._frames.append((self._seq, frame))
+        return frame
+
+    def catch_up(self, seq: int) -> None:
+        """
+        Number the next frames after a sequence number the client has received.
+        A session restored from a stored state older than its last frames would
+        otherwise reuse sequence numbers the client discards as duplicates.
+        :param seq: Sequence number of the last frame received by the client
+        """
+        self._seq = max(self._seq, seq)
+
+    def frames_since(self, seq: int) -> list[str]:
+        """
+        Get the kept frames sent after a sequence number
+        :param seq: Sequence number of the last frame received by the client
+        :return: Serialized frames in the order they were sent
+        """
+        return [frame for frame_seq, frame in self._frames if frame_seq > seq]
+
+    def close(self) -> None:
+        """
+        Cancel the tasks of the session, such as its inquiries in progress
+        """
+        self.tasks.__exit__(None, None, None)
+
+    def export_state(self) -> dict:
+        """
+        Export the session state so that it can be stored and restored
+        :return: JSON serializable session state
+        """
+        return {
+            "version": self.version,
+            "seq": self._seq,
+            "frames": list(self._frames),
+            "inquiries": self.icm.export_state(),
+        }
+
+    def restore_state(self, state: dict) -> None:
+        """
+        Restore the session state exported by export_state, except the inquiry
+        context which is hydrated when it is created
+        :param state: Exported session state
+        """
+        self.version = state["version"]
+        self._seq = state["seq"]
+        self._frames.extend((seq, frame) for seq, frame in state["frames"])
+
+
+current_session: ContextVar[ChatSession] = ContextVar("current_session")
+"""Chat session of the websocket being handled"""
+
+
+class SessionManager:
+    """
+    Registry of the chat sessions of a worker. Sessions without a connection are
+    kept for a grace period in which the client may resume them. Session state is
+    saved to a session store so sessions may also be resumed after the grace
+    period or by other workers sharing the store.
+    """
+
+    def __init__(
+        self,
+        inquiry_manager: InquiryManager,
+        grace_period: float = 300,
+        replay_frames: int = 50,
+        store: SessionStore | None = None,
+    ) -> None:
+        """
+        :param inquiry_manager: Inquiry manager which provides the sessions'
+        inquiry context managers
+        :param grace_period: Seconds a session without a connection may be resumed
+        :param replay_frames: Maximum number of frames kept per session for replay
+        :param store: Store for session state. When None, sessions can only be
+        resumed from this worker within the grace period.
+        """
+        self._inquiry_manager = inquiry_manager
+        self._grace_period = grace_period
+        self._replay_frames = replay_frames
+        self._store = store
+        self._sessions: dict[str, ChatSession] = {}
+        self._detached: OrderedDict[str, ChatSession] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self) -> ChatSession:
+        """
+        Create a session
+        :return: The new session
+        """
+        self._expire()
+        session = ChatSession(
+            uuid.uuid4().hex,
+            self._inquiry_manager.create_context(),
+            self._replay_frames,
+        )
+        self._sessions[session.id] = session
+        return session
+
+    async def resume(self, session_id: str) -> ChatSession | None:
+        """
+        Get a session which has not expired. Sessions are hydrated from the store
+        when they are not in this worker or the store has a newer version.
+        :param session_id: Unique identifier of the session
+        :return: The session or None when it does not exist or has expired
+        """
+        self._expire()
+        session = self._sessions.get(session_id)
+        state = None
+        if self._store and session_id and (session is None or not session.connections):
+            state = await self._store.get(session_id)
+        if state and (session is None or state["version"] > session.version):
+            if session:
+                session.close()
+            session = ChatSession(
+                session_id,
+                self._inquiry_manager.create_context(state["inquiries"]),
+                self._replay_frames,
+            )
+            session.restore_state(state)
+            self._sessions[session_id] = session
+        if session:
+            session.detached_at = None
+            self._detached.pop(session_id, None)
+        return session
+
+    def save(self, session: ChatSession) -> None:
+        """
+        Save the session state to the session store
+        :param session: Session to save
+        """
+        if self._store:
+            session.version += 1
+            self._store.put(session.id, session.export_state())
+
+    async def close(self) -> None:
+        """Complete pending session store writes"""
+        if self._store:
+            await self._store.close()
+
+    def attach(self, session: ChatSession) -> None:
+        """
+        Record a connection using the session
+        :param session: Session being used
+        """
+        session.connections += 1
+        session.detached_at = None
+        self._detached.pop(session.id, None)
+
+    def detach(self, session: ChatSession) -> None:
+        """
+        Record a connection no longer using the session. The grace period starts
+        when the session has no connections.
+        :param session: Session no longer used
+        """
+        session.connections -= 1
+        self.save(session)
+        if session.connections <= 0:
+            session.detached_at = time.monotonic()
+            self._detached[session.id] = session
+            self._detached.move_to_end(session.id)
+
+    def _expire(self) -> None:
+        expires_before = time.monotonic() - self._grace_period
+        while self._detached:
+            session = next(iter(self._detached.values()))
+            if session.detached_at is None or session.detached_at > expires_before:
+                break
+            self._detached.popitem(last=False)
+            del self._sessions[session.id]
+            session.close()
@@ -0,0 +1,153 @@
+"""
+Speculative generation of the primary persona's response while an inquiry is
+routed
+"""
+import asyncio
+import time
+
+from opentelemetry.trace.span import Span
+
+from .deadline import Deadline
+from .inquiries import InquiryContextManager, InquiryResponse
+from .metrics import responding
+from .personas import Persona
+
+
+class Speculation:
+    """Response of a guessed primary persona being generated during routing"""
+
+    def __init__(
+        self,
+        icm: InquiryContextManager,
+        persona: Persona,
+        inquiry: str,
+        deadline: Deadline,
+    ) -> None:
+        """
+        :param icm: Inquiry context manager for the session
+        :param persona: Guessed primary persona
+        :param inquiry: Inquiry to send
+        :param deadline: Deadline of the inquiry
+        """
+        self.persona = persona
+        self._icm = icm
+        self._inquiry = inquiry
+        self._start = time.monotonic()
+        self.routing_seconds = 0.0
+        self.generation_seconds: float | None = None
+        self._task = asyncio.ensure_future(self._generate(deadline))
+        # The error of a discarded speculation is of no interest
+        self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _generate(self, deadline: Deadline) -> InquiryResponse:
+        with responding(self.persona.prompt_name):
+            response = await self._icm.speculate(self.persona, self._inquiry, deadline)
+        self.generation_seconds = time.monotonic() - self._start
+        return response
+
+    def routed(self) -> None:
+        """Record that routing has completed"""
+        self.routing_seconds = time.monotonic() - self._start
+
+    def cancel(self) -> None:
+        """Discard the speculation"""
+        self._task.cancel()
+
+    async def response(self) -> InquiryResponse:
+        """
+        Wait for the response and record it with the inquiry in the chat history
+        :return: Response of the persona
+        """
+        response = await self._task
+        self._icm.adopt(self.persona, self._inquiry, response)
+        return response
+
+
+class Speculator:
+    """
+    Starts generating the response of a locally guessed primary persona while
+    the LLM routes an inquiry. The response is kept when routing chooses the
+    guessed persona and discarded otherwise, at the cost of the tokens spent on
+    it. Only personas without agents are speculated on, as agents call tools and
+    generate images.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        """
+        :param enabled: Speculate on the primary persona?
+        """
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+
+    def start(
+        self, icm: InquiryContextManager, inquiry: str, deadline: Deadline
+    ) -> Speculation | None:
+        """
+        Start generating the response of the likely primary persona
+        :param icm: Inquiry context manager for the session
+        :param inquiry: Inquiry to send
+        :param deadline: Deadline of the inquiry
+        :return: Speculation or None when there is no persona to speculate on
+        """
+        if not self.enabled:
+            return None
+        persona = icm.guess_primary(inquiry)
+        if persona is None or persona.agent:
+            return None
+        return Speculation(icm, persona, inquiry, deadline)
+
+    def resolve(
+        self, speculation: Speculation, primary: Persona | None, span: Span
+    ) -> Speculation | None:
+        """
+        Compare a speculation with the primary persona chosen by routing,
+        cancelling it when they differ
+        :param speculation: Speculation started before routing
+        :param primary: Primary persona chosen by routing
+        :param span: Tracing span of the inquiry
+        :return: The speculation when it is to be kept or None
+        """
+        speculation.routed()
+        hit = primary is speculation.persona
+        span.set_attribute("speculation.persona", speculation.persona.prompt_name)
+        span.set_attribute("speculation.hit", hit)
+        if hit:
+            self.hits += 1
+            return speculation
+        self.misses += 1
+        self.wasted_seconds += (
+            speculation.generation_seconds or speculation.routing_seconds
+        )
+        speculation.cancel()
+        return None
+
+    async def response(self, speculation: Speculation, span: Span) -> InquiryResponse:
+        """
+        Wait for the response of a kept speculation
+        :param speculation: Speculation kept by resolve
+        :param span: Tracing span of the inquiry
+        :return: Response of the persona
+        """
+        response = await speculation.response()
+        # Without speculation, generation would have started once routing completed
+        saved = min(speculation.routing_seconds, speculation.generation_seconds or 0)
+        self.latency_saved_seconds += saved
+        span.set_attribute("speculation.latency_saved_seconds", saved)
+        return response
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: Speculation metrics
+        """
+        speculations = self.hits + self.misses
+        return {
+            "speculations": speculations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / speculations if speculations else 0.0,
+            "latency_saved_seconds": self.latency_saved_seconds,
+            "wasted_seconds": self.wasted_seconds,
+        }
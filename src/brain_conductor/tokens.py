@@ -0,0 +1,159 @@
+"""
+Token counting and prompt budgeting
+"""
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Hashable, Sequence
+
+import tiktoken
+
+from .errors import TooManyTokensError
+
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_CONTEXT_WINDOW = 4096
+
+CONTEXT_WINDOWS: dict[str, int] = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "text-davinci-002": 4097,
+    "text-davinci-003": 4097,
+}
+"""
+Context window size in tokens by model name. Dated model snapshots such as
+gpt-4-0613 resolve to the longest registered name they start with.
+"""
+
+
+def register_context_window(model: str, tokens: int) -> None:
+    """
+    Register or replace the context window size of a model
+    :param model: Model name or model name prefix
+    :param tokens: Maximum number of tokens the model accepts for prompt and
+    completion combined
+    """
+    CONTEXT_WINDOWS[model] = tokens
+    context_window.cache_clear()
+    get_ledger.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def context_window(model: str) -> int:
+    """
+    Get the context window size of a model
+    :param model: Model name
+    :return: Context window size in tokens
+    """
+    if model in CONTEXT_WINDOWS:
+        return CONTEXT_WINDOWS[model]
+    prefixes = [name for name in CONTEXT_WINDOWS if model.startswith(f"{name}-")]
+    if prefixes:
+        return CONTEXT_WINDOWS[max(prefixes, key=len)]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """
+    Get the tokenizer for a model. Encoders are loaded once per model. Models
+    unknown to tiktoken use the cl100k_base encoding.
+    :param model: Model name
+    :return: Tokenizer
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def num_tokens_from_string(string: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Returns the number of tokens in a text string.
+    :raises TooManyTokensError: when the string exceeds the model's context window
+    """
+    num_tokens = len(get_encoding(model).encode(string))
+    if num_tokens > context_window(model):
+        raise TooManyTokensError()
+    return num_tokens
+
+
+class TokenLedger:
+    """
+    Token accounting for prompts sent to a single model. Use get_ledger to share
+    one ledger, and its encoder, per model.
+    """
+
+    MESSAGE_OVERHEAD = 3
+    """Tokens the chat format adds to each message"""
+    NAME_OVERHEAD = 1
+    """Tokens the chat format adds for a message with a name"""
+    REPLY_OVERHEAD = 3
+    """Tokens the chat format adds to prime the reply"""
+
+    def __init__(self, model: str, completion_tokens: int = 256) -> None:
+        """
+        :param model: Model name
+        :param completion_tokens: Tokens reserved in the context window for the
+        completion
+        """
+        self.model = model
+        self.context_window = context_window(model)
+        self.completion_tokens = completion_tokens
+        self._memo: dict[Hashable, int] = {}
+
+    def count(self, text: str) -> int:
+        """
+        Count the tokens in a text string
+        :param text: Text to count
+        :return: Number of tokens
+        """
+        return len(get_encoding(self.model).encode(text))
+
+    def count_message(self, message: dict[str, str], key: Hashable = None) -> int:
+        """
+        Count the tokens a chat message adds to a prompt
+        :param message: Chat message
+        :param key: When provided, the count is remembered under this key and not
+        calculated again. Only use for messages whose content is fixed for the key.
+        :return: Number of tokens
+        """
+        if key is not None and key in self._memo:
+            return self._memo[key]
+        tokens = self.MESSAGE_OVERHEAD
+        for name, value in message.items():
+            tokens += self.count(value)
+            if name == "name":
+                tokens += self.NAME_OVERHEAD
+        if key is not None:
+            self._memo[key] = tokens
+        return tokens
+
+    def prompt_budget(self, used: int) -> int:
+        """
+        Get the tokens left for history in a prompt
+        :param used: Tokens already used by messages that must be sent
+        :return: Tokens remaining. Negative when the required messages do not fit.
+        """
+        return self.context_window - self.completion_tokens - self.REPLY_OVERHEAD - used
+
+    @staticmethod
+    def fit(counts: Sequence[int], budget: int) -> int:
+        """
+        Find the largest recent window of items which fits in a budget.
+        :param counts: Token counts of the items, oldest first
+        :param budget: Tokens available
+        :return: Number of most recent items which fit
+        """
+        return bisect_right(list(accumulate(reversed(counts))), budget)
+
+
+@lru_cache(maxsize=None)
+def get_ledger(model: str) -> TokenLedger:
+    """
+    Get the shared token ledger for a model
+    :param model: Model name
+    :return: Token ledger
+    """
+    return TokenLedger(model)
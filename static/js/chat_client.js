@@ -10,6 +10,13 @@
  * {@see onSystemMessage}: Receiving a message from the chat server
  * {@see onEchoMessage}: Receiving the message sent via {@see sendMessage}
  * as received by the chat server.
+ * {@see onInquiryCancelled}: The response to a message was cancelled via
+ * {@see cancel} or superseded by a later message.
+ *
+ * The server assigns each connection a session. When reconnecting, the client
+ * resumes its session and the server replays only the messages it missed. When
+ * the session can no longer be resumed, the client sends its message history
+ * to restore the conversation context.
  */
 class ChatDataItem {
     constructor(content, type, encoding, mimeType) {
@@ -32,6 +39,8 @@ class ChatClient {
         this.messageQueue = []
         this.unrespondedInquiryIds = []
         this.messageID = 0;
+        this.sessionID = null;
+        this.lastSeq = 0;
     }
 
     /**
@@ -39,7 +48,15 @@ class ChatClient {
      */
     connect() {
         let connecting = true;
-        this.websocket = new WebSocket(this.uri);
+        let uri = this.uri;
+        if (this.sessionID !== null) {
+            const params = new URLSearchParams({
+                session_id: this.sessionID,
+                last_seq: this.lastSeq
+            });
+            uri += `?${params}`;
+        }
+        this.websocket = new WebSocket(uri);
         this.websocket.addEventListener("message", this.onMessage.bind(this));
         this.websocket.addEventListener("open", this.connectedHandler.bind(this));
         this.websocket.addEventListener("error", this.connectionErrorHandler.bind(this));
@@ -51,10 +68,26 @@ class ChatClient {
      */
     connectedHandler() {
         this.connectBackoffLevel = 0;
-        this.processMessageQueue();
         this.onConnected();
     }
 
+    /**
+     * Handler for the session message sent by the server upon connecting.
+     * Queued messages are sent once the session is known.
+     * @param message Session message
+     * @private
+     */
+    sessionHandler(message) {
+        if (!message.resumed) {
+            if (this.sessionID !== null && this.botMessageHistory.length > 0) {
+                this.websocket.send(this.getReconnectMessage());
+            }
+            this.lastSeq = 0;
+        }
+        this.sessionID = message.id;
+        this.processMessageQueue();
+    }
+
     /**
      * Handler for websocket connection errors
      * @private
@@ -78,15 +111,38 @@ class ChatClient {
     /**
      * Send a chat message from the site user
      * @param message
+     * @param {boolean} [supersede=false] Cancel the responses to previous
+     * messages which are still in progress
      * @return {string} Unique message identifier
      */
-    sendMessage(message) {
+    sendMessage(message, supersede = false) {
         const messageID = this.messageID++;
-        const socketMessage = JSON.stringify({
+        this.send(JSON.stringify({
             id: messageID,
             type: "inquiry",
-            text: message
-        });
+            text: message,
+            supersede: supersede
+        }));
+        return messageID;
+    }
+
+    /**
+     * Cancel the response to a chat message which is still in progress
+     * @param {string} messageID Unique identifier of the message
+     */
+    cancel(messageID) {
+        this.send(JSON.stringify({
+            id: messageID,
+            type: "cancel"
+        }));
+    }
+
+    /**
+     * Send a message to the websocket, queueing it until connected
+     * @param {string} socketMessage Serialized message
+     * @private
+     */
+    send(socketMessage) {
         // noinspection FallThroughInSwitchStatementJS
         switch (this.websocket.readyState) {
             case this.websocket.OPEN:
@@ -97,12 +153,10 @@ class ChatClient {
                 console.log("Websocket is not open. Reconnecting...");
                 this.connect();
             case this.websocket.CONNECTING:
-                this.messageQueue.push(this.getReconnectMessage());
                 this.messageQueue.push(socketMessage);
                 this.onDisconnected();
                 break;
         }
-        return messageID;
     }
 
     /**
@@ -124,42 +178,82 @@ class ChatClient {
      */
     onMessage(event) {
         const message = JSON.parse(event.data);
+        if (message.seq !== undefined) {
+            if (message.seq <= this.lastSeq) {
+                // Already received before reconnecting
+                return;
+            }
+            this.lastSeq = message.seq;
+        }
+        this.handleMessage(message);
+    }
+
+    /**
+     * Handle a message received from the websocket
+     * @param {Object} message Parsed message
+     * @private
+     */
+    handleMessage(message) {
         switch (message.type) {
+            case "session":
+                this.sessionHandler(message);
+                break;
+            case "batch":
+                message.frames.forEach((frame) => this.handleMessage(frame));
+                break;
             case "bot-message":
                 this.botMessageHistory.push({
                     from: message.from,
                     text: message.text,
                 });
-                const chatData = message.data.map((item) => {
-                    return new ChatDataItem(
-                        item.content,
-                        item.type,
-                        item.encoding,
-                        item.mimeType
-                    )
-                });
                 this.onChatMessage(
                     message.id,
                     message.from,
                     message.text,
                     message.avatar,
-                    chatData
+                    this.getChatData(message)
                 );
                 break;
+            case "bot-message-data":
+                this.onChatMessageData(message.id, message.from, this.getChatData(message));
+                break;
             case "system-message":
                 this.onSystemMessage(message.id, message.text);
                 break;
             case "experts-list":
                 this.onMembersListMessage(message.experts);
                 break;
+            case "inquiry-cancelled":
+                this.onInquiryCancelled(message.id, message.tokensSaved);
+                break;
             case "preparing-response":
                 this.onPreparingResponse(message.from, message.greeting);
                 break;
+            case "progress":
+                this.onProgress(message.from, message.stage, message);
+                break;
             case "error":
                 console.log(message.id, message.text)
         }
     }
 
+    /**
+     * Get the data items of a message
+     * @param {Object} message Parsed message
+     * @returns {[ChatDataItem]} Data items
+     * @private
+     */
+    getChatData(message) {
+        return message.data.map((item) => {
+            return new ChatDataItem(
+                item.content,
+                item.type,
+                item.encoding,
+                item.mimeType
+            )
+        });
+    }
+
     /**
      * Get the message to send the websocket when a reconnect occurs
      * @returns {string} Reconnect message
@@ -190,6 +284,26 @@ class ChatClient {
     onChatMessage(id, from, text, avatar, data) {
     }
 
+    /**
+     * Function called when data for a message from one of the bots is received.
+     * Data is sent after the message text.
+     * @param {string} id Unique identifier for the original inquiry message
+     * @param {string} from Bot from which the message was sent
+     * @param {[ChatDataItem]} data Data associated with the message
+     * @interface
+     */
+    onChatMessageData(id, from, data) {
+    }
+
+    /**
+     * Function called when the response to a chat message is cancelled
+     * @param {string} id Unique identifier for the cancelled message
+     * @param {number} tokensSaved Estimate of the tokens saved by cancelling
+     * @interface
+     */
+    onInquiryCancelled(id, tokensSaved) {
+    }
+
     /**
      * Function called when a system message is received.
      * @param {string} id Unique identifier for message
@@ -229,6 +343,19 @@ class ChatClient {
      * */
     onPreparingResponse(from, greeting) {
     }
+
+    /**
+     * Function called when a bot preparing a response makes progress, such as
+     * having planned its tool calls or having finished calling a tool
+     * @param {string} from The bot preparing a message
+     * @param {string} stage Stage of the response, such as "plan-ready",
+     * "tool-started", "tool-finished", "prompt-expanded" or "image-queued"
+     * @param {Object} details Details of the stage, such as the tool and the
+     * seconds it took
+     * @interface
+     */
+    onProgress(from, stage, details) {
+    }
 }
 
 export {ChatClient, ChatDataItem};
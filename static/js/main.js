@@ -4,6 +4,8 @@ import {onChatMessageSent, onChatMessageResponseDelivered} from "./measurement.j
 const mediatorName = "Brain Conductor"
 const chatBox = document.getElementById("chat_container");
 const chatMembers = [];
+// Bot message elements by inquiry ID and sender, for data sent after the text
+const botMessages = new Map();
 const typingIndicator = document.getElementById('typing-indicator');
 const connectIssueIndicator = document.getElementById('connection-issue-indicator');
 // Main brain default message
@@ -80,6 +82,21 @@ function addBotMessage(from, text, avatar, data) {
     }
     botMessageContainer.appendChild(botAvatar);
     botMessageContainer.appendChild(botMessage);
+    addBotMessageData(botMessage, data);
+    botBubble.appendChild(botMessageContainer);
+    chatBox.appendChild(botBubble);
+    if (isScrollAtBottom) {
+        chatBox.lastElementChild.scrollIntoView();
+    }
+    return botMessage;
+}
+
+/**
+ * Add data items to a bot message
+ * @param {HTMLElement} botMessage The message element returned by addBotMessage
+ * @param {[ChatDataItem]} data
+ */
+function addBotMessageData(botMessage, data) {
     data.forEach((dataItem) => {
         if (dataItem.type === "image") {
             modalIndex += 1
@@ -109,12 +126,6 @@ function addBotMessage(from, text, avatar, data) {
             );
         }
     });
-    botBubble.appendChild(botMessageContainer);
-    chatBox.appendChild(botBubble);
-    if (isScrollAtBottom) {
-        chatBox.lastElementChild.scrollIntoView();
-    }
-
 }
 
 function addThinkingBubble() {
@@ -212,10 +223,20 @@ function formattedTime() {
 client.onChatMessage = (id, from, text, avatar, data) => {
     $(typingIndicator).hide();
     $('.thinking-bubble.balloon2').remove();
-    addBotMessage(from, text, avatar, data);
+    botMessages.set(`${id}:${from}`, addBotMessage(from, text, avatar, data));
     onChatMessageResponseDelivered(id);
 };
 
+client.onChatMessageData = (id, from, data) => {
+    const botMessage = botMessages.get(`${id}:${from}`);
+    if (botMessage) {
+        addBotMessageData(botMessage, data);
+        if (isScrollAtBottom) {
+            chatBox.lastElementChild.scrollIntoView();
+        }
+    }
+};
+
 client.onPreparingResponse = (from, greeting) => {
     let timeout = 0;
     if (!chatMembers.includes(from)) {
@@ -231,6 +252,30 @@ client.onPreparingResponse = (from, greeting) => {
     }, timeout);
 };
 
+client.onProgress = (from, stage, details) => {
+    let activity;
+    switch (stage) {
+        case "plan-ready":
+        case "tool-started":
+            activity = "is looking something up";
+            break;
+        case "prompt-expanded":
+        case "image-queued":
+            activity = "is drawing an image";
+            break;
+        default:
+            activity = "is typing a response";
+    }
+    document.getElementById('typing-indicator-text')
+        .innerText = `${from} ${activity}`
+    typingIndicator.style.visibility = "visible";
+};
+
+client.onInquiryCancelled = (id, tokensSaved) => {
+    $(typingIndicator).hide();
+    $('.thinking-bubble.balloon2').remove();
+};
+
 client.onSystemMessage = (id, message) => {
     addBotMessage(mediatorName, message);
     onChatMessageResponseDelivered(id);
@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from openai.openai_object import OpenAIObject
+
+from brain_conductor.accounting import (
+    TokenAccount,
+    accounting,
+    estimate_cost,
+    record_usage,
+)
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.agents.llm.router import Backend, Router
+from brain_conductor.coalesce import SingleFlight
+from brain_conductor.metrics import COST, responding
+from brain_conductor.ratelimit import RateLimiter
+
+
+class EstimateCostTestCase(unittest.TestCase):
+    def test_dated_snapshots_use_the_price_of_their_model(self):
+        self.assertAlmostEqual(0.09, estimate_cost("gpt-4-0613", 1000, 1000))
+        self.assertAlmostEqual(0.18, estimate_cost("gpt-4-32k-0613", 1000, 1000))
+
+    def test_unknown_models_cost_nothing(self):
+        self.assertEqual(0.0, estimate_cost("llama", 1000, 1000))
+
+
+class TokenAccountTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        self._account = TokenAccount()
+        self._account.record("tony", "chat", "gpt-4", 10, 5, 0.5)
+        self._account.record("tony", "agent-planning", "gpt-4", 20, 5, 1.0)
+        self._account.record("", "routing", "gpt-3.5-turbo", 30, 1, 0.25)
+
+    def test_usage_is_broken_down_by_dimension(self):
+        total = self._account.total
+        self.assertEqual(
+            (3, 60, 11, 1.75),
+            (total.requests, total.prompt_tokens, total.completion_tokens, total.cost),
+        )
+        by_persona = self._account.by("persona")
+        self.assertEqual(40, by_persona["tony"].tokens)
+        self.assertEqual(1.5, by_persona["tony"].cost)
+        self.assertEqual(2, self._account.by("model")["gpt-4"].requests)
+
+    def test_usage_is_recorded_on_spans(self):
+        span = MagicMock()
+        self._account.record_span(span)
+        span.set_attribute.assert_any_call("tokens.cost_usd", 1.75)
+        span.set_attribute.assert_any_call("tokens.persona.tony.tokens", 40)
+        span.set_attribute.assert_any_call("tokens.persona.none.tokens", 31)
+        span.set_attribute.assert_any_call("tokens.call_site.routing.cost_usd", 0.25)
+
+
+class RecordUsageTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        for name, value in (
+            ("LIMITER", RateLimiter(6000, 6000)),
+            ("ROUTER", Router()),
+            ("COALESCER", SingleFlight()),
+        ):
+            patcher = patch.object(openai_llm, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addAsyncCleanup(openai_llm.close)
+
+    def test_usage_is_recorded_in_the_accounts_of_the_context(self):
+        session, inquiry = TokenAccount(), TokenAccount()
+        with accounting(session):
+            record_usage("chat", "gpt-4", 1000, 0)
+            with accounting(inquiry), responding("tony"):
+                record_usage("chat", "gpt-4", 1000, 0)
+        self.assertEqual(2, session.total.requests)
+        self.assertEqual(["tony"], list(inquiry.by("persona")))
+        self.assertAlmostEqual(0.03, inquiry.total.cost)
+
+    async def test_completions_are_accounted_at_the_price_of_their_backend(self):
+        openai_llm.ROUTER.configure(
+            [Backend("azure", "m", "m", "https://azure", cost_per_1k_tokens=1.0)]
+        )
+        completion = OpenAIObject.construct_from(
+            {"usage": {"prompt_tokens": 400, "completion_tokens": 100}}
+        )
+        resource = MagicMock(acreate=AsyncMock(return_value=completion))
+        account = TokenAccount()
+        with accounting(account), responding("bart"):
+            await openai_llm.create_completion(
+                resource, 1, "accounting-test", model="m"
+            )
+        self.assertAlmostEqual(0.5, account.total.cost)
+        self.assertAlmostEqual(
+            0.5, COST.value(persona="bart", call_site="accounting-test", model="m")
+        )
+
+    async def test_coalesced_completions_are_accounted_by_every_caller(self):
+        completion = OpenAIObject.construct_from(
+            {
+                "usage": {
+                    "prompt_tokens": 400,
+                    "completion_tokens": 100,
+                    "total_tokens": 500,
+                }
+            }
+        )
+
+        async def acreate(**params):
+            await asyncio.sleep(0.01)
+            return completion
+
+        resource = MagicMock(acreate=acreate)
+
+        async def complete(persona, account):
+            with accounting(account), responding(persona):
+                await openai_llm.create_completion(
+                    resource, 1, "coalesced-test", model="gpt-4"
+                )
+
+        tony, bart = TokenAccount(), TokenAccount()
+        await asyncio.gather(complete("tony", tony), complete("bart", bart))
+        self.assertEqual(500, tony.by("persona")["tony"].tokens)
+        self.assertEqual(500, bart.by("persona")["bart"].tokens)
+        self.assertEqual(0, tony.total.coalesced)
+        self.assertEqual(1, bart.total.coalesced)
+        self.assertEqual(tony.total.cost, bart.total.cost)
+        self.assertEqual(
+            0,
+            COST.value(persona="bart", call_site="coalesced-test", model="gpt-4"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
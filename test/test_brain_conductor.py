@@ -1,7 +1,11 @@
 import unittest
 from inspect import iscoroutine
+from unittest.mock import patch
 
 from brain_conductor import get_quart_app, TracingConfig
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.breaker import CircuitBreaker
+from brain_conductor.errors import QuotaExceededError
 
 
 class AppFactoryTestCase(unittest.TestCase):
@@ -25,3 +29,52 @@ class AppFactoryTestCase(unittest.TestCase):
             "get_quart_app did not return a coroutine function",
         )
         coroutine.close()
+
+
+class ReadinessTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch.object(openai_llm, "BREAKER", CircuitBreaker("openai"))
+        self._breaker = patcher.start()
+        self.addCleanup(patcher.stop)
+        app = get_quart_app(
+            name="Test App",
+            openai_api_key="API Key",
+            chat_completion_model="Chat Model",
+            text_completion_model="Text Model",
+            log_level="ERROR",
+            google_measurement_id="G-DUB",
+            coin_market_cap_api_key="CMC Key",
+            hugging_face_access_token="Hugging Face Key",
+            promoted_persona_count=3,
+            tracing_config=TracingConfig(False, False, "testing"),
+        )
+        self._client = app.test_client()
+
+    async def test_ready_reports_breaker_states(self):
+        response = await self._client.get("/ready")
+        self.assertEqual(200, response.status_code)
+        content = await response.get_json()
+        self.assertEqual(
+            {"openai", "coinmarketcap", "hugging-face"}, set(content["breakers"])
+        )
+
+    async def test_metrics_include_component_stats(self):
+        response = await self._client.get("/metrics")
+        self.assertEqual(200, response.status_code)
+        content = await response.get_data(as_text=True)
+        self.assertIn("# TYPE brain_conductor_stage_seconds histogram", content)
+        self.assertIn(
+            'brain_conductor_breaker_state{breaker="openai",state="closed"} 1', content
+        )
+        self.assertIn("brain_conductor_coalescer_requests ", content)
+
+    async def test_degraded_but_ready_while_openai_breaker_is_open(self):
+        with self.assertRaises(QuotaExceededError):
+            with self._breaker.guard():
+                raise QuotaExceededError()
+        response = await self._client.get("/ready")
+        self.assertEqual(200, response.status_code)
+        content = await response.get_json()
+        self.assertTrue(content["degraded"])
+        self.assertEqual("open", content["breakers"]["openai"]["state"])
@@ -0,0 +1,215 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import openai
+from aiohttp import ClientResponseError
+
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.agents.toolkits import hugging_face
+from brain_conductor.breaker import BreakerState, CircuitBreaker, Failure
+from brain_conductor.errors import (
+    CircuitOpenError,
+    QuotaExceededError,
+    TemporaryAPIError,
+)
+from brain_conductor.ratelimit import RateLimiter
+
+
+class CircuitBreakerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.breaker.time")
+        self._time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._time.monotonic.return_value = 1000.0
+        self._breaker = CircuitBreaker(
+            "test", failure_threshold=2, open_seconds=10, quota_open_seconds=100
+        )
+
+    def _fail(self, error: Exception):
+        with self.assertRaises(type(error)):
+            with self._breaker.guard():
+                raise error
+
+    def _succeed(self):
+        with self._breaker.guard():
+            pass
+
+    def test_opens_after_consecutive_overload_failures(self):
+        self._fail(TemporaryAPIError())
+        self.assertIs(BreakerState.CLOSED, self._breaker.state)
+        self._fail(TemporaryAPIError())
+        self.assertIs(BreakerState.OPEN, self._breaker.state)
+        with self.assertRaises(CircuitOpenError):
+            self._succeed()
+        self.assertEqual(1, self._breaker.rejected)
+
+    def test_success_resets_consecutive_failures(self):
+        self._fail(TemporaryAPIError())
+        self._succeed()
+        self._fail(TemporaryAPIError())
+        self.assertIs(BreakerState.CLOSED, self._breaker.state)
+
+    def test_other_errors_do_not_count(self):
+        self._fail(ValueError())
+        self._fail(ValueError())
+        self.assertIs(BreakerState.CLOSED, self._breaker.state)
+
+    def test_other_errors_do_not_reset_consecutive_failures(self):
+        self._fail(TemporaryAPIError())
+        self._fail(ValueError())
+        self._fail(TemporaryAPIError())
+        self.assertIs(BreakerState.OPEN, self._breaker.state)
+
+    def test_probe_with_other_error_allows_another_probe(self):
+        self._fail(TemporaryAPIError())
+        self._fail(TemporaryAPIError())
+        self._time.monotonic.return_value = 1010.0
+        self._fail(ValueError())
+        self.assertIs(BreakerState.HALF_OPEN, self._breaker.state)
+        self.assertTrue(self._breaker.available)
+        self.assertEqual(2, self._breaker.consecutive_failures)
+
+    def test_opens_at_once_when_quota_exceeded(self):
+        self._fail(QuotaExceededError())
+        self._time.monotonic.return_value = 1050.0
+        with self.assertRaises(QuotaExceededError):
+            self._succeed()
+
+    def test_successful_probe_closes(self):
+        self._fail(TemporaryAPIError())
+        self._fail(TemporaryAPIError())
+        self._time.monotonic.return_value = 1010.0
+        self.assertIs(BreakerState.HALF_OPEN, self._breaker.state)
+        self._succeed()
+        self.assertIs(BreakerState.CLOSED, self._breaker.state)
+        self.assertEqual(1, self._breaker.probes)
+
+    def test_failed_probe_opens_again(self):
+        self._fail(TemporaryAPIError())
+        self._fail(TemporaryAPIError())
+        self._time.monotonic.return_value = 1010.0
+        self._fail(TemporaryAPIError())
+        self.assertIs(BreakerState.OPEN, self._breaker.state)
+        self.assertEqual(2, self._breaker.opened)
+
+    async def test_only_one_probe_is_made(self):
+        self._fail(TemporaryAPIError())
+        self._fail(TemporaryAPIError())
+        self._time.monotonic.return_value = 1010.0
+        probing = asyncio.Event()
+        release = asyncio.Event()
+
+        async def probe():
+            with self._breaker.guard():
+                probing.set()
+                await release.wait()
+
+        task = asyncio.create_task(probe())
+        await probing.wait()
+        self.assertFalse(self._breaker.available)
+        with self.assertRaises(CircuitOpenError):
+            self._succeed()
+        release.set()
+        await task
+        self.assertIs(BreakerState.CLOSED, self._breaker.state)
+
+    async def test_cancelled_probe_allows_another_probe(self):
+        self._fail(TemporaryAPIError())
+        self._fail(TemporaryAPIError())
+        self._time.monotonic.return_value = 1010.0
+
+        async def probe():
+            with self._breaker.guard():
+                await asyncio.Event().wait()
+
+        task = asyncio.create_task(probe())
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(self._breaker.available)
+
+    def test_stats_report_state(self):
+        self._fail(QuotaExceededError())
+        stats = self._breaker.stats()
+        self.assertEqual("open", stats["state"])
+        self.assertEqual("quota", stats["reason"])
+        self.assertEqual(100, stats["open_seconds_remaining"])
+
+
+class OpenAIBreakerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        for name, value in (
+            ("LIMITER", RateLimiter(6000, 6000)),
+            ("BREAKER", self._breaker()),
+        ):
+            patcher = patch.object(openai_llm, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addAsyncCleanup(openai_llm.close)
+
+    @staticmethod
+    def _breaker():
+        return CircuitBreaker(
+            "openai", failure_threshold=1, classify=openai_llm.classify_openai_error
+        )
+
+    def test_classifies_openai_errors(self):
+        classify = openai_llm.classify_openai_error
+        self.assertIs(
+            Failure.QUOTA,
+            classify(openai.error.RateLimitError("You exceeded your current quota")),
+        )
+        self.assertIs(
+            Failure.OVERLOAD,
+            classify(openai.error.RateLimitError("That model is overloaded")),
+        )
+        self.assertIsNone(classify(openai.error.RateLimitError("Rate limit reached")))
+        self.assertIs(
+            Failure.OVERLOAD, classify(openai.error.APIError("", http_status=502))
+        )
+        self.assertIsNone(classify(openai.error.InvalidRequestError("", "param")))
+
+    async def test_open_breaker_fails_without_request(self):
+        resource = MagicMock(
+            acreate=AsyncMock(side_effect=openai.error.ServiceUnavailableError())
+        )
+        with self.assertRaises(openai.error.ServiceUnavailableError):
+            await openai_llm.create_completion(resource, 1)
+        with self.assertRaises(CircuitOpenError):
+            await openai_llm.create_completion(resource, 1)
+        resource.acreate.assert_awaited_once()
+
+
+class HuggingFaceBreakerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        for patcher in (
+            patch.object(hugging_face, "BREAKER", CircuitBreaker("hugging-face")),
+            patch.object(hugging_face.aiohttp, "ClientSession"),
+            patch("backoff._async.asyncio.sleep", AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_retried_request_counts_as_one_failure(self):
+        response = MagicMock()
+        response.raise_for_status.side_effect = ClientResponseError(
+            MagicMock(), (), status=503
+        )
+        session = MagicMock()
+        session.post.return_value.__aenter__.return_value = response
+        client_session = hugging_face.aiohttp.ClientSession.return_value
+        client_session.__aenter__.return_value = session
+        api = hugging_face.HuggingFace("token", MagicMock())
+        self.assertIsNone(await api._query_api("/models/a", inputs="cat"))
+        self.assertEqual(5, response.raise_for_status.call_count)
+        self.assertEqual(1, hugging_face.BREAKER.consecutive_failures)
+        self.assertIs(BreakerState.CLOSED, hugging_face.BREAKER.state)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.cascade import Cascade, Tier, estimate_complexity
+from brain_conductor.inquiries import InquiryManager
+from brain_conductor.personas import PERSONAS
+
+COMPLEX_INQUIRY = (
+    "Can you explain step by step how a Bitcoin transaction is validated, "
+    "compare proof of work with proof of stake, and also analyze the trade-offs "
+    "for energy use? What would you choose and why?"
+)
+
+
+class EstimateComplexityTestCase(unittest.TestCase):
+    def test_small_talk_is_simple(self):
+        self.assertLess(estimate_complexity("hi"), 0.1)
+        self.assertLess(estimate_complexity("What's your favorite color?"), 0.3)
+
+    def test_multi_part_reasoning_is_complex(self):
+        self.assertGreater(estimate_complexity(COMPLEX_INQUIRY), 0.6)
+
+    def test_code_is_complex(self):
+        self.assertGreaterEqual(
+            estimate_complexity("What does `sorted(xs, key=len)` return?"), 0.3
+        )
+
+    def test_complexity_is_at_most_1(self):
+        self.assertLessEqual(estimate_complexity(COMPLEX_INQUIRY * 20), 1.0)
+
+
+class CascadeTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        self._cascade = Cascade("small", threshold=0.3)
+
+    def test_simple_inquiry_goes_to_simple_model(self):
+        tier, model, _ = self._cascade.choose("hi", "large", 100)
+        self.assertEqual((Tier.SIMPLE, "small"), (tier, model))
+
+    def test_complex_inquiry_goes_to_complex_model(self):
+        tier, model, _ = self._cascade.choose(COMPLEX_INQUIRY, "large", 100)
+        self.assertEqual((Tier.COMPLEX, "large"), (tier, model))
+
+    def test_disabled_without_simple_model(self):
+        tier, model, _ = Cascade().choose("hi", "large", 100)
+        self.assertEqual((Tier.COMPLEX, "large"), (tier, model))
+
+    def test_prompt_exceeding_simple_context_window_goes_to_complex_model(self):
+        tier, _, _ = self._cascade.choose("hi", "large", 10000)
+        self.assertIs(Tier.COMPLEX, tier)
+
+    def test_persona_overrides(self):
+        tier, model, _ = self._cascade.choose("hi", "large", 100, "tiny")
+        self.assertEqual((Tier.SIMPLE, "tiny"), (tier, model))
+        tier, _, _ = self._cascade.choose("hi", "large", 100, threshold=0)
+        self.assertIs(Tier.COMPLEX, tier)
+
+    def test_stats_report_distribution_and_latency(self):
+        self._cascade.record(Tier.SIMPLE, 1.0)
+        self._cascade.record(Tier.SIMPLE, 3.0)
+        self._cascade.record(Tier.COMPLEX, 5.0)
+        stats = self._cascade.stats()
+        self.assertEqual(2, stats["simple"]["completions"])
+        self.assertAlmostEqual(2 / 3, stats["simple"]["share"])
+        self.assertEqual(2.0, stats["simple"]["latency_mean"])
+        self.assertEqual(3.0, stats["simple"]["latency_p95"])
+        self.assertEqual(5.0, stats["complex"]["latency_p50"])
+
+
+class CascadeInquiryTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.tokens.get_encoding")
+        get_encoding = patcher.start()
+        self.addCleanup(patcher.stop)
+        get_encoding.return_value = MagicMock(encode=str.split)
+
+        self._manager = InquiryManager(
+            openai_api_key="API Key",
+            chat_model="gpt-4",
+            text_model="text-davinci-003",
+            personas=PERSONAS,
+            agents=[],
+            cascade=Cascade("gpt-3.5-turbo"),
+        )
+        self._icm = self._manager.__enter__()
+        patcher = patch.object(self._icm, "_openai_chat_complete", AsyncMock())
+        self._chat_complete = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._chat_complete.return_value = "Response"
+        self._persona = PERSONAS[0]
+
+    async def test_replies_use_model_of_tier(self):
+        await self._icm.inquire(self._persona, "hi")
+        self.assertEqual("gpt-3.5-turbo", self._chat_complete.call_args.args[2])
+        await self._icm.inquire(self._persona, COMPLEX_INQUIRY)
+        self.assertEqual("gpt-4", self._chat_complete.call_args.args[2])
+        stats = self._manager.cascade.stats()
+        self.assertEqual(1, stats["simple"]["completions"])
+        self.assertEqual(1, stats["complex"]["completions"])
+
+    async def test_comments_follow_the_last_inquiry(self):
+        await self._icm.inquire(self._persona, COMPLEX_INQUIRY)
+        await self._icm.comment_on_history(PERSONAS[1])
+        self.assertEqual("gpt-4", self._chat_complete.call_args.args[2])
+
+    async def test_persona_threshold_override(self):
+        with patch.object(self._persona, "complexity_threshold", 0):
+            await self._icm.inquire(self._persona, "hi")
+        self.assertEqual("gpt-4", self._chat_complete.call_args.args[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.chat import InquiryTasks, send_bot_message, send_frame
+from brain_conductor.inquiries import (
+    Encoding,
+    InquiryResponse,
+    InquiryResponseData,
+    InquiryResponseDataType,
+    MimeType,
+)
+from brain_conductor.outbox import Outbox, current_outbox
+from brain_conductor.sessions import ChatSession, current_session
+from brain_conductor.utils import TaskManager
+
+
+class InquiryTasksTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._atm = TaskManager().__enter__()
+        self._tasks = InquiryTasks(self._atm, asyncio.Lock())
+        self._events: list[str] = []
+
+    async def _inquiry(self, name: str, duration: float = 0):
+        self._events.append(f"start {name}")
+        await asyncio.sleep(duration)
+        self._events.append(f"end {name}")
+
+    async def test_inquiries_run_one_at_a_time_in_order(self):
+        first = self._tasks.start("1", self._inquiry("1", 0.01))
+        second = self._tasks.start("2", self._inquiry("2"))
+        await asyncio.gather(first, second)
+        self.assertEqual(["start 1", "end 1", "start 2", "end 2"], self._events)
+        self.assertEqual(0, len(self._tasks))
+
+    async def test_cancel_cancels_matching_inquiry(self):
+        first = self._tasks.start("1", self._inquiry("1", 10))
+        second = self._tasks.start("2", self._inquiry("2"))
+        await asyncio.sleep(0)
+        self.assertEqual(1, self._tasks.cancel("1"))
+        await asyncio.gather(first, second, return_exceptions=True)
+        self.assertTrue(first.cancelled())
+        self.assertEqual(["start 1", "start 2", "end 2"], self._events)
+
+    async def test_supersede_cancels_inquiries_in_progress(self):
+        first = self._tasks.start("1", self._inquiry("1", 10))
+        waiting = self._tasks.start("2", self._inquiry("2"))
+        await asyncio.sleep(0)
+        third = self._tasks.start("3", self._inquiry("3"), supersede=True)
+        await asyncio.gather(first, waiting, third, return_exceptions=True)
+        self.assertTrue(first.cancelled())
+        self.assertTrue(waiting.cancelled())
+        self.assertEqual(["start 1", "start 3", "end 3"], self._events)
+
+
+class SendFrameTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._session = ChatSession("id", MagicMock(), replay_frames=10)
+        token = current_session.set(self._session)
+        self.addCleanup(current_session.reset, token)
+
+    async def test_frames_go_to_the_outbox_of_the_session(self):
+        stale = Outbox(AsyncMock(), self._session)
+        token = current_outbox.set(stale)
+        self.addCleanup(current_outbox.reset, token)
+        self._session.outbox = Outbox(AsyncMock(), self._session)
+        await send_frame({"type": "text"})
+        self.assertEqual((0, 1), (stale.depth, self._session.outbox.depth))
+
+    async def test_replay_frames_are_kept_while_disconnected(self):
+        await send_frame({"type": "status"})
+        await send_frame({"type": "text"}, replay=True)
+        replayed = [json.loads(frame) for frame in self._session.frames_since(0)]
+        self.assertEqual([{"type": "text", "seq": 1}], replayed)
+
+
+class SendBotMessageTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_message_data_is_not_replayed(self):
+        session = ChatSession("id", MagicMock(), replay_frames=10)
+        outbox = Outbox(AsyncMock(), session)
+        token = current_outbox.set(outbox)
+        self.addCleanup(current_outbox.reset, token)
+        persona = MagicMock(avatar_file="dall_e.png")
+        persona.name = "Dall-E"
+        image = InquiryResponseData(
+            "aW1hZ2U=",
+            InquiryResponseDataType.IMAGE,
+            Encoding("base64"),
+            MimeType("image/png"),
+        )
+        with patch("brain_conductor.chat.url_for", return_value="/dall_e.png"):
+            await send_bot_message("1", persona, InquiryResponse("Here", [image]))
+        outbox.close()
+        replayed = [json.loads(frame)["type"] for frame in session.frames_since(0)]
+        self.assertEqual(["bot-message"], replayed)
+
+
+if __name__ == "__main__":
+    unittest.main()
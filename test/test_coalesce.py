@@ -0,0 +1,139 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.coalesce import SingleFlight, request_key
+from brain_conductor.ratelimit import RateLimiter
+
+
+class RequestKeyTestCase(unittest.TestCase):
+    def test_key_ignores_mapping_order(self):
+        self.assertEqual(
+            request_key("model", {"a": 1, "b": [{"c": 2, "d": 3}]}),
+            request_key("model", {"b": [{"d": 3, "c": 2}], "a": 1}),
+        )
+
+    def test_key_differs_by_content(self):
+        self.assertNotEqual(
+            request_key("model", {"temperature": 1}),
+            request_key("model", {"temperature": 0}),
+        )
+
+
+class SingleFlightTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._single_flight = SingleFlight()
+        self._release = asyncio.Event()
+        self._started = 0
+
+    async def _request(self):
+        self._started += 1
+        await self._release.wait()
+        return "result"
+
+    async def test_concurrent_identical_requests_share_one_request(self):
+        callers = [
+            asyncio.create_task(self._single_flight.run("key", self._request))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        self._release.set()
+        self.assertEqual(["result"] * 3, await asyncio.gather(*callers))
+        self.assertEqual(1, self._started)
+        stats = self._single_flight.stats()
+        self.assertEqual(2, stats["coalesced"])
+        self.assertAlmostEqual(2 / 3, stats["coalescing_rate"])
+        self.assertEqual(0, stats["in_flight"])
+
+    async def test_only_callers_sharing_a_request_are_told(self):
+        shared: list[str] = []
+        callers = [
+            asyncio.create_task(
+                self._single_flight.run("key", self._request, shared.append)
+            )
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        self._release.set()
+        await asyncio.gather(*callers)
+        self.assertEqual(["result"], shared)
+
+    async def test_later_requests_are_made_again(self):
+        self._release.set()
+        await self._single_flight.run("key", self._request)
+        await self._single_flight.run("key", self._request)
+        self.assertEqual(2, self._started)
+
+    async def test_errors_are_shared(self):
+        async def request():
+            await asyncio.sleep(0)
+            raise ValueError()
+
+        callers = [
+            asyncio.create_task(self._single_flight.run("key", request))
+            for _ in range(2)
+        ]
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_cancelled_caller_leaves_request_to_others(self):
+        first = asyncio.create_task(self._single_flight.run("key", self._request))
+        second = asyncio.create_task(self._single_flight.run("key", self._request))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        self._release.set()
+        self.assertEqual("result", await second)
+
+    async def test_request_is_cancelled_with_its_last_caller(self):
+        cancelled = asyncio.Event()
+
+        async def request():
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(self._single_flight.run("key", request))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+
+class CoalescedCompletionTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        for name, value in (
+            ("LIMITER", RateLimiter(6000, 6000)),
+            ("COALESCER", SingleFlight()),
+        ):
+            patcher = patch.object(openai_llm, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addAsyncCleanup(openai_llm.close)
+
+    async def test_identical_completions_share_one_request(self):
+        requests = []
+
+        async def acreate(**params):
+            requests.append(params)
+            await asyncio.sleep(0.01)
+            return "completion"
+
+        resource = MagicMock(acreate=acreate)
+        messages = [{"role": "user", "content": "Is water wet?"}]
+        results = await asyncio.gather(
+            openai_llm.create_completion(resource, 1, model="m", messages=messages),
+            openai_llm.create_completion(resource, 1, model="m", messages=messages),
+            openai_llm.create_completion(resource, 1, model="n", messages=messages),
+        )
+        self.assertEqual(["completion"] * 3, results)
+        self.assertEqual(2, len(requests))
+        self.assertEqual(1, openai_llm.COALESCER.coalesced)
+
+
+if __name__ == "__main__":
+    unittest.main()
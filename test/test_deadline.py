@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from brain_conductor.agents import Agent
+from brain_conductor.agents.toolkits import ToolKit, ToolResponseType, tool
+from brain_conductor.deadline import Deadline
+from brain_conductor.errors import DeadlineExceededError
+
+
+class DeadlineTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_limit_returns_result_in_time(self):
+        self.assertEqual(1, await Deadline(1).limit(asyncio.sleep(0, 1), "stage"))
+
+    async def test_limit_cancels_call_at_deadline(self):
+        with self.assertRaises(DeadlineExceededError):
+            await Deadline(0.01).limit(asyncio.sleep(10), "stage")
+
+    async def test_limit_cancels_call_at_timeout(self):
+        with self.assertRaises(DeadlineExceededError):
+            await Deadline(10).limit(asyncio.sleep(10), "stage", timeout=0.01)
+
+    async def test_limit_does_not_mistake_timeouts_of_the_call(self):
+        async def call():
+            raise TimeoutError()
+
+        with self.assertRaises(TimeoutError) as raised:
+            await Deadline(10).limit(call(), "stage")
+        self.assertNotIsInstance(raised.exception, DeadlineExceededError)
+
+    async def test_no_deadline_does_not_limit(self):
+        self.assertEqual(1, await Deadline().limit(asyncio.sleep(0, 1), "stage"))
+
+    def test_allows_records_skipped_stages(self):
+        deadline = Deadline(5)
+        self.assertTrue(deadline.allows("comment", 1))
+        self.assertFalse(deadline.allows("image", 10))
+        self.assertEqual(["image"], deadline.skipped)
+
+
+class ArtKit(ToolKit):
+    prefix = "art"
+
+    def __init__(self, method):
+        self._method = method
+
+    @tool(
+        args=["image_prompt"],
+        description="Generates an image",
+        response_type=ToolResponseType.IMAGE,
+    )
+    async def generate_art(self, image_prompt):
+        return await self._method(image_prompt)
+
+
+class StubAgent(Agent):
+    llm = MagicMock(
+        chat_complete=AsyncMock(
+            side_effect=['[{"method": "art.generate_art", "args": ["x"]}]', "Done"]
+        )
+    )
+
+
+class AgentDeadlineTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_images_are_skipped_near_the_deadline(self):
+        generate_art = AsyncMock()
+        agent = StubAgent([ArtKit(generate_art)])
+        response = await agent.process_messages([], Deadline(1))
+        self.assertEqual("Done", response.response)
+        generate_art.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from brain_conductor.hedge import Hedger
+
+
+class HedgerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._hedger = Hedger(budget=0.5, percentile=50, min_samples=2)
+        self._started = 0
+
+    async def _warm_up(self, latency: float = 0.01):
+        for _ in range(2):
+            await self._hedger.run("site", lambda: asyncio.sleep(latency, "warm"))
+
+    def _request(self, *durations: float):
+        """Request taking the given durations on successive calls"""
+
+        async def request():
+            duration = durations[self._started]
+            self._started += 1
+            await asyncio.sleep(duration)
+            return duration
+
+        return request
+
+    async def test_does_not_hedge_without_latencies(self):
+        self.assertEqual(0.02, await self._hedger.run("site", self._request(0.02)))
+        self.assertEqual(1, self._started)
+
+    async def test_fast_request_is_not_hedged(self):
+        await self._warm_up()
+        await self._hedger.run("site", self._request(0))
+        self.assertEqual(1, self._started)
+
+    async def test_slow_request_is_hedged_and_duplicate_wins(self):
+        await self._warm_up()
+        self.assertEqual(0, await self._hedger.run("site", self._request(10, 0)))
+        stats = self._hedger.stats()["site"]
+        self.assertEqual(1, stats["hedges"])
+        self.assertEqual(1, stats["wins"])
+
+    async def test_original_may_win(self):
+        await self._warm_up()
+        self.assertEqual(0.03, await self._hedger.run("site", self._request(0.03, 10)))
+        self.assertEqual(0, self._hedger.stats()["site"]["wins"])
+
+    async def test_hedges_are_limited_by_budget(self):
+        self._hedger.budget = 0.1
+        await self._warm_up()
+        await self._hedger.run("site", self._request(0.03, 0))
+        self.assertEqual(1, self._started)
+
+    async def test_failed_request_leaves_duplicate_to_complete(self):
+        await self._warm_up()
+
+        async def request():
+            self._started += 1
+            if self._started == 1:
+                await asyncio.sleep(0.02)
+                raise ValueError()
+            await asyncio.sleep(0.05)
+            return "duplicate"
+
+        self.assertEqual("duplicate", await self._hedger.run("site", request))
+
+    async def test_disabled_without_budget(self):
+        self._hedger.budget = 0
+        await self._warm_up()
+        await self._hedger.run("site", self._request(0.03, 0))
+        self.assertEqual(1, self._started)
+
+
+if __name__ == "__main__":
+    unittest.main()
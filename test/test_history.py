@@ -0,0 +1,58 @@
+import unittest
+
+from brain_conductor.history import History, HistoryEntry, USER, ENTRY_SIZE
+
+
+def entry(text: str) -> HistoryEntry:
+    return HistoryEntry(USER, text, 1)
+
+
+class HistoryTestCase(unittest.TestCase):
+    def test_recent_returns_newest_entries_oldest_first(self):
+        history = History()
+        for text in "abcd":
+            history.append(entry(text))
+        self.assertEqual(["c", "d"], [item.text for item in history.recent(2)])
+
+    def test_append_evicts_oldest_entries_over_item_cap(self):
+        history = History(max_items=2)
+        for text in "abc":
+            history.append(entry(text))
+        self.assertEqual(["b", "c"], [item.text for item in history])
+        self.assertEqual(1, history.first_position)
+
+    def test_append_evicts_oldest_entries_over_memory_cap(self):
+        history = History(max_bytes=3 * (ENTRY_SIZE + 100))
+        for _ in range(5):
+            history.append(entry("x" * 40))
+        self.assertLessEqual(history.bytes, 3 * (ENTRY_SIZE + 100))
+        self.assertEqual(history.end_position - len(history), history.first_position)
+
+    def test_append_keeps_newest_entry_larger_than_memory_cap(self):
+        history = History(max_bytes=10)
+        history.append(entry("x" * 100))
+        self.assertEqual(1, len(history))
+
+    def test_prepend_keeps_order(self):
+        history = History()
+        history.append(entry("c"))
+        history.prepend([entry("a"), entry("b")])
+        self.assertEqual(["a", "b", "c"], [item.text for item in history])
+        self.assertEqual(-2, history.first_position)
+
+    def test_prepend_discards_oldest_entries_over_item_cap(self):
+        history = History(max_items=2)
+        history.append(entry("c"))
+        history.prepend([entry("a"), entry("b")])
+        self.assertEqual(["b", "c"], [item.text for item in history])
+
+    def test_since_uses_absolute_positions(self):
+        history = History(max_items=3)
+        for text in "abcde":
+            history.append(entry(text))
+        self.assertEqual(["d"], [item.text for item in history.since(3, 4)])
+        self.assertEqual(["c", "d", "e"], [item.text for item in history.since(0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from brain_conductor.inquiries import InquiryManager
+from brain_conductor.personas import PERSONAS
+
+
+class InquiryContextManagerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.tokens.get_encoding")
+        get_encoding = patcher.start()
+        self.addCleanup(patcher.stop)
+        get_encoding.return_value = MagicMock(encode=str.split)
+
+        manager = InquiryManager(
+            openai_api_key="API Key",
+            chat_model="gpt-3.5-turbo",
+            text_model="text-davinci-003",
+            personas=PERSONAS,
+            agents=[],
+            recent_items=2,
+            compaction_items=2,
+        )
+        self._icm = manager.__enter__()
+        patcher = patch.object(self._icm, "_openai_chat_complete", AsyncMock())
+        self._chat_complete = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._chat_complete.return_value = "Response"
+        self._persona = PERSONAS[0]
+
+    async def test_compact_history_does_nothing_until_enough_items_age_out(self):
+        await self._icm.inquire(self._persona, "Question")
+        self._chat_complete.reset_mock()
+        await self._icm.compact_history()
+        self._chat_complete.assert_not_called()
+
+    async def test_compact_history_sends_aged_out_items_to_summarize(self):
+        await self._icm.inquire(self._persona, "First question")
+        await self._icm.inquire(self._persona, "Second question")
+        self._chat_complete.reset_mock()
+        await self._icm.compact_history()
+        prompt = self._chat_complete.call_args.args[0][1]["content"]
+        self.assertIn("User: First question", prompt)
+        self.assertIn(f"{self._persona.name}: Response", prompt)
+        self.assertNotIn("Second question", prompt)
+
+    async def test_summary_is_sent_with_following_prompts(self):
+        await self._icm.inquire(self._persona, "First question")
+        await self._icm.inquire(self._persona, "Second question")
+        self._chat_complete.return_value = "The summary"
+        await self._icm.compact_history()
+        self._chat_complete.return_value = "Response"
+        await self._icm.inquire(self._persona, "Third question")
+        messages = self._chat_complete.call_args.args[0]
+        self.assertEqual(
+            "Summary of the earlier conversation: The summary",
+            messages[1]["content"],
+        )
+        self.assertNotIn("First question", [m["content"] for m in messages])
+
+    async def test_compact_history_only_summarizes_items_once(self):
+        await self._icm.inquire(self._persona, "First question")
+        await self._icm.inquire(self._persona, "Second question")
+        await self._icm.compact_history()
+        self._chat_complete.reset_mock()
+        await self._icm.compact_history()
+        self._chat_complete.assert_not_called()
+
+    async def test_estimate_comment_tokens_grows_with_history(self):
+        before = self._icm.estimate_comment_tokens(self._persona)
+        await self._icm.inquire(self._persona, "Question")
+        self.assertGreater(self._icm.estimate_comment_tokens(self._persona), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
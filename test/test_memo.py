@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.agents import Agent
+from brain_conductor.agents.toolkits import CryptoToolkit
+from brain_conductor.memo import ToolMemo, current_tool_memo
+
+
+class ToolMemoTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.memo.time")
+        self._time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._time.monotonic.return_value = 1000.0
+        self._memo = ToolMemo(max_items=2)
+
+    async def test_reuses_fresh_results(self):
+        call = AsyncMock(return_value="result")
+        self.assertEqual(("result", 0.0), await self._memo.call("key", 60, call))
+        self._time.monotonic.return_value = 1030.0
+        self.assertEqual(("result", 30.0), await self._memo.call("key", 60, call))
+        call.assert_awaited_once()
+        self.assertEqual(0.5, self._memo.stats()["hit_rate"])
+
+    async def test_calls_again_when_result_is_stale(self):
+        call = AsyncMock(return_value="result")
+        await self._memo.call("key", 60, call)
+        self._time.monotonic.return_value = 1061.0
+        await self._memo.call("key", 60, call)
+        self.assertEqual(2, call.await_count)
+
+    async def test_does_not_keep_empty_results(self):
+        call = AsyncMock(return_value="")
+        await self._memo.call("key", 60, call)
+        await self._memo.call("key", 60, call)
+        self.assertEqual(2, call.await_count)
+
+    async def test_oldest_results_are_evicted(self):
+        for key in ("first", "second", "third"):
+            await self._memo.call(key, 60, AsyncMock(return_value=key))
+        call = AsyncMock(return_value="first")
+        await self._memo.call("first", 60, call)
+        call.assert_awaited_once()
+
+
+class AgentToolMemoTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._price = AsyncMock(return_value="The current price of btc is $30000\n")
+        self._agent = Agent(
+            [CryptoToolkit(MagicMock(get_current_usd_price=self._price))]
+        )
+        plan = json.dumps(
+            [
+                {"method": "crypto.get_current_usd_price", "args": ["btc"]},
+                {"method": "crypto.get_current_usd_price", "args": ["btc"]},
+            ]
+        )
+        self._chat_complete = AsyncMock(side_effect=[plan, "Response"] * 2)
+        patcher = patch.object(self._agent.llm, "chat_complete", self._chat_complete)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        token = current_tool_memo.set(ToolMemo())
+        self.addCleanup(current_tool_memo.reset, token)
+
+    def _data(self, call: int) -> str:
+        return self._chat_complete.await_args_list[call].args[0][-1]["content"]
+
+    async def test_duplicate_calls_in_a_plan_are_collapsed(self):
+        await self._agent.process_messages([{"role": "user", "content": "BTC?"}])
+        self._price.assert_awaited_once_with("btc")
+        self.assertEqual(1, self._data(1).count("$30000"))
+
+    async def test_later_turns_reuse_labeled_results(self):
+        messages = [{"role": "user", "content": "BTC?"}]
+        await self._agent.process_messages(messages)
+        await self._agent.process_messages(messages)
+        self._price.assert_awaited_once()
+        self.assertNotIn("Retrieved", self._data(1))
+        self.assertIn("seconds ago) The current price of btc", self._data(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from openai.openai_object import OpenAIObject
+
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.metrics import COMPLETION_SECONDS, TOKENS, Registry, responding
+from brain_conductor.ratelimit import RateLimiter
+
+
+class RegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        self._registry = Registry("test")
+
+    def test_counters_are_rendered_by_labels(self):
+        counter = self._registry.counter("requests_total", "Requests", ("model",))
+        counter.inc(model="a")
+        counter.inc(2, model="a")
+        counter.inc(model='b"c')
+        self.assertEqual(3, counter.value(model="a"))
+        self.assertEqual(
+            "# HELP test_requests_total Requests\n"
+            "# TYPE test_requests_total counter\n"
+            'test_requests_total{model="a"} 3\n'
+            'test_requests_total{model="b\\"c"} 1\n',
+            self._registry.render(),
+        )
+
+    def test_histograms_are_cumulative(self):
+        histogram = self._registry.histogram("stage_seconds", "Stages", ("stage",))
+        for seconds in (0.01, 0.3, 0.5, 100):
+            histogram.observe(seconds, stage="routing")
+        rendered = self._registry.render()
+        self.assertIn(
+            'test_stage_seconds_bucket{stage="routing",le="0.05"} 1', rendered
+        )
+        self.assertIn('test_stage_seconds_bucket{stage="routing",le="0.5"} 3', rendered)
+        self.assertIn(
+            'test_stage_seconds_bucket{stage="routing",le="+Inf"} 4', rendered
+        )
+        self.assertIn('test_stage_seconds_sum{stage="routing"} 100.81', rendered)
+        self.assertEqual(4, histogram.count(stage="routing"))
+
+    def test_time_observes_the_seconds_taken(self):
+        histogram = self._registry.histogram("stage_seconds", "Stages")
+        with patch("brain_conductor.metrics.time.monotonic", side_effect=[1.0, 3.0]):
+            with histogram.time():
+                pass
+        self.assertIn("test_stage_seconds_sum 2", self._registry.render())
+
+    def test_component_stats_are_collected_when_rendered(self):
+        stats = {"a": {"calls": 1, "state": "open"}}
+        self._registry.collect("hedge", lambda: stats, label="call_site")
+        stats["b"] = {"calls": 2, "state": "closed"}
+        rendered = self._registry.render()
+        self.assertIn('test_hedge_calls{call_site="b"} 2', rendered)
+        self.assertIn('test_hedge_state{call_site="a",state="open"} 1', rendered)
+        self.assertEqual(1, rendered.count("# TYPE test_hedge_calls gauge"))
+
+
+class CompletionMetricsTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch.object(openai_llm, "LIMITER", RateLimiter(6000, 6000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addAsyncCleanup(openai_llm.close)
+
+    async def test_completions_record_tokens_by_persona(self):
+        completion = OpenAIObject.construct_from(
+            {"usage": {"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10}}
+        )
+        resource = MagicMock(acreate=AsyncMock(return_value=completion))
+        labels = {"persona": "tony", "call_site": "metrics-test", "model": "m"}
+        with responding("tony"):
+            await openai_llm.create_completion(resource, 1, "metrics-test", model="m")
+        self.assertEqual(7, TOKENS.value(kind="prompt", **labels))
+        self.assertEqual(3, TOKENS.value(kind="completion", **labels))
+        self.assertEqual(
+            1, COMPLETION_SECONDS.count(call_site="metrics-test", model="m")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock
+
+from brain_conductor.outbox import Outbox, Priority
+from brain_conductor.sessions import ChatSession
+
+
+class OutboxTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._sent: list[dict] = []
+        self._session = ChatSession("id", MagicMock(), replay_frames=10)
+        self._outbox = Outbox(self._send, self._session, max_frames=3)
+
+    async def _send(self, frame: str):
+        self._sent.append(json.loads(frame))
+
+    async def _drain(self):
+        writer = asyncio.create_task(self._outbox.run())
+        while self._outbox.depth:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        writer.cancel()
+
+    async def test_frames_are_sent_in_priority_order_with_increasing_seq(self):
+        await self._outbox.put({"type": "data"}, Priority.BULK)
+        await self._outbox.put({"type": "text"}, Priority.MESSAGE)
+        await self._drain()
+        self.assertEqual(["text", "data"], [frame["type"] for frame in self._sent])
+        self.assertEqual([1, 2], [frame["seq"] for frame in self._sent])
+
+    async def test_adjacent_status_frames_are_sent_as_batch(self):
+        await self._outbox.put({"type": "a"}, Priority.STATUS)
+        await self._outbox.put({"type": "b"}, Priority.STATUS)
+        await self._drain()
+        self.assertEqual(1, len(self._sent))
+        self.assertEqual([{"type": "a"}, {"type": "b"}], self._sent[0]["frames"])
+
+    async def test_put_replaces_queued_frame_with_same_key(self):
+        await self._outbox.put({"type": "a", "n": 1}, Priority.STATUS, key="a")
+        await self._outbox.put({"type": "a", "n": 2}, Priority.STATUS, key="a")
+        await self._drain()
+        self.assertEqual([{"type": "a", "n": 2, "seq": 1}], self._sent)
+
+    async def test_put_discards_superseded_frames(self):
+        await self._outbox.put({"type": "preparing"}, Priority.STATUS, key="p")
+        await self._outbox.put({"type": "text"}, supersedes=("p",))
+        await self._drain()
+        self.assertEqual(["text"], [frame["type"] for frame in self._sent])
+        self.assertEqual(1, self._outbox.dropped)
+
+    async def test_status_frames_are_dropped_when_full(self):
+        for _ in range(3):
+            await self._outbox.put({"type": "text"})
+        await self._outbox.put({"type": "status"}, Priority.STATUS)
+        self.assertEqual(3, self._outbox.depth)
+        self.assertEqual(1, self._outbox.dropped)
+
+    async def test_put_waits_for_room_when_full(self):
+        for _ in range(3):
+            await self._outbox.put({"type": "text"})
+        put = asyncio.create_task(self._outbox.put({"type": "last"}))
+        await asyncio.sleep(0)
+        self.assertFalse(put.done())
+        writer = asyncio.create_task(self._outbox.run())
+        await put
+        while self._outbox.depth:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        writer.cancel()
+        self.assertEqual(4, len(self._sent))
+        self.assertEqual("last", self._sent[-1]["type"])
+
+    async def test_close_records_unsent_replay_frames(self):
+        await self._outbox.put({"type": "status"}, Priority.STATUS)
+        await self._outbox.put({"type": "text"}, replay=True)
+        self._outbox.close()
+        self.assertEqual(
+            ["text"],
+            [json.loads(frame)["type"] for frame in self._session.frames_since(0)],
+        )
+        self.assertEqual(0, self._outbox.depth)
+
+
+if __name__ == "__main__":
+    unittest.main()
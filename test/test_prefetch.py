@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.agents.toolkits.coinmarketcap import (
+    LISTINGS_PATH,
+    QUOTES_PATH,
+    CoinMarketCap,
+)
+from brain_conductor.prefetch import Prefetch, current_prefetch, prefetched
+
+QUOTE = {
+    "data": {
+        "BTC": [
+            {
+                "name": "Bitcoin",
+                "quote": {
+                    "USD": {
+                        "price": 30000,
+                        "volume_24h": 1,
+                        "percent_change_1h": 0,
+                        "percent_change_24h": 0,
+                        "percent_change_7d": 0,
+                        "market_cap": 1,
+                    }
+                },
+            }
+        ]
+    }
+}
+
+
+class PrefetchTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._prefetch = Prefetch()
+        self.addCleanup(self._prefetch.close)
+        token = current_prefetch.set(self._prefetch)
+        self.addCleanup(current_prefetch.reset, token)
+
+    async def test_reuses_prefetched_data(self):
+        fetch = AsyncMock(return_value="data")
+        self._prefetch.start("key", fetch)
+        self.assertEqual("data", await prefetched("key", fetch))
+        self.assertEqual("data", await prefetched("key", fetch))
+        fetch.assert_awaited_once()
+
+    async def test_fetches_data_which_was_not_prefetched(self):
+        fetch = AsyncMock(return_value="data")
+        self.assertEqual("data", await prefetched("key", fetch))
+        fetch.assert_awaited_once()
+
+    async def test_fetches_again_when_prefetch_fails(self):
+        fetch = AsyncMock(side_effect=[ValueError(), "data"])
+        self._prefetch.start("key", fetch)
+        self.assertEqual("data", await prefetched("key", fetch))
+
+    async def test_cancelled_caller_leaves_prefetch_to_others(self):
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "data"
+
+        self._prefetch.start("key", fetch)
+        caller = asyncio.create_task(prefetched("key", fetch))
+        await asyncio.sleep(0)
+        caller.cancel()
+        release.set()
+        self.assertEqual("data", await prefetched("key", AsyncMock()))
+
+    async def test_records_use(self):
+        self._prefetch.start("used", AsyncMock())
+        self._prefetch.start("unused", AsyncMock())
+        await prefetched("used", AsyncMock())
+        span = MagicMock()
+        self._prefetch.record(span)
+        span.set_attribute.assert_any_call("prefetch.started", 2)
+        span.set_attribute.assert_any_call("prefetch.used", 1)
+
+
+class CoinMarketCapPrefetchTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._coin_market_cap = CoinMarketCap("key")
+        patcher = patch.object(self._coin_market_cap, "_request", AsyncMock())
+        self._request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._request.return_value = QUOTE
+        self._prefetch = Prefetch()
+        self.addCleanup(self._prefetch.close)
+        token = current_prefetch.set(self._prefetch)
+        self.addCleanup(current_prefetch.reset, token)
+
+    async def test_prefetches_quotes_of_mentioned_coins(self):
+        self._coin_market_cap.prefetch("Should I buy bitcoin, ETH or $pepe?")
+        await asyncio.sleep(0)
+        requested = [call.args for call in self._request.await_args_list]
+        self.assertEqual(
+            [
+                (QUOTES_PATH, {"symbol": "BTC"}),
+                (QUOTES_PATH, {"symbol": "ETH"}),
+                (QUOTES_PATH, {"symbol": "PEPE"}),
+            ],
+            requested,
+        )
+
+    async def test_prefetches_listings_for_market_inquiries(self):
+        self._coin_market_cap.prefetch("What are the top coins today?")
+        await asyncio.sleep(0)
+        self._request.assert_awaited_once_with(
+            LISTINGS_PATH, {"limit": 20, "sort": "volume_24h"}
+        )
+
+    async def test_does_not_prefetch_for_other_inquiries(self):
+        self._coin_market_cap.prefetch("How are you doing?")
+        await asyncio.sleep(0)
+        self._request.assert_not_awaited()
+
+    async def test_tools_reuse_prefetched_quotes(self):
+        self._coin_market_cap.prefetch("What is the price of bitcoin?")
+        response = await self._coin_market_cap.get_current_usd_price("btc")
+        self.assertEqual("The current price of btc is $30000\n", response)
+        self._request.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
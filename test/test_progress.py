@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.agents import Agent
+from brain_conductor.agents.toolkits import ToolKit, tool
+from brain_conductor.chat import (
+    send_bot_message,
+    send_preparing_response_message,
+    send_progress_message,
+)
+from brain_conductor.inquiries import InquiryResponse
+from brain_conductor.outbox import Outbox, current_outbox
+from brain_conductor.progress import current_progress, listening, report
+
+
+class PriceKit(ToolKit):
+    prefix = "crypto"
+
+    @tool(args=["token_symbol"], description="Gets a price")
+    async def get_price(self, token_symbol):
+        return f"{token_symbol} is $1"
+
+    @tool(args=[], description="Fails")
+    async def fail(self):
+        raise OSError()
+
+
+class ProgressTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._events: list[tuple[str, dict]] = []
+
+    async def _listen(self, stage, details):
+        self._events.append((stage, details))
+
+    async def test_report_reaches_the_listener_of_the_context(self):
+        with listening(self._listen):
+            await report("stage", seconds=1)
+        await report("ignored")
+        self.assertEqual([("stage", {"seconds": 1})], self._events)
+        self.assertIsNone(current_progress.get())
+
+    async def test_agents_report_their_stages(self):
+        agent = Agent([PriceKit()])
+        plan = (
+            '[{"method": "crypto.get_price", "args": ["btc"]},'
+            ' {"method": "crypto.fail", "args": []}]'
+        )
+        agent.llm = MagicMock(chat_complete=AsyncMock(side_effect=[plan, "Done"]))
+        with listening(self._listen):
+            with self.assertRaises(OSError):
+                await agent.process_messages([])
+        stages = [(stage, details.get("tool")) for stage, details in self._events]
+        self.assertEqual(
+            [
+                ("plan-ready", None),
+                ("tool-started", "crypto.get_price"),
+                ("tool-finished", "crypto.get_price"),
+                ("tool-started", "crypto.fail"),
+                ("tool-finished", "crypto.fail"),
+            ],
+            stages,
+        )
+        self.assertEqual(
+            ["crypto.get_price", "crypto.fail"], self._events[0][1]["tools"]
+        )
+        self.assertTrue(self._events[2][1]["ok"])
+        self.assertFalse(self._events[4][1]["ok"])
+
+
+class ProgressMessageTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._outbox = Outbox(AsyncMock())
+        token = current_outbox.set(self._outbox)
+        self.addCleanup(current_outbox.reset, token)
+
+    async def test_progress_replaces_queued_progress_of_the_persona(self):
+        await send_preparing_response_message("Tony", "Hi")
+        await send_progress_message("Tony", "plan-ready", {"seconds": 1.5})
+        await send_progress_message("Tony", "tool-started", {"tool": "a"})
+        self.assertEqual(2, self._outbox.depth)
+        self.assertEqual(1, self._outbox.coalesced)
+
+    async def test_reply_discards_queued_status_of_the_persona(self):
+        await send_preparing_response_message("Tony", "Hi")
+        await send_progress_message("Tony", "plan-ready", {"seconds": 1.5})
+        await send_progress_message("Bart", "plan-ready", {"seconds": 1.5})
+        persona = MagicMock(avatar_file="tony.png")
+        persona.name = "Tony"
+        with patch("brain_conductor.chat.url_for", return_value="/tony.png"):
+            await send_bot_message("1", persona, InquiryResponse("Hello"))
+        self.assertEqual(2, self._outbox.depth)
+        self.assertEqual(2, self._outbox.dropped)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import openai
+
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.errors import QuotaExceededError
+from brain_conductor.ratelimit import RateLimiter, parse_duration
+
+
+class ParseDurationTestCase(unittest.TestCase):
+    def test_parses_rate_limit_reset_formats(self):
+        self.assertEqual(0.25, parse_duration("250ms"))
+        self.assertEqual(360, parse_duration("6m0s"))
+        self.assertEqual(1.5, parse_duration("1.5s"))
+
+    def test_returns_none_for_other_text(self):
+        self.assertIsNone(parse_duration(""))
+
+
+class RateLimiterTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        # 100 tokens per second
+        self._limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=6000)
+
+    async def test_acquire_does_not_wait_with_capacity(self):
+        self.assertLess(await self._limiter.acquire(100), 0.01)
+
+    async def test_acquire_waits_for_tokens_to_refill(self):
+        await self._limiter.acquire(6000)
+        self.assertGreater(await self._limiter.acquire(5), 0.04)
+        self.assertEqual(2, self._limiter.acquired)
+
+    async def test_waiting_callers_are_served_in_order(self):
+        await self._limiter.acquire(6000)
+        order = []
+
+        async def acquire(name: str, tokens: int):
+            await self._limiter.acquire(tokens)
+            order.append(name)
+
+        first = asyncio.create_task(acquire("first", 5))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(acquire("second", 1))
+        await asyncio.gather(first, second)
+        self.assertEqual(["first", "second"], order)
+
+    async def test_settle_returns_unused_tokens(self):
+        await self._limiter.acquire(6000)
+        self._limiter.settle(6000, 10)
+        self.assertLess(await self._limiter.acquire(5000), 0.01)
+
+    async def test_update_adopts_limits_from_headers(self):
+        self._limiter.update(
+            {"x-ratelimit-limit-requests": "60", "x-ratelimit-limit-tokens": "1000"}
+        )
+        self.assertEqual(60, self._limiter.requests_per_minute)
+        self.assertEqual(1000, self._limiter.tokens_per_minute)
+
+    async def test_update_pauses_when_no_capacity_remains(self):
+        self._limiter.update(
+            {
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "50ms",
+            }
+        )
+        self.assertGreater(await self._limiter.acquire(1), 0.04)
+
+    async def test_update_pauses_for_retry_after(self):
+        self._limiter.update({"retry-after": "0.05"})
+        self.assertGreater(await self._limiter.acquire(1), 0.04)
+
+    async def test_acquire_raises_when_quota_exceeded(self):
+        self._limiter.exceed_quota(60)
+        self.assertTrue(self._limiter.quota_exceeded)
+        with self.assertRaises(QuotaExceededError):
+            await self._limiter.acquire(1)
+
+
+class SharedRateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._path = os.path.join(directory.name, "limits")
+        self._first = self._limiter(self._path)
+        self._second = self._limiter(self._path)
+
+    def _limiter(self, path: str) -> RateLimiter:
+        limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000)
+        limiter.share(path)
+        self.addCleanup(limiter.close)
+        return limiter
+
+    def test_limiters_share_capacity(self):
+        self.assertEqual(0, self._first.try_acquire(1))
+        self.assertEqual(0, self._second.try_acquire(1))
+        self.assertGreater(self._first.try_acquire(1), 0)
+
+    def test_limiters_share_quota_exceeded(self):
+        self._first.exceed_quota(60)
+        with self.assertRaises(QuotaExceededError):
+            self._second.try_acquire(1)
+
+    def test_first_limiter_values_are_kept(self):
+        other = RateLimiter(requests_per_minute=100)
+        other.share(self._path)
+        self.addCleanup(other.close)
+        self.assertEqual(2, other.requests_per_minute)
+        self.assertEqual(1000, other.tokens_per_minute)
+
+
+class CreateCompletionTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch.object(openai_llm, "LIMITER", RateLimiter(6000, 6000))
+        self._limiter = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await openai_llm.close()
+
+    async def test_settles_tokens_with_usage(self):
+        resource = MagicMock(acreate=AsyncMock())
+        resource.acreate.return_value = (
+            openai.openai_object.OpenAIObject.construct_from(
+                {"usage": {"total_tokens": 10}}
+            )
+        )
+        await openai_llm.create_completion(resource, 6000, model="model")
+        self.assertLess(await self._limiter.acquire(5000), 0.01)
+
+    async def test_requests_share_http_session(self):
+        sessions = []
+
+        async def acreate(**params):
+            sessions.append(openai.aiosession.get())
+
+        resource = MagicMock(acreate=acreate)
+        await openai_llm.create_completion(resource, 1)
+        await openai_llm.create_completion(resource, 1)
+        self.assertIsNotNone(sessions[0])
+        self.assertIs(sessions[0], sessions[1])
+        self.assertIsNone(openai.aiosession.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
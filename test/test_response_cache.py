@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.agents import AgentResponse, ArtAgent
+from brain_conductor.inquiries import InquiryManager
+from brain_conductor.personas import PERSONAS
+from brain_conductor.response_cache import ResponseCache, normalize, simhash
+
+
+class SimHashTestCase(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual("what's up", normalize("  What's   UP?!"))
+
+    def test_similar_texts_have_close_fingerprints(self):
+        base = simhash("what is the best way to learn to play the guitar")
+        similar = simhash("what is the best way to learn to play guitar")
+        different = simhash("how do black holes evaporate over time")
+        self.assertLess((base ^ similar).bit_count(), (base ^ different).bit_count())
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.response_cache.time")
+        self._time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._time.monotonic.return_value = 1000.0
+        self._cache = ResponseCache(enabled=True, ttl=60, max_items=2)
+
+    def test_matches_normalized_inquiry_in_scope(self):
+        self._cache.put("tony", "Hello there!", "response")
+        self.assertEqual("response", self._cache.get("tony", "hello  THERE"))
+        self.assertIsNone(self._cache.get("steve", "hello there"))
+
+    def test_entries_expire(self):
+        self._cache.put("tony", "hello", "response")
+        self._time.monotonic.return_value = 1060.0
+        self.assertIsNone(self._cache.get("tony", "hello"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self._cache.put("tony", "first", 1)
+        self._cache.put("tony", "second", 2)
+        self._cache.get("tony", "first")
+        self._cache.put("tony", "third", 3)
+        self.assertEqual(1, self._cache.get("tony", "first"))
+        self.assertIsNone(self._cache.get("tony", "second"))
+
+    def test_entries_are_evicted_when_too_large_in_total(self):
+        cache = ResponseCache(enabled=True, max_bytes=10, size=len)
+        cache.put("tony", "first", "12345")
+        cache.put("tony", "second", "123456")
+        cache.put("tony", "third", "12345678901")
+        self.assertIsNone(cache.get("tony", "first"))
+        self.assertEqual("123456", cache.get("tony", "second"))
+        self.assertIsNone(cache.get("tony", "third"))
+        self.assertEqual(6, cache.stats()["bytes"])
+
+    def test_near_duplicates_match_when_enabled(self):
+        inquiry = "what is the best way to learn to play the guitar"
+        self._cache.put("tony", inquiry, "response")
+        near_duplicate = "what is the best way to learn to play guitar"
+        self.assertIsNone(self._cache.get("tony", near_duplicate))
+        cache = ResponseCache(enabled=True, max_distance=3)
+        cache.put("tony", inquiry, "response")
+        self.assertEqual("response", cache.get("tony", near_duplicate))
+        self.assertEqual(1, cache.stats()["near_hits"])
+        self.assertIsNone(cache.get("tony", "how do black holes evaporate over time"))
+
+    def test_disabled_cache_keeps_nothing(self):
+        cache = ResponseCache()
+        cache.put("tony", "hello", "response")
+        self.assertIsNone(cache.get("tony", "hello"))
+
+
+class FirstTurnCacheTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.tokens.get_encoding")
+        get_encoding = patcher.start()
+        self.addCleanup(patcher.stop)
+        get_encoding.return_value = MagicMock(encode=str.split)
+
+        self._manager = InquiryManager(
+            openai_api_key="API Key",
+            chat_model="gpt-3.5-turbo",
+            text_model="text-davinci-003",
+            personas=PERSONAS,
+            agents=[],
+            response_cache=ResponseCache(enabled=True),
+        )
+        self._chat_complete = AsyncMock(return_value="Response")
+        self._persona = PERSONAS[0]
+
+    def _icm(self):
+        icm = self._manager.__enter__()
+        patcher = patch.object(icm, "_openai_chat_complete", self._chat_complete)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return icm
+
+    async def test_first_inquiries_of_sessions_are_cached(self):
+        await self._icm().inquire(self._persona, "Hi!")
+        icm = self._icm()
+        response = await icm.inquire(self._persona, "hi")
+        self.assertEqual("Response", response.message)
+        self._chat_complete.assert_awaited_once()
+        history = [entry[1] for entry in icm.export_state()["history"]]
+        self.assertEqual(["hi", "Response"], history)
+
+    async def test_later_inquiries_are_not_cached(self):
+        icm = self._icm()
+        await icm.inquire(self._persona, "Hi!")
+        await icm.inquire(self._persona, "Hi!")
+        self.assertEqual(2, self._chat_complete.await_count)
+
+    async def test_responses_with_data_are_not_cached(self):
+        persona = next(persona for persona in PERSONAS if persona.agent is ArtAgent)
+        self.assertFalse(persona.cache_first_turn)
+        agent = MagicMock(
+            ArtAgent,
+            process_messages=AsyncMock(return_value=AgentResponse("Look", ["aW1n"])),
+        )
+        with patch.object(persona, "cache_first_turn", True), patch.object(
+            self._manager, "_agents", [agent]
+        ):
+            await self._icm().inquire(persona, "Draw a cat")
+            await self._icm().inquire(persona, "Draw a cat")
+        self.assertEqual(2, agent.process_messages.await_count)
+        self.assertEqual(0, self._manager.response_cache.stats()["items"])
+
+    async def test_personas_may_disable_caching(self):
+        with patch.object(self._persona, "cache_first_turn", False):
+            await self._icm().inquire(self._persona, "Hi!")
+            await self._icm().inquire(self._persona, "Hi!")
+        self.assertEqual(2, self._chat_complete.await_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
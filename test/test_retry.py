@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from brain_conductor.errors import (
+    RateLimitError,
+    RecoverableError,
+    RetryBudgetExhaustedError,
+)
+from brain_conductor.retry import (
+    RetryBudget,
+    current_retry_budget,
+    retry,
+    retry_after,
+)
+
+
+class HeadersError(Exception):
+    def __init__(self, headers: dict):
+        super().__init__()
+        self.headers = headers
+
+
+class RetryAfterTestCase(unittest.TestCase):
+    def test_reads_retry_after_headers(self):
+        self.assertEqual(2, retry_after(HeadersError({"retry-after": "2"})))
+        self.assertEqual(0.5, retry_after(HeadersError({"retry-after-ms": "500"})))
+
+    def test_reads_headers_of_wrapped_error(self):
+        self.assertEqual(
+            3, retry_after(RateLimitError(HeadersError({"retry-after": "3"})))
+        )
+        try:
+            try:
+                raise HeadersError({"retry-after": "4"})
+            except HeadersError:
+                raise RateLimitError()
+        except RateLimitError as e:
+            self.assertEqual(4, retry_after(e))
+
+    def test_returns_none_without_hint(self):
+        self.assertIsNone(retry_after(RateLimitError()))
+        self.assertIsNone(retry_after(HeadersError({"retry-after": "soon"})))
+
+
+class RetryTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.retry.asyncio.sleep", AsyncMock())
+        self._sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    async def _retrying(function: AsyncMock, *args, **kwargs):
+        async def call():
+            return await function()
+
+        return await retry(*args, **kwargs)(call)()
+
+    async def test_retries_until_success(self):
+        function = AsyncMock(side_effect=[RecoverableError(), RecoverableError(), 1])
+        self.assertEqual(1, await self._retrying(function, RecoverableError))
+        self.assertEqual(3, function.await_count)
+
+    async def test_delays_have_full_jitter_below_exponential_ceiling(self):
+        function = AsyncMock(side_effect=[RecoverableError()] * 4 + [1])
+        await self._retrying(function, RecoverableError, base=1, cap=4)
+        delays = [call.args[0] for call in self._sleep.await_args_list]
+        for delay, ceiling in zip(delays, [1, 2, 4, 4]):
+            self.assertLessEqual(0, delay)
+            self.assertLessEqual(delay, ceiling)
+
+    async def test_waits_as_long_as_the_server_asks(self):
+        function = AsyncMock(side_effect=[HeadersError({"retry-after": "7"}), 1])
+        await self._retrying(function, HeadersError)
+        self._sleep.assert_awaited_once_with(7.0)
+
+    async def test_does_not_retry_other_errors(self):
+        function = AsyncMock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            await self._retrying(function, RecoverableError)
+        function.assert_awaited_once()
+
+    async def test_fails_fast_when_budget_is_exhausted(self):
+        budget = RetryBudget(5)
+        current_retry_budget.set(budget)
+        function = AsyncMock(side_effect=HeadersError({"retry-after": "10"}))
+        with self.assertRaises(RetryBudgetExhaustedError):
+            await self._retrying(function, HeadersError)
+        function.assert_awaited_once()
+        self._sleep.assert_not_awaited()
+
+    async def test_retries_are_recorded_with_the_budget(self):
+        budget = RetryBudget(60)
+        current_retry_budget.set(budget)
+        function = AsyncMock(side_effect=[HeadersError({"retry-after": "2"}), 1])
+        await self._retrying(function, HeadersError)
+        self.assertEqual(1, budget.retries)
+        self.assertGreaterEqual(budget.wasted_seconds, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import openai
+
+from brain_conductor.agents.llm import openai as openai_llm
+from brain_conductor.agents.llm.router import Backend, Router, RoutingPolicy
+from brain_conductor.breaker import CircuitBreaker
+from brain_conductor.errors import TemporaryAPIError
+
+
+class RouterTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        self._default_breaker = CircuitBreaker("openai")
+        self._router = Router(default_breaker=self._default_breaker, exploration=0)
+        self._openai = Backend("openai", "gpt", "gpt", cost_per_1k_tokens=2)
+        self._azure = Backend(
+            "azure", "gpt", "gpt-35", api_base="https://azure", cost_per_1k_tokens=1
+        )
+        self._router.configure([self._openai, self._azure])
+
+    def test_models_without_backends_go_to_openai(self):
+        backend = self._router.select("other")
+        self.assertEqual(("openai", "other"), (backend.name, backend.model))
+        self.assertIsNone(backend.api_base)
+        self.assertIs(backend, self._router.select("other"))
+
+    def test_backends_get_breakers(self):
+        self.assertIs(self._default_breaker, self._openai.breaker)
+        self.assertEqual("llm-azure", self._azure.breaker.name)
+
+    def test_unhealthy_backends_are_skipped(self):
+        for _ in range(5):
+            with self.assertRaises(TemporaryAPIError):
+                with self._azure.breaker.guard():
+                    raise TemporaryAPIError()
+        for _ in range(10):
+            self.assertIs(self._openai, self._router.select("gpt"))
+
+    def test_fastest_policy(self):
+        self._router.policy = RoutingPolicy.FASTEST
+        self._router.record(self._openai, 1.0, False)
+        self._router.record(self._azure, 3.0, False)
+        self.assertIs(self._openai, self._router.select("gpt"))
+
+    def test_fastest_policy_avoids_failing_backends(self):
+        self._router.policy = RoutingPolicy.FASTEST
+        self._router.record(self._openai, 1.0, False)
+        self._router.record(self._azure, 1.2, False)
+        for _ in range(5):
+            self._router.record(self._openai, 1.0, True)
+        self.assertIs(self._azure, self._router.select("gpt"))
+
+    def test_cheapest_policy_keeps_to_latency_slo(self):
+        self._router.configure([], policy=RoutingPolicy.CHEAPEST, latency_slo=5)
+        self._router.configure([self._openai, self._azure])
+        self._router.record(self._openai, 2.0, False)
+        self._router.record(self._azure, 3.0, False)
+        self.assertIs(self._azure, self._router.select("gpt"))
+        self._router.record(self._openai, 2.0, False)
+        self._router.record(self._azure, 30.0, False)
+        self.assertIs(self._openai, self._router.select("gpt"))
+
+    def test_always_failing_backend_is_avoided_by_every_policy(self):
+        self._router.latency_slo = 5
+        self._router.record(self._openai, 2.0, False)
+        for _ in range(10):
+            self._router.record(self._azure, 0.1, True)
+        for policy in (RoutingPolicy.FASTEST, RoutingPolicy.CHEAPEST):
+            self._router.policy = policy
+            with self.subTest(policy=policy):
+                self.assertIs(self._openai, self._router.select("gpt"))
+        self._router.policy = RoutingPolicy.WEIGHTED
+        with patch("brain_conductor.agents.llm.router.random.choices") as choices:
+            choices.return_value = [self._openai]
+            self._router.select("gpt")
+        openai_weight, azure_weight = choices.call_args.kwargs["weights"]
+        self.assertLessEqual(azure_weight, openai_weight / 5)
+
+    def test_unmeasured_backends_are_only_explored(self):
+        self._router.policy = RoutingPolicy.FASTEST
+        self._router.record(self._openai, 1.0, False)
+        self.assertIs(self._openai, self._router.select("gpt"))
+
+    def test_weighted_policy_follows_weights(self):
+        self._azure.weight = 0
+        self.assertIs(self._openai, self._router.select("gpt"))
+
+    def test_record_tracks_moving_averages(self):
+        self._router.record(self._azure, 1.0, False)
+        self._router.record(self._azure, 2.0, False)
+        self._router.record(self._azure, 5.0, True)
+        stats = self._router.stats()["azure/gpt-35"]
+        # The failure counts as taking the latency SLO of 10 seconds
+        self.assertAlmostEqual(2.96, stats["latency"])
+        self.assertAlmostEqual(0.2, stats["error_rate"])
+        self.assertEqual(3, stats["requests"])
+        self.assertEqual(1, stats["errors"])
+
+    def test_from_config(self):
+        backend = Backend.from_config({"name": "local", "route": "gpt", "weight": 3})
+        self.assertEqual(("gpt", 3.0), (backend.model, backend.weight))
+
+
+class RoutedCompletionTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        self._backend = Backend(
+            "azure", "gpt", "gpt-35", api_base="https://azure", api_key="key"
+        )
+        router = Router(
+            default_breaker=openai_llm.BREAKER,
+            classify=openai_llm.classify_openai_error,
+        )
+        router.configure([self._backend])
+        patcher = patch.object(openai_llm, "ROUTER", router)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addAsyncCleanup(openai_llm.close)
+
+    async def test_request_is_sent_to_backend(self):
+        resource = MagicMock(acreate=AsyncMock())
+        await openai_llm.create_completion(resource, 1, model="gpt")
+        resource.acreate.assert_awaited_once_with(
+            model="gpt-35", api_base="https://azure", api_key="key"
+        )
+        self.assertEqual(1, self._backend.requests)
+
+    async def test_failures_are_recorded(self):
+        resource = MagicMock(
+            acreate=AsyncMock(side_effect=openai.error.ServiceUnavailableError())
+        )
+        with self.assertRaises(openai.error.ServiceUnavailableError):
+            await openai_llm.create_completion(resource, 1, model="gpt")
+        self.assertEqual(1, self._backend.errors)
+        self.assertEqual(1, self._backend.breaker.consecutive_failures)
+
+    async def test_client_errors_count_against_routing_but_not_the_breaker(self):
+        resource = MagicMock(
+            acreate=AsyncMock(side_effect=openai.error.AuthenticationError())
+        )
+        with self.assertRaises(openai.error.AuthenticationError):
+            await openai_llm.create_completion(resource, 1, model="gpt")
+        self.assertEqual(1, self._backend.errors)
+        self.assertEqual(0, self._backend.breaker.consecutive_failures)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from brain_conductor.session_store import MemorySessionStore, SQLiteSessionStore
+
+
+class MemorySessionStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.session_store.time")
+        self._time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._time.monotonic.return_value = 1000.0
+        self._store = MemorySessionStore(ttl=60, max_entries=2)
+
+    async def test_get_returns_state_put(self):
+        self._store.put("id", {"a": 1})
+        self.assertEqual({"a": 1}, await self._store.get("id"))
+
+    async def test_get_returns_none_after_ttl(self):
+        self._store.put("id", {"a": 1})
+        self._time.monotonic.return_value = 1061.0
+        self.assertIsNone(await self._store.get("id"))
+
+    async def test_put_evicts_least_recently_used(self):
+        self._store.put("a", {})
+        self._store.put("b", {})
+        await self._store.get("a")
+        self._store.put("c", {})
+        self.assertIsNone(await self._store.get("b"))
+        self.assertIsNotNone(await self._store.get("a"))
+
+
+class SQLiteSessionStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._path = os.path.join(directory.name, "sessions.db")
+
+    async def asyncSetUp(self):
+        self._store = SQLiteSessionStore(self._path, ttl=60, flush_interval=10)
+
+    async def asyncTearDown(self):
+        await self._store.close()
+
+    async def test_get_returns_pending_state_before_it_is_written(self):
+        self._store.put("id", {"a": 1})
+        self.assertEqual({"a": 1}, await self._store.get("id"))
+
+    async def test_flush_writes_state_shared_with_other_stores(self):
+        self._store.put("id", {"a": 1})
+        self._store.put("id", {"a": 2})
+        await self._store.flush()
+        other = SQLiteSessionStore(self._path, ttl=60)
+        try:
+            self.assertEqual({"a": 2}, await other.get("id"))
+        finally:
+            await other.close()
+
+    async def test_get_returns_none_for_expired_state(self):
+        with patch("brain_conductor.session_store.time") as time:
+            time.time.return_value = 1000.0
+            time.monotonic.return_value = 1000.0
+            self._store.put("id", {"a": 1})
+            await self._store.flush()
+            time.time.return_value = 1061.0
+            self.assertIsNone(await self._store.get("id"))
+
+    async def test_put_writes_early_when_batch_is_full(self):
+        store = SQLiteSessionStore(self._path, ttl=60, flush_interval=10, batch_size=2)
+        try:
+            store.put("a", {})
+            store.put("b", {})
+            await store._writer
+            self.assertEqual({}, await self._store.get("b"))
+        finally:
+            await store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
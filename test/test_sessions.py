@@ -0,0 +1,121 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from brain_conductor.inquiries import InquiryManager
+from brain_conductor.session_store import MemorySessionStore
+from brain_conductor.sessions import ChatSession, SessionManager
+
+
+class ChatSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        """setup"""
+        self._session = ChatSession("id", MagicMock(), replay_frames=2)
+
+    def test_frame_adds_increasing_sequence_numbers(self):
+        first = json.loads(self._session.frame({"type": "a"}))
+        second = json.loads(self._session.frame({"type": "b"}))
+        self.assertEqual([1, 2], [first["seq"], second["seq"]])
+
+    def test_frames_since_returns_only_replayed_frames_after_sequence(self):
+        self._session.frame({"type": "a"}, replay=True)
+        self._session.frame({"type": "b"})
+        third = self._session.frame({"type": "c"}, replay=True)
+        self.assertEqual([third], self._session.frames_since(1))
+
+    def test_catch_up_numbers_frames_after_those_the_client_received(self):
+        self._session.frame({"type": "a"})
+        self._session.catch_up(5)
+        self._session.catch_up(3)
+        self.assertEqual(6, json.loads(self._session.frame({"type": "b"}))["seq"])
+
+    def test_frames_since_is_limited_to_replay_frames(self):
+        for _ in range(3):
+            self._session.frame({"type": "a"}, replay=True)
+        self.assertEqual(2, len(self._session.frames_since(0)))
+
+
+class SessionManagerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.sessions.time")
+        self._time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._time.monotonic.return_value = 1000.0
+        self._manager = SessionManager(MagicMock(InquiryManager), grace_period=60)
+
+    def test_create_returns_sessions_with_unique_ids(self):
+        self.assertNotEqual(self._manager.create().id, self._manager.create().id)
+
+    async def test_resume_returns_attached_session(self):
+        session = self._manager.create()
+        self._manager.attach(session)
+        self.assertIs(session, await self._manager.resume(session.id))
+
+    async def test_resume_returns_detached_session_within_grace_period(self):
+        session = self._manager.create()
+        self._manager.attach(session)
+        self._manager.detach(session)
+        self._time.monotonic.return_value = 1059.0
+        self.assertIs(session, await self._manager.resume(session.id))
+
+    async def test_resume_returns_none_after_grace_period(self):
+        session = self._manager.create()
+        self._manager.attach(session)
+        self._manager.detach(session)
+        self._time.monotonic.return_value = 1061.0
+        self.assertIsNone(await self._manager.resume(session.id))
+        self.assertEqual(0, len(self._manager))
+
+    async def test_expired_session_cancels_its_tasks(self):
+        session = self._manager.create()
+        task = session.tasks.create_task("inquire", asyncio.sleep(10))
+        self._manager.attach(session)
+        self._manager.detach(session)
+        self._time.monotonic.return_value = 1061.0
+        self._manager.create()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_session_with_remaining_connection_does_not_expire(self):
+        session = self._manager.create()
+        self._manager.attach(session)
+        self._manager.attach(session)
+        self._manager.detach(session)
+        self._time.monotonic.return_value = 2000.0
+        self.assertIs(session, await self._manager.resume(session.id))
+
+    async def test_resume_returns_none_for_unknown_session(self):
+        self.assertIsNone(await self._manager.resume("unknown"))
+
+    async def test_resume_hydrates_session_saved_by_another_worker(self):
+        store = MemorySessionStore(ttl=60)
+        other_worker = SessionManager(MagicMock(InquiryManager), store=store)
+        session = other_worker.create()
+        session.frame({"type": "a"}, replay=True)
+        other_worker.save(session)
+        manager = SessionManager(MagicMock(InquiryManager), store=store)
+        resumed = await manager.resume(session.id)
+        self.assertEqual(session.frames_since(0), resumed.frames_since(0))
+        manager._inquiry_manager.create_context.assert_called_once_with(
+            session.icm.export_state.return_value
+        )
+
+    async def test_resume_hydrates_newer_version_saved_by_another_worker(self):
+        store = MemorySessionStore(ttl=60)
+        manager = SessionManager(MagicMock(InquiryManager), store=store)
+        session = manager.create()
+        manager.attach(session)
+        manager.detach(session)
+        other_worker = SessionManager(MagicMock(InquiryManager), store=store)
+        other_session = await other_worker.resume(session.id)
+        other_session.frame({"type": "a"}, replay=True)
+        other_worker.save(other_session)
+        resumed = await manager.resume(session.id)
+        self.assertIsNot(session, resumed)
+        self.assertEqual(1, resumed.last_seq)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.deadline import Deadline
+from brain_conductor.inquiries import InquiryManager
+from brain_conductor.personas import PERSONAS
+from brain_conductor.speculation import Speculator
+
+
+def persona(prompt_name: str):
+    return next(p for p in PERSONAS if p.prompt_name == prompt_name)
+
+
+class SpeculationTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """setup"""
+        patcher = patch("brain_conductor.tokens.get_encoding")
+        get_encoding = patcher.start()
+        self.addCleanup(patcher.stop)
+        get_encoding.return_value = MagicMock(encode=str.split)
+
+        manager = InquiryManager(
+            openai_api_key="API Key",
+            chat_model="gpt-3.5-turbo",
+            text_model="text-davinci-003",
+            personas=PERSONAS,
+            agents=[],
+        )
+        self._icm = manager.__enter__()
+        patcher = patch.object(self._icm, "_openai_chat_complete", AsyncMock())
+        self._chat_complete = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._chat_complete.return_value = "Response"
+        self._speculator = Speculator(enabled=True)
+        self._span = MagicMock()
+
+    def test_guesses_named_persona(self):
+        self.assertIs(persona("Steve"), self._icm.guess_primary("Steve, why?"))
+        self.assertIsNone(self._icm.guess_primary("Steve and Mike, why?"))
+
+    def test_guesses_persona_leading_named_topics(self):
+        self.assertIs(
+            persona("Darby"), self._icm.guess_primary("Any health tips for winter?")
+        )
+        self.assertIsNone(self._icm.guess_primary("Hello there"))
+
+    async def test_speculation_does_not_touch_history(self):
+        await self._icm.speculate(persona("Steve"), "Why is the sky blue?")
+        self.assertEqual([], self._icm.export_state()["history"])
+
+    async def test_hit_keeps_response_and_records_history(self):
+        speculation = self._speculator.start(self._icm, "Steve, why?", Deadline())
+        kept = self._speculator.resolve(speculation, persona("Steve"), self._span)
+        response = await self._speculator.response(kept, self._span)
+        self.assertEqual("Response", response.message)
+        history = [entry[1] for entry in self._icm.export_state()["history"]]
+        self.assertEqual(["Steve, why?", "Response"], history)
+        self.assertEqual(1, self._speculator.stats()["hit_rate"])
+
+    async def test_miss_cancels_speculation(self):
+        async def slow_chat_complete(*args):
+            await asyncio.sleep(10)
+
+        self._chat_complete.side_effect = slow_chat_complete
+        speculation = self._speculator.start(self._icm, "Steve, why?", Deadline())
+        await asyncio.sleep(0)
+        self.assertIsNone(
+            self._speculator.resolve(speculation, persona("Mike"), self._span)
+        )
+        with self.assertRaises(asyncio.CancelledError):
+            await speculation.response()
+        self.assertEqual(1, self._speculator.stats()["misses"])
+        self.assertEqual([], self._icm.export_state()["history"])
+
+    def test_does_not_speculate_on_agent_personas(self):
+        agent_persona = next(p for p in PERSONAS if p.agent)
+        self.assertIsNone(
+            self._speculator.start(self._icm, agent_persona.prompt_name, Deadline())
+        )
+
+    def test_does_not_speculate_when_disabled(self):
+        self._speculator.enabled = False
+        self.assertIsNone(self._speculator.start(self._icm, "Steve?", Deadline()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from brain_conductor.errors import TooManyTokensError
+from brain_conductor.tokens import (
+    CONTEXT_WINDOWS,
+    TokenLedger,
+    context_window,
+    get_ledger,
+    num_tokens_from_string,
+    register_context_window,
+)
+
+
+class ContextWindowRestoreMixin:
+    def setUp(self):
+        """Restore the registered context windows and their caches after tests"""
+        super().setUp()
+        self.addCleanup(get_ledger.cache_clear)
+        self.addCleanup(context_window.cache_clear)
+        patcher = patch.dict(CONTEXT_WINDOWS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ContextWindowTestCase(ContextWindowRestoreMixin, unittest.TestCase):
+    def test_returns_registered_window(self):
+        self.assertEqual(8192, context_window("gpt-4"))
+
+    def test_dated_snapshot_uses_longest_matching_name(self):
+        self.assertEqual(32768, context_window("gpt-4-32k-0613"))
+
+    def test_unknown_model_uses_default(self):
+        self.assertEqual(4096, context_window("unknown-model"))
+
+    def test_register_replaces_cached_window(self):
+        register_context_window("test-model", 100)
+        self.assertEqual(100, context_window("test-model"))
+        register_context_window("test-model", 200)
+        self.assertEqual(200, context_window("test-model"))
+
+
+class EncodingPatchMixin:
+    def setUp(self):
+        """Tokenize on whitespace rather than loading tiktoken encodings"""
+        patcher = patch("brain_conductor.tokens.get_encoding")
+        get_encoding = patcher.start()
+        self.addCleanup(patcher.stop)
+        get_encoding.return_value = MagicMock(encode=str.split)
+        # Shared ledgers remember counts made with the patched encoding
+        self.addCleanup(get_ledger.cache_clear)
+
+
+class TokenLedgerTestCase(EncodingPatchMixin, unittest.TestCase):
+    def test_fit_returns_all_items_when_budget_allows(self):
+        self.assertEqual(3, TokenLedger.fit([10, 20, 30], 60))
+
+    def test_fit_keeps_most_recent_items(self):
+        self.assertEqual(2, TokenLedger.fit([10, 20, 30], 59))
+
+    def test_fit_returns_zero_when_nothing_fits(self):
+        self.assertEqual(0, TokenLedger.fit([10, 20, 30], 29))
+
+    def test_count_message_includes_name_overhead(self):
+        ledger = TokenLedger("gpt-3.5-turbo")
+        without_name = ledger.count_message({"role": "assistant", "content": "Hi"})
+        with_name = ledger.count_message(
+            {"role": "assistant", "name": "Tony", "content": "Hi"}
+        )
+        self.assertEqual(without_name + 1 + TokenLedger.NAME_OVERHEAD, with_name)
+
+    def test_count_message_remembers_keyed_counts(self):
+        ledger = TokenLedger("gpt-3.5-turbo")
+        expected = ledger.count_message({"role": "system", "content": "Hi"}, key="k")
+        actual = ledger.count_message({"role": "system", "content": "Longer"}, key="k")
+        self.assertEqual(expected, actual)
+
+    def test_prompt_budget_reserves_completion_tokens(self):
+        ledger = TokenLedger("gpt-4", completion_tokens=100)
+        self.assertEqual(
+            8192 - 100 - TokenLedger.REPLY_OVERHEAD - 50, ledger.prompt_budget(50)
+        )
+
+    def test_get_ledger_returns_one_ledger_per_model(self):
+        self.assertIs(get_ledger("gpt-4"), get_ledger("gpt-4"))
+
+
+class NumTokensFromStringTestCase(
+    ContextWindowRestoreMixin, EncodingPatchMixin, unittest.TestCase
+):
+    def test_raises_too_many_tokens_when_over_context_window(self):
+        register_context_window("tiny-model", 2)
+        with self.assertRaises(TooManyTokensError):
+            num_tokens_from_string("one two three four", "tiny-model")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from brain_conductor.agents import Agent
+from brain_conductor.agents.toolkits import ToolKit, tool
+
+
+class EchoKit(ToolKit):
+    prefix = "echo"
+
+    @tool(args=["text"], description="Echoes the text", max_age=5)
+    async def echo(self, text):
+        return text
+
+    async def helper(self):
+        return "not a tool"
+
+
+class LoudEchoKit(EchoKit):
+    @tool(args=["text"], description="Echoes the text loudly")
+    async def shout(self, text):
+        return text.upper()
+
+
+class ClockKit(ToolKit):
+    prefix = "clock"
+
+    @tool(args=[], description="Tells the time", eager=True)
+    async def get_time(self):
+        return "It is noon"
+
+
+class ToolKitTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_registered_methods_are_tools(self):
+        tools = EchoKit().tools()
+        self.assertEqual(["echo"], list(tools))
+        self.assertEqual(5, tools["echo"].max_age)
+        self.assertEqual("hi", await tools["echo"]("hi"))
+
+    def test_subclasses_inherit_tools(self):
+        self.assertEqual(["echo", "shout"], list(LoudEchoKit().tools()))
+
+    def test_eager_tools_take_no_arguments(self):
+        with self.assertRaises(ValueError):
+            tool(args=["text"], description="Echoes the text", eager=True)
+
+    def test_eager_tool_results_are_not_reused(self):
+        with self.assertRaises(ValueError):
+            tool(args=[], description="Tells the time", max_age=60, eager=True)
+
+
+class AgentToolTableTestCase(unittest.IsolatedAsyncioTestCase):
+    def test_catalog_lists_tools(self):
+        agent = Agent([LoudEchoKit()])
+        self.assertIn("echo.echo : False : text", agent.toolkit_query_template.template)
+        self.assertIn(
+            "echo.shout : False : text", agent.toolkit_query_template.template
+        )
+        self.assertNotIn("helper", agent.toolkit_query_template.template)
+
+    def test_tools_may_not_be_registered_twice(self):
+        with self.assertRaises(ValueError):
+            Agent([EchoKit(), EchoKit()])
+
+    async def test_unknown_methods_are_ignored(self):
+        agent = Agent([EchoKit()])
+        agent.llm = MagicMock(
+            chat_complete=AsyncMock(
+                side_effect=['[{"method": "echo.helper", "args": []}]', "Done"]
+            )
+        )
+        response = await agent.process_messages([])
+        self.assertEqual("Done", response.response)
+        data = agent.llm.chat_complete.await_args_list[1].args[0][-1]["content"]
+        self.assertIn("You did not retrieve any data", data)
+
+
+class EagerToolTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_eager_tools_are_called_before_planning(self):
+        agent = Agent([EchoKit(), ClockKit()])
+        self.assertNotIn("clock.get_time", agent.toolkit_query_template.template)
+        agent.llm = MagicMock(chat_complete=AsyncMock(side_effect=["[]", "Done"]))
+        await agent.process_messages([{"role": "user", "content": "Lunch?"}])
+        planning, response = agent.llm.chat_complete.await_args_list
+        self.assertIn("It is noon", planning.args[0][-2]["content"])
+        self.assertIn("It is noon", response.args[0][-1]["content"])
+
+    async def test_failed_eager_tools_are_left_out(self):
+        with patch.object(ClockKit, "get_time", AsyncMock(side_effect=OSError())):
+            agent = Agent([ClockKit()])
+            agent.llm = MagicMock(chat_complete=AsyncMock(side_effect=["[]", "Done"]))
+            self.assertEqual("Done", (await agent.process_messages([])).response)
+        planning = agent.llm.chat_complete.await_args_list[0]
+        self.assertEqual(1, len(planning.args[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()